@@ -0,0 +1,59 @@
+# Microbenchmark for deck creation. Compares the original create_card, which scanned sources/cards.csv once per card,
+# with the catalog's prototype cloning, for every preset deck in sources/.
+#
+# Run from the repository root: python -m benchmarks.bench_deck_hydration
+import csv
+import glob
+import time
+
+import src.card_effects as effects
+from src.card import Monster, Spell, create_deck_from_array, create_list_from_preset, card_catalog
+
+
+def create_card_from_csv_scan(card_name: str):
+    """The original implementation of create_card, kept as the baseline.
+    """
+    with open('sources/cards.csv', 'r') as csvfile:
+        reader = csv.reader(csvfile)
+        for row in reader:
+            if row[0].lower().replace(" ", "") == card_name.lower().replace(" ", ""):
+                if row[1] == "Monster":
+                    return Monster(name=row[0], attribute=row[2], monster_type=row[3], level=int(row[4]),
+                                   attack_points=int(row[5]), defense_points=int(row[6]), description=row[7])
+                elif row[1] == "Spell":
+                    def convert_type(arg):
+                        return int(arg) if arg.isnumeric() or arg.lstrip('-').isnumeric() else arg
+
+                    return Spell(name=row[0], icon=row[2], description=row[3], effect=getattr(effects, row[4].strip()),
+                                 effect_args=[convert_type(arg) for arg in row[5:]])
+        return None
+
+
+def decks_per_second(create_deck, card_names: list, min_time=0.5) -> float:
+    """
+    Returns: how many decks create_deck builds per second, measured over at least min_time seconds.
+    """
+    create_deck(card_names)
+    decks = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < min_time:
+        for _ in range(10):
+            create_deck(card_names)
+        decks += 10
+        elapsed = time.perf_counter() - start
+    return decks / elapsed
+
+
+def main():
+    card_catalog.load()
+    print("%-20s %6s %16s %16s %9s" % ("preset", "cards", "csv scan/s", "prototype/s", "speedup"))
+    for preset in sorted(glob.glob("sources/preset*")):
+        card_names = create_list_from_preset(preset)
+        before = decks_per_second(lambda names: [create_card_from_csv_scan(name) for name in names], card_names)
+        after = decks_per_second(create_deck_from_array, card_names)
+        print("%-20s %6d %16.0f %16.0f %8.1fx" % (preset, len(card_names), before, after, after / before))
+
+
+if __name__ == "__main__":
+    main()
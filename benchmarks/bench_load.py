@@ -0,0 +1,287 @@
+# Load generator for YugiohServer. Starts a server with initialize_server (or targets one that is already running) and
+# launches headless bot clients speaking the binary protocol. Bots are paired by the server's matchmaking and play
+# random legal moves until one player is out of life points or the turn limit is reached, then queue for a new game.
+# Reports moves per second, games per minute and the p50/p99 latency between sending a move and receiving its reply.
+# Bots refused by an overloaded server (see src.admission) wait for the retry-after they are given; they are counted in
+# "refused".
+#
+# Run from the repository root: python -m benchmarks.bench_load --bots 1000 --duration 60
+# With --batch, bots send each turn as one update_batch request (latency is then per turn).
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import multiprocessing
+import random
+import time
+from typing import Optional
+
+import websockets
+
+from src.card import MonsterTemplate, card_catalog, create_list_from_preset
+from src.game import GameStatus
+from src.protocol import BINARY_SUBPROTOCOL, decode_snapshot, encode_request, is_snapshot_frame
+from src.state_sync import HIDDEN_MONSTER
+
+SERVER_URL = "ws://localhost:5555/"
+MAX_TURNS = 30
+HAND_SIZE = 5
+RECEIVE_TIMEOUT = 30
+
+
+class LoadStats:
+    """Counters shared by the bots of a run.
+    """
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.moves = 0
+        self.games = 0
+        self.errors = 0
+        self.disconnects = 0
+        self.refused = 0
+
+    def report(self, seconds: float) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+
+        return {"seconds": round(seconds, 1), "moves": self.moves, "moves_per_second": round(self.moves / seconds, 1),
+                "games": self.games, "games_per_minute": round(self.games * 60 / seconds, 1),
+                "p50_ms": percentile(0.5), "p99_ms": percentile(0.99), "errors": self.errors,
+                "disconnects": self.disconnects, "refused": self.refused}
+
+
+def _card_name(card) -> Optional[str]:
+    if card is None or card == HIDDEN_MONSTER:
+        return None
+    return card if isinstance(card, str) else card["name"]
+
+
+def _monster_level(card) -> Optional[int]:
+    """
+    Returns: the level of a card of a snapshot, or None if it is not a monster.
+    """
+    name = _card_name(card)
+    template = card_catalog.get_template(name) if name is not None else None
+    return template.level if isinstance(template, MonsterTemplate) else None
+
+
+class Bot:
+    """A headless client playing random legal moves.
+    """
+    def __init__(self, url: str, deck: list, stats: LoadStats, rng: random.Random, batch: bool = False,
+                 max_turns: int = MAX_TURNS):
+        self.url = url
+        self.deck = deck
+        self.stats = stats
+        self.rng = rng
+        self.batch = batch
+        self.max_turns = max_turns
+        self.websocket = None
+        self.session_id = 0
+        self.seat = 0
+        self.state: Optional[dict] = None
+
+    async def receive(self, timeout: float = RECEIVE_TIMEOUT) -> Optional[dict]:
+        """Receives a frame. Snapshots are kept in self.state.
+
+        Returns: None for a snapshot, or the JSON message of other frames
+        """
+        frame = await asyncio.wait_for(self.websocket.recv(), timeout)
+        if is_snapshot_frame(frame):
+            self.state = decode_snapshot(frame)
+            return None
+        message = json.loads(frame)
+        if message.get("type") == "error" and "retry_after" not in message:
+            self.stats.errors += 1
+        return message
+
+    async def request(self, request: dict, moves: int = 1):
+        """Sends a request and waits for the snapshot answering it, or an error. Moves are timed.
+        """
+        request["session_id"] = self.session_id
+        start = time.perf_counter()
+        await self.websocket.send(encode_request(request))
+        while True:
+            message = await self.receive()
+            if message is None or message.get("type") == "error":
+                break
+        if request["operation"] in ("update", "update_batch"):
+            self.stats.latencies.append(time.perf_counter() - start)
+            self.stats.moves += moves
+
+    def me(self) -> dict:
+        return self.state["players"][self.seat]
+
+    def opponent(self) -> dict:
+        return self.state["players"][1 - self.seat]
+
+    def game_over(self) -> bool:
+        return self.state["game_status"] == GameStatus.ENDED or any(
+            player["life_points"] <= 0 for player in self.state["players"])
+
+    def plan_summon(self) -> list:
+        """
+        Returns: a random summon or set of a monster of level 4 or less, or a flip summon, if one is possible.
+        """
+        me = self.me()
+        choices = []
+        if None in me["monster_field"]:
+            for hand_idx, card in enumerate(me["hand"]):
+                level = _monster_level(card)
+                if level is not None and level <= 4:
+                    choices += [{"move": "normal_summon", "args": [hand_idx]}, {"move": "normal_set", "args": [hand_idx]}]
+        for field_idx, card in enumerate(me["monster_field"]):
+            if isinstance(card, dict) and card.get("face_pos") == "down":
+                choices.append({"move": "flip_summon", "args": [field_idx]})
+        return [self.rng.choice(choices)] if choices else []
+
+    def plan_attacks(self) -> list:
+        """
+        Returns: an attack on the opponent by every monster that can attack if the opponent's field is empty, or else
+            an attack by one of them on a random monster of the opponent, whose outcome is not known in advance.
+        """
+        attackers = [field_idx for field_idx, card in enumerate(self.me()["monster_field"])
+                     if isinstance(card, dict) and card.get("can_attack") and card.get("battle_pos", "atk") == "atk"]
+        targets = [idx for idx, card in enumerate(self.opponent()["monster_field"]) if card is not None]
+        if not attackers:
+            return []
+        if targets:
+            return [{"move": "attack_monster", "args": [self.rng.choice(attackers), self.rng.choice(targets)]}]
+        return [{"move": "attack_player", "args": [field_idx]} for field_idx in attackers]
+
+    async def play_turn(self):
+        draw = [{"move": "draw_card", "player": self.seat, "args": [1]}] if self.me()["deck"] else []
+        if self.batch:
+            moves = draw + self.plan_summon() + self.plan_attacks() + [{"move": "change_turn"}]
+            await self.request({"operation": "update_batch", "moves": moves}, len(moves))
+            if self.state["current_player"] == self.seat and not self.game_over():
+                await self.request({"operation": "update", "move": "change_turn"})  # the batch failed
+            return
+        for move in draw + self.plan_summon():
+            await self.request(dict(move, operation="update"))
+        attacks = self.plan_attacks()
+        while attacks and not self.game_over():
+            await self.request(dict(attacks[0], operation="update"))
+            attacks = self.plan_attacks()
+        if not self.game_over():
+            await self.request({"operation": "update", "move": "change_turn"})
+
+    async def wait_for_turn(self):
+        while self.state["current_player"] != self.seat and not self.game_over():
+            await self.receive()
+
+    async def play_game(self, deadline: float) -> bool:
+        """Joins the matchmaking queue and plays one game. The player who wins, or who reaches the turn limit, ends
+        the game with a delete request.
+
+        A bot refused by an overloaded server waits for the retry-after it was given.
+
+        Returns: False if no opponent was found before the deadline
+        """
+        async with websockets.connect(self.url, subprotocols=[BINARY_SUBPROTOCOL], max_size=None) as websocket:
+            self.websocket = websocket
+            self.state = None
+            try:
+                match = await self.receive(max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                return False
+            if "retry_after" in match:
+                self.stats.refused += 1
+                await asyncio.sleep(min(match["retry_after"], max(0.0, deadline - time.monotonic())))
+                return True
+            self.session_id, self.seat = match["session_id"], match["player"]
+            await self.request({"operation": "create", "player_name": "Bot %d" % self.seat, "deck": self.deck,
+                                "player_place": self.seat})
+            # The opponent's create is the only move broadcast while both players play, so a reply is never taken
+            # for a broadcast once both players have been seen
+            while len(self.state["players"]) < 2:
+                await self.receive()
+            await self.request({"operation": "update", "move": "draw_card", "player": self.seat, "args": [HAND_SIZE]})
+            for _ in range(self.max_turns):
+                await self.wait_for_turn()
+                if self.game_over():
+                    return True  # the opponent won
+                await self.play_turn()
+                if self.game_over():
+                    break
+            else:
+                await self.wait_for_turn()  # so that the opponent is not playing when the game ends
+                if self.game_over():
+                    return True
+            await self.request({"operation": "delete"})
+            self.stats.games += 1
+            return True
+
+    async def run(self, deadline: float):
+        while time.monotonic() < deadline:
+            try:
+                if not await self.play_game(deadline):
+                    return
+            except (websockets.exceptions.ConnectionClosed, asyncio.TimeoutError):
+                self.stats.disconnects += 1
+
+
+def run_server(shards: int, log: bool):
+    """Runs the server in this process, as start_server.py does.
+    """
+    if not log:
+        logging.disable(logging.INFO)  # the server logs every request
+    if shards > 1:
+        from src.shards import initialize_sharded_server
+        initialize_sharded_server(shards)
+    else:
+        from src.server import initialize_server
+        initialize_server()
+
+
+async def generate_load(url: str, bots: int, duration: float, batch: bool, seed: int,
+                        max_turns: int = MAX_TURNS) -> dict:
+    card_catalog.load()
+    # Presets with cards missing from the catalog cannot be sent in binary requests
+    decks = [deck for deck in map(create_list_from_preset, sorted(glob.glob("sources/preset*")))
+             if all(card_catalog.card_id(name) >= 0 for name in deck)]
+    stats = LoadStats()
+    rng = random.Random(seed)
+    start = time.monotonic()
+    deadline = start + duration
+    await asyncio.gather(*(Bot(url, rng.choice(decks), stats, random.Random(rng.random()), batch, max_turns)
+                           .run(deadline) for _ in range(bots)))
+    return stats.report(time.monotonic() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load generator for YugiohServer: bot clients play random games over the binary protocol."
+    )
+    parser.add_argument("--bots", type=int, default=200, help="number of bot clients (even)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds after which bots stop starting games")
+    parser.add_argument("--url", help="URL of a running server. A local server is started if not given")
+    parser.add_argument("--shards", type=int, default=1, help="shards of the local server")
+    parser.add_argument("--turns", type=int, default=MAX_TURNS, help="turns of each player after which a game ends")
+    parser.add_argument("--batch", action="store_true", help="send each turn as one update_batch request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log", action="store_true", help="keep the INFO logs of the local server")
+    args = parser.parse_args()
+    server = None
+    if args.url is None:
+        server = multiprocessing.Process(target=run_server, args=(args.shards, args.log))
+        server.start()
+        time.sleep(1)
+    try:
+        report = asyncio.run(generate_load(args.url or SERVER_URL, args.bots, args.duration, args.batch, args.seed,
+                                           args.turns))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+    for key, value in report.items():
+        print("%-18s %s" % (key, value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# Benchmark for rebuilding a GameController from a full state frame on the client. Compares pickle.loads, which
+# clients used before pickles were taken off the wire, with the restricted decoders of JSON state frames and binary
+# snapshot frames.
+#
+# Run from the repository root: python -m benchmarks.bench_state_decoding
+import pickle
+
+from benchmarks.bench_state_encoding import create_benchmark_game, ops_per_second
+from src.protocol import decode_snapshot, encode_snapshot
+from src.state_codec import decode_state, encode_state
+from src.state_sync import game_from_snapshot, snapshot_game
+
+
+def main():
+    game = create_benchmark_game().game
+    snapshot = snapshot_game(game)
+    frames = [("pickle", pickle.dumps(game), pickle.loads),
+              ("state frame", encode_state(snapshot), decode_state),
+              ("binary snapshot", encode_snapshot(snapshot), lambda frame: game_from_snapshot(decode_snapshot(frame)))]
+    print("%-20s %12s %14s" % ("decoder", "ops/sec", "bytes/state"))
+    for name, frame, decode in frames:
+        print("%-20s %12.0f %14d" % (name, ops_per_second(decode, frame), len(frame)))
+
+
+if __name__ == "__main__":
+    main()
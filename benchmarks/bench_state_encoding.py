@@ -0,0 +1,75 @@
+# Benchmark for encoding the full JSON state of a game. Compares the original path, which serialized every object
+# through its __dict__, parsed the result back with to_dict and dumped it again in YugiohServer.play, with
+# encode_game, which writes the JSON bytes in one walk. The binary snapshot frame sent to clients that negotiate the
+# binary subprotocol, and pickle, used by legacy command line clients, are shown for reference.
+#
+# Run from the repository root: python -m benchmarks.bench_state_encoding
+import json
+import pickle
+import time
+
+from src.card import Card, Spell, create_list_from_preset
+from src.protocol import encode_snapshot
+from src.state_encoder import encode_game
+from src.state_sync import snapshot_game
+from src.yugioh import Yugioh
+
+
+def encode_through_dict_round_trip(game) -> bytes:
+    """The original encoding path, kept as the baseline.
+    """
+    json_dict = json.loads(json.dumps(game, default=lambda o: o.to_dict() if isinstance(o, (Card, Spell))
+                                      else o.__dict__))
+    return json.dumps(json_dict).encode("utf-8")
+
+
+def encode_binary_snapshot(game) -> bytes:
+    """Binary snapshot frame of a game, including taking the snapshot (which Yugioh caches per version).
+    """
+    return encode_snapshot(snapshot_game(game))
+
+
+def create_benchmark_game() -> Yugioh:
+    """
+    Returns: a game between two players using preset decks, a few moves in.
+    """
+    yugioh_game = Yugioh()
+    yugioh_game.create_game({"player_name": "Yugi", "deck": create_list_from_preset("sources/preset3"),
+                             "session_id": 1})
+    yugioh_game.create_game({"player_name": "Kaiba", "deck": create_list_from_preset("sources/preset2"),
+                             "session_id": 1})
+    for player in range(2):
+        yugioh_game.update_game({"session_id": 1, "player": player, "move": "draw_card", "args": [5]})
+    yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_summon", "args": [0]})
+    yugioh_game.update_game({"session_id": 1, "player": 0, "move": "change_turn", "args": []})
+    yugioh_game.update_game({"session_id": 1, "player": 1, "move": "normal_summon", "args": [0]})
+    return yugioh_game
+
+
+def ops_per_second(encode, game, min_time=0.5) -> float:
+    """
+    Returns: how many times encode(game) runs per second, measured over at least min_time seconds.
+    """
+    encode(game)
+    ops = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < min_time:
+        for _ in range(20):
+            encode(game)
+        ops += 20
+        elapsed = time.perf_counter() - start
+    return ops / elapsed
+
+
+def main():
+    game = create_benchmark_game().game
+    encoders = [("to_dict round trip", encode_through_dict_round_trip), ("encode_game", encode_game),
+                ("binary snapshot", encode_binary_snapshot), ("pickle", pickle.dumps)]
+    print("%-20s %12s %14s" % ("encoder", "ops/sec", "bytes/state"))
+    for name, encode in encoders:
+        print("%-20s %12.0f %14d" % (name, ops_per_second(encode, game), len(encode(game))))
+
+
+if __name__ == "__main__":
+    main()
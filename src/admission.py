@@ -0,0 +1,156 @@
+# Admission control of YugiohServer. The server samples how late its event loop runs and how many commands wait in the
+# deepest session inbox. While either is past its limit the server is overloaded: it refuses new players and spectators
+# with a retry-after, and only serves the games in progress and the players reconnecting to them. The loop lag samples
+# are also the ones recorded in the server's metrics.
+#
+# Each connection also has a token bucket: a client sending requests faster than the bucket's rate, once its burst is
+# spent, has its next request read only after the bucket refills, so the flood waits in its own socket.
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+MAX_LOOP_LAG = 0.1
+MAX_INBOX_DEPTH = 16
+RETRY_AFTER = 5
+RATE = 50
+BURST = 100
+SAMPLE_INTERVAL = 0.25
+MAX_LOOP_LAG_VARIABLE = "YUGIOH_MAX_LOOP_LAG"
+MAX_INBOX_DEPTH_VARIABLE = "YUGIOH_MAX_INBOX_DEPTH"
+RETRY_AFTER_VARIABLE = "YUGIOH_RETRY_AFTER"
+RATE_VARIABLE = "YUGIOH_REQUEST_RATE"
+BURST_VARIABLE = "YUGIOH_REQUEST_BURST"
+
+
+@dataclass(frozen=True)
+class AdmissionLimits:
+    """Thresholds past which the server sheds load.
+    """
+    max_loop_lag: float = MAX_LOOP_LAG  # seconds the event loop may run late before new players are refused
+    max_inbox_depth: int = MAX_INBOX_DEPTH  # commands waiting in a session inbox before new players are refused
+    retry_after: float = RETRY_AFTER  # least seconds refused clients are told to wait before trying again
+    rate: float = RATE  # requests per second a connection may send, or 0 for no limit
+    burst: int = BURST  # requests a connection may send at once
+
+
+def admission_limits_from_environment() -> AdmissionLimits:
+    """
+    Returns: the AdmissionLimits set by the environment: YUGIOH_MAX_LOOP_LAG and YUGIOH_RETRY_AFTER in seconds,
+        YUGIOH_MAX_INBOX_DEPTH in commands, YUGIOH_REQUEST_RATE in requests per second (0 for no limit) and
+        YUGIOH_REQUEST_BURST in requests.
+    """
+    return AdmissionLimits(float(os.environ.get(MAX_LOOP_LAG_VARIABLE, MAX_LOOP_LAG)),
+                           int(os.environ.get(MAX_INBOX_DEPTH_VARIABLE, MAX_INBOX_DEPTH)),
+                           float(os.environ.get(RETRY_AFTER_VARIABLE, RETRY_AFTER)),
+                           float(os.environ.get(RATE_VARIABLE, RATE)),
+                           int(os.environ.get(BURST_VARIABLE, BURST)))
+
+
+class TokenBucket:
+    """Limits the rate of the requests of a connection, allowing bursts.
+    """
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate: tokens added per second
+            burst: maximum number of tokens
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def delay(self, now: float = None) -> float:
+        """Takes a token for a request, running into debt if there is none.
+
+        Args:
+            now: the current time.monotonic()
+
+        Returns: the seconds to wait before handling the request, 0 if a token was available
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class AdmissionController:
+    """Decides whether the server takes new players, from the event loop lag and the depth of the session inboxes.
+    """
+    def __init__(self, limits: AdmissionLimits, inbox_depth: Callable[[], int], interval: float = SAMPLE_INTERVAL,
+                 observe_loop_lag: Callable[[float], None] = None):
+        """
+        Args:
+            limits: the thresholds of the server
+            inbox_depth: returns the number of commands waiting in the deepest session inbox
+            interval: seconds between two samples
+            observe_loop_lag: called with each sample of the event loop lag, such as Metrics.loop_lag.observe
+        """
+        self.limits = limits
+        self.inbox_depth = inbox_depth
+        self.interval = interval
+        self.observe_loop_lag = observe_loop_lag
+        self.loop_lag = 0.0
+        self.depth = 0
+        self.overloaded = False
+        self.refused = 0
+        self.due: Optional[float] = None  # loop time at which the next sample is due
+
+    def update(self, loop_lag: float, depth: int):
+        """Records a sample of the event loop lag and of the deepest inbox.
+        """
+        self.loop_lag = loop_lag
+        self.depth = depth
+        overloaded = loop_lag > self.limits.max_loop_lag or depth > self.limits.max_inbox_depth
+        if overloaded != self.overloaded:
+            if overloaded:
+                logging.warning("Overloaded, refusing new players: loop lag %.3fs, inbox depth %d", loop_lag, depth)
+            else:
+                logging.info("No longer overloaded after refusing %d clients", self.refused)
+            self.overloaded = overloaded
+
+    def admit(self, now: float = None) -> bool:
+        """
+        Args:
+            now: the current loop time
+
+        Returns: whether a new player or spectator is accepted. A sample overdue by more than the maximum loop lag
+            means the loop is lagging now, so a burst of clients is refused before the sample is taken. Refused clients
+            are counted in refused.
+        """
+        if self.due is not None:
+            now = asyncio.get_running_loop().time() if now is None else now
+            if now - self.due > self.limits.max_loop_lag:
+                self.update(now - self.due, self.depth)
+        if self.overloaded:
+            self.refused += 1
+        return not self.overloaded
+
+    def retry_after(self) -> float:
+        """
+        Returns: the seconds a refused client is told to wait, between retry_after and twice that, so that the clients
+            refused by a burst do not all come back at once.
+        """
+        return round(self.limits.retry_after * random.uniform(1, 2), 1)
+
+    def bucket(self) -> Optional[TokenBucket]:
+        """
+        Returns: a token bucket for a new connection, or None if the request rate is not limited.
+        """
+        return TokenBucket(self.limits.rate, self.limits.burst) if self.limits.rate > 0 else None
+
+    async def run(self):
+        """Samples the event loop lag and the inbox depth every interval seconds, forever.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            self.due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            loop_lag = max(0.0, loop.time() - self.due)
+            self.update(loop_lag, self.inbox_depth())
+            if self.observe_loop_lag is not None:
+                self.observe_loop_lag(loop_lag)
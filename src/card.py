@@ -1,12 +1,55 @@
 import csv
+import inspect
 import src.card_effects as effects
+from src.catalog_compiler import load_compiled_catalog, normalize_card_name
+from dataclasses import dataclass
 from enum import Enum, unique
-from typing import Callable
+from typing import Callable, Optional
+
+
+@dataclass(frozen=True)
+class CardTemplate:
+    """The immutable part of a Yu-Gi-Oh! Card, shared by every copy of that card.
+
+    Templates are never copied: a game only keeps the state that changes during play on each card instance.
+    """
+    name: str
+    description: str
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+@dataclass(frozen=True)
+class MonsterTemplate(CardTemplate):
+    """The immutable part of a Yu-Gi-Oh! Monster Card.
+    """
+    attribute: str
+    monster_type: str
+    level: int
+    attack_points: int
+    defense_points: int
+
+
+@dataclass(frozen=True)
+class SpellTemplate(CardTemplate):
+    """The immutable part of a Yu-Gi-Oh! Spell Card.
+    """
+    icon: str
+    speed: int
+    effect: Callable
+    effect_args: tuple
+    required_monster_type: Optional[str]
 
 
 class Card:
     """A class representing a Yu-Gi-Oh! Card.
     """
+    __slots__ = ('template',)
+
     def __init__(self, name: str, description: str):
         """Initializes the generic fields of a Yu-Gi-Oh! Card.
 
@@ -14,8 +57,15 @@ class Card:
             name: A string containing the name of the card.
             description: A string containing a Yu-Gi-Oh! card description.
         """
-        self.name = name
-        self.description = description
+        self.template = CardTemplate(name, description)
+
+    @property
+    def name(self) -> str:
+        return self.template.name
+
+    @property
+    def description(self) -> str:
+        return self.template.description
 
     def display_card(self) -> dict:
         """Gets the information for the current card.
@@ -26,6 +76,12 @@ class Card:
         """
         return {"name": self.name, "description": self.description}
 
+    def to_dict(self) -> dict:
+        """
+        Returns: dictionary containing the fields of the card, shared and per-instance alike.
+        """
+        return self.display_card()
+
 
 class Monster(Card):
     """A class representing a Yu-Gi-Oh! Monster Card.
@@ -37,6 +93,8 @@ class Monster(Card):
     ATK = 'atk'
     DEF = 'def'
 
+    __slots__ = ('attack_points', 'defense_points', 'face_pos', 'battle_pos', 'equipped_spell', 'can_attack')
+
     def __init__(self, name: str, description: str, attribute: str, monster_type: str,
                  level: int, attack_points: int, defense_points: int):
         """Initializes the Monster class with the specified parameters.
@@ -51,19 +109,68 @@ class Monster(Card):
             defense_points: An integer defining the monster's defense points.
             can_attack: boolean on whether a monster can attack
         """
-        super().__init__(name, description)
-        self.attribute = attribute
-        self.base_atk = attack_points
-        self.base_def = defense_points
-        self.attack_points = attack_points
-        self.defense_points = defense_points
-        self.level = level
-        self.monster_type = monster_type
+        self._init_from_template(MonsterTemplate(name, description, attribute, monster_type, level, attack_points,
+                                                 defense_points))
+
+    @classmethod
+    def from_template(cls, template: MonsterTemplate) -> 'Monster':
+        """Creates a new copy of a monster card that shares the specified template.
+
+        Args:
+            template: The immutable fields of the monster card.
+
+        Returns: a Monster in its starting state.
+        """
+        monster = cls.__new__(cls)
+        monster._init_from_template(template)
+        return monster
+
+    def _init_from_template(self, template: MonsterTemplate):
+        self.template = template
+        self.attack_points = template.attack_points
+        self.defense_points = template.defense_points
         self.face_pos = Monster.FACE_UP
         self.battle_pos = Monster.ATK
         self.equipped_spell = None
         self.can_attack = False
 
+    def clone(self) -> 'Monster':
+        """Creates a shallow copy of the monster that shares its template.
+
+        Returns: a Monster with the same state as this one.
+        """
+        monster = Monster.__new__(Monster)
+        monster.template = self.template
+        monster.attack_points = self.attack_points
+        monster.defense_points = self.defense_points
+        monster.face_pos = self.face_pos
+        monster.battle_pos = self.battle_pos
+        monster.equipped_spell = self.equipped_spell
+        monster.can_attack = self.can_attack
+        return monster
+
+    __copy__ = clone
+
+    @property
+    def attribute(self) -> str:
+        return self.template.attribute
+
+    @property
+    def monster_type(self) -> str:
+        return self.template.monster_type
+
+    @property
+    def level(self) -> int:
+        return self.template.level
+
+    @property
+    def base_atk(self) -> int:
+        return self.template.attack_points
+
+    @property
+    def base_def(self) -> int:
+        return self.template.defense_points
+
     def __eq__(self, other_monster):
         """Determines whether two monster cards are equal.
 
@@ -84,6 +191,16 @@ class Monster(Card):
                     self.face_pos, self.battle_pos)
         return str_repr
 
+    def to_dict(self) -> dict:
+        """
+        Returns: dictionary containing the fields of the monster, shared and per-instance alike.
+        """
+        return {"name": self.name, "description": self.description, "attribute": self.attribute,
+                "base_atk": self.base_atk, "base_def": self.base_def, "attack_points": self.attack_points,
+                "defense_points": self.defense_points, "level": self.level, "monster_type": self.monster_type,
+                "face_pos": self.face_pos, "battle_pos": self.battle_pos, "equipped_spell": self.equipped_spell,
+                "can_attack": self.can_attack}
+
     def reset_stats(self):
         self.attack_points, self.defense_points = self.base_atk, self.base_def
 
@@ -107,6 +224,8 @@ class Spell:
         RITUAL = 'ritual'
         QUICK_PLAY = 'quick play'
 
+    __slots__ = ('template', 'position', 'equipped_monster')
+
     def __init__(self, name: str, icon: str, description: str, effect: Callable, effect_args: list):
         """Initializes the Spell class with the specified parameters.
 
@@ -117,16 +236,81 @@ class Spell:
             effect: A function that performs the effect of the spell.
             effect_args: Arguments for `effect` function.
         """
-        self.name = name
-        self.icon = Spell.Icon[icon.upper()]
-        self.description = description
-        self.speed = 2 if self.icon == Spell.Icon.QUICK_PLAY else 1
+        self._init_from_template(Spell.create_template(name, icon, description, effect, effect_args))
+
+    @staticmethod
+    def create_template(name: str, icon: str, description: str, effect: Callable,
+                        effect_args: list) -> SpellTemplate:
+        """Creates the shared template of a spell card. Takes the same arguments as the Spell constructor.
+
+        Returns: the SpellTemplate for the spell card.
+        """
+        icon = Spell.Icon[icon.upper()]
+        is_equip = icon == Spell.Icon.EQUIP
+        return SpellTemplate(name=name, description=description, icon=icon,
+                             speed=2 if icon == Spell.Icon.QUICK_PLAY else 1, effect=effect,
+                             effect_args=tuple(effect_args[:-1] if is_equip else effect_args),
+                             required_monster_type=effect_args[-1] if is_equip else None)
+
+    @classmethod
+    def from_template(cls, template: SpellTemplate) -> 'Spell':
+        """Creates a new copy of a spell card that shares the specified template.
+
+        Args:
+            template: The immutable fields of the spell card.
+
+        Returns: a Spell in its starting state.
+        """
+        spell = cls.__new__(cls)
+        spell._init_from_template(template)
+        return spell
+
+    def _init_from_template(self, template: SpellTemplate):
+        self.template = template
         self.position = Spell.Position.FACE_UP
-        self.effect = effect
-        self.effect_args = effect_args[:-1] if self.icon == Spell.Icon.EQUIP else effect_args
-        self.required_monster_type = effect_args[-1] if self.icon == Spell.Icon.EQUIP else None
         self.equipped_monster = None
 
+    def clone(self) -> 'Spell':
+        """Creates a shallow copy of the spell that shares its template.
+
+        Returns: a Spell with the same state as this one.
+        """
+        spell = Spell.__new__(Spell)
+        spell.template = self.template
+        spell.position = self.position
+        spell.equipped_monster = self.equipped_monster
+        return spell
+
+    __copy__ = clone
+
+    @property
+    def name(self) -> str:
+        return self.template.name
+
+    @property
+    def description(self) -> str:
+        return self.template.description
+
+    @property
+    def icon(self) -> 'Spell.Icon':
+        return self.template.icon
+
+    @property
+    def speed(self) -> int:
+        return self.template.speed
+
+    @property
+    def effect(self) -> Callable:
+        return self.template.effect
+
+    @property
+    def effect_args(self) -> tuple:
+        return self.template.effect_args
+
+    @property
+    def required_monster_type(self) -> Optional[str]:
+        return self.template.required_monster_type
+
     def __eq__(self, other_spell):
         """Determines whether two spell cards are equal.
 
@@ -146,6 +330,15 @@ class Spell:
                                                                 self.position.value)
         return str_repr
 
+    def to_dict(self) -> dict:
+        """
+        Returns: dictionary containing the data fields of the spell. The effect function is left out since it is
+            not data.
+        """
+        return {"name": self.name, "icon": self.icon, "description": self.description, "speed": self.speed,
+                "position": self.position, "effect_args": self.effect_args,
+                "required_monster_type": self.required_monster_type, "equipped_monster": self.equipped_monster}
+
     def activate_effect(self, player, opponent):
         if self.icon == Spell.Icon.EQUIP:
             self.effect(self.equipped_monster, *self.effect_args)
@@ -153,6 +346,233 @@ class Spell:
             self.effect(player, opponent, *self.effect_args)
 
 
+CARDS_PATH = 'sources/cards.csv'
+
+
+def resolve_effect(effect_name: str) -> Callable:
+    """Looks up a spell effect by name.
+
+    Args:
+        effect_name: The name of an effect registered in src.card_effects.EFFECTS.
+
+    Returns: the effect function.
+
+    Raises:
+        ValueError: No effect with that name exists.
+    """
+    try:
+        return effects.EFFECTS[effect_name]
+    except KeyError:
+        raise ValueError("Unknown spell effect %s" % effect_name) from None
+
+
+def validate_template(template: CardTemplate):
+    """Checks that a card template can be played, so that errors in the card catalog surface when the card is loaded
+    instead of when it is used in a game.
+
+    Args:
+        template: The template to validate.
+
+    Raises:
+        ValueError: The template is invalid.
+    """
+    if isinstance(template, MonsterTemplate):
+        if not 1 <= template.level <= 12:
+            raise ValueError("%s has an invalid level %d" % (template.name, template.level))
+        return
+    if template.icon == Spell.Icon.EQUIP:
+        if template.required_monster_type is None:
+            raise ValueError("%s is an equip spell without a required monster type" % template.name)
+        target_args = (None,)
+    else:
+        target_args = (None, None)
+    try:
+        inspect.signature(template.effect).bind(*target_args, *template.effect_args)
+    except TypeError as error:
+        raise ValueError("%s has invalid effect arguments: %s" % (template.name, error)) from error
+
+
+def template_from_record(record: dict):
+    """Creates the shared template of a card from a record of the compiled card catalog.
+
+    Args:
+        record: Dictionary of the card's fields, as returned by CompiledCatalog.record.
+
+    Returns: a MonsterTemplate or SpellTemplate corresponding to the record.
+    """
+    if record["kind"] == "Monster":
+        return MonsterTemplate(name=record["name"], description=record["description"], attribute=record["attribute"],
+                               monster_type=record["monster_type"], level=record["level"],
+                               attack_points=record["attack_points"], defense_points=record["defense_points"])
+
+    def convert_type(arg):
+        return int(arg) if arg.isnumeric() or arg.lstrip('-').isnumeric() else arg
+
+    return Spell.create_template(name=record["name"], icon=record["icon"], description=record["description"],
+                                 effect=resolve_effect(record["effect"]),
+                                 effect_args=[convert_type(arg) for arg in record["effect_args"]])
+
+
+def card_from_template(template: CardTemplate):
+    """Creates a new copy of a card that shares the specified template.
+
+    Args:
+        template: The immutable fields of the card.
+
+    Returns: a Monster or Spell in its starting state.
+    """
+    if isinstance(template, MonsterTemplate):
+        return Monster.from_template(template)
+    return Spell.from_template(template)
+
+
+class CardCatalog:
+    """An index of the card catalog, keyed by normalized card name.
+
+    The catalog is read from the compiled version of the csv file (see src.catalog_compiler), which is
+    memory-mapped once per process and recompiled when it is stale. Every card created by the catalog shares the
+    CardTemplate of its catalog entry, and the id of a card is its position in the catalog.
+
+    Each entry that has been looked up keeps a validated prototype card, so creating a card is a shallow clone of the
+    prototype with its effect and effect arguments already resolved.
+    """
+    def __init__(self, path: str = CARDS_PATH):
+        """Initializes an empty catalog that will be loaded from the specified file.
+
+        Args:
+            path: The path of the csv file containing the card catalog.
+        """
+        self.path = path
+        self._compiled = None
+        self._ids = {}
+        self._templates = {}
+        self._prototypes = {}
+
+    def load(self):
+        """Maps the compiled catalog into memory, compiling it first if it is missing or out of date.
+        """
+        compiled = load_compiled_catalog(self.path)
+        if self._compiled is not None:
+            self._compiled.close()
+        self._compiled = compiled
+        self._ids = {}
+        self._templates = {}
+        self._prototypes = {}
+
+    def reload(self):
+        """Discards the current index and loads the catalog file again.
+        """
+        self.load()
+
+    def card_id(self, card_name: str) -> int:
+        """Looks up the id of a card, loading the catalog if it has not been loaded yet.
+
+        Args:
+            card_name: The name of the card to look up.
+
+        Returns: the id of the card, or -1 if no card exists with that name
+        """
+        key = normalize_card_name(card_name)
+        card_id = self._ids.get(key)
+        if card_id is None:
+            if self._compiled is None:
+                self.load()
+            card_id = self._compiled.find(key)
+            if card_id >= 0:
+                self._ids[key] = card_id
+        return card_id
+
+    def template_by_id(self, card_id: int) -> CardTemplate:
+        """
+        Args:
+            card_id: The id of a card, as returned by card_id.
+
+        Returns: the CardTemplate of the card.
+        """
+        template = self._templates.get(card_id)
+        if template is None:
+            if self._compiled is None:
+                self.load()
+            template = template_from_record(self._compiled.record(card_id))
+            validate_template(template)
+            self._templates[card_id] = template
+        return template
+
+    def get_template(self, card_name: str):
+        """Looks up the shared template of a card. Templates are created the first time a card is looked up.
+
+        Args:
+            card_name: The name of the card to look up.
+
+        Returns: the CardTemplate of the card, or None if no card exists with that name
+        """
+        card_id = self.card_id(card_name)
+        return self.template_by_id(card_id) if card_id >= 0 else None
+
+    def get_prototype(self, card_name: str):
+        """Looks up the prototype of a card, which must not be modified or put in play.
+
+        Args:
+            card_name: The name of the card to look up.
+
+        Returns: a Monster or Spell in its starting state, or None if no card exists with that name
+        """
+        key = normalize_card_name(card_name)
+        prototype = self._prototypes.get(key)
+        if prototype is None:
+            template = self.get_template(key)
+            if template is None:
+                return None
+            prototype = self._prototypes[key] = card_from_template(template)
+        return prototype
+
+    def create_card(self, card_name: str):
+        """Creates a card based on the specified card_name.
+
+        Args:
+            card_name: The name of the card to be created.
+
+        Returns: a Card type corresponding to the card_name, or None if no card exists with that name
+        """
+        prototype = self.get_prototype(card_name)
+        return prototype.clone() if prototype else None
+
+    def create_deck(self, card_names: list) -> list:
+        """Creates a card for every name in a list of card names.
+
+        Args:
+            card_names: The names of the cards to be created.
+
+        Returns: a list containing a card for each name, or None where no card exists with that name
+        """
+        prototypes = self._prototypes
+        deck = []
+        for card_name in card_names:
+            prototype = prototypes.get(card_name) or self.get_prototype(card_name)
+            deck.append(prototype.clone() if prototype else None)
+        return deck
+
+    def checksum(self) -> int:
+        """
+        Returns: the checksum of the csv file the catalog was compiled from. Card ids are only meaningful between
+            processes whose catalogs have the same checksum.
+        """
+        if self._compiled is None:
+            self.load()
+        return self._compiled.source_crc
+
+    def __contains__(self, card_name: str) -> bool:
+        return self.card_id(card_name) >= 0
+
+    def __len__(self) -> int:
+        if self._compiled is None:
+            self.load()
+        return len(self._compiled)
+
+
+card_catalog = CardCatalog()
+
+
 def create_card(card_name: str, effect=None):
     """Creates a card based on the specified card_name.
     Args:
@@ -161,20 +581,7 @@ def create_card(card_name: str, effect=None):
 
     Returns: a Card type corresponding to the card_name, or None if no card exists with that name
     """
-    with open('sources/cards.csv', 'r') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            if row[0].lower().replace(" ", "") == card_name.lower().replace(" ", ""):
-                if row[1] == "Monster":
-                    return Monster(name=row[0], attribute=row[2], monster_type=row[3], level=int(row[4]),
-                                   attack_points=int(row[5]), defense_points=int(row[6]), description=row[7])
-                elif row[1] == "Spell":
-                    def convert_type(arg):
-                        return int(arg) if arg.isnumeric() or arg.lstrip('-').isnumeric() else arg
-
-                    return Spell(name=row[0], icon=row[2], description=row[3], effect=getattr(effects, row[4].strip()),
-                                 effect_args=[convert_type(arg) for arg in row[5:]])
-        return None
+    return card_catalog.create_card(card_name)
 
 
 def create_deck_from_array(card_name_array: list, effect=None):
@@ -187,7 +594,7 @@ def create_deck_from_array(card_name_array: list, effect=None):
     Returns:
         a list containing Card objects
     """
-    return [create_card(card_name, effect) for card_name in card_name_array]
+    return card_catalog.create_deck(card_name_array)
 
 
 def create_deck_from_preset(preset_path: str):
@@ -199,13 +606,7 @@ def create_deck_from_preset(preset_path: str):
     Returns:
         a list containing Card objects
     """
-    with open(preset_path, 'r') as csvfile:
-        deck = []
-        reader = csv.reader(csvfile)
-        for row in reader:
-            for name in row:
-                deck.append(create_card(name))
-        return deck
+    return card_catalog.create_deck(create_list_from_preset(preset_path))
 
 
 def create_list_from_preset(preset_path: str):
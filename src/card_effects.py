@@ -1,9 +1,24 @@
 from operator import attrgetter
 from src.player import Player
 
-from typing import Union
+from typing import Callable, Union
 
+EFFECTS: dict[str, Callable] = {}
 
+
+def register_effect(effect: Callable) -> Callable:
+    """Adds a function to EFFECTS, the registry of spell effects that cards in the catalog may name.
+
+    Args:
+        effect: The effect function. It is registered under its function name.
+
+    Returns: the effect function, so that this can be used as a decorator.
+    """
+    EFFECTS[effect.__name__] = effect
+    return effect
+
+
+@register_effect
 def increase_life_points(player: Player, opponent: Player, life_points: int):
     """Increases the player's life points by a specified amount.
 
@@ -15,6 +30,7 @@ def increase_life_points(player: Player, opponent: Player, life_points: int):
     player.life_points += life_points
 
 
+@register_effect
 def decrease_opponent_life_points(player: Player, opponent: Player, life_points: int):
     """Decreases the opponent's life points by a specified amount.
 
@@ -24,6 +40,7 @@ def decrease_opponent_life_points(player: Player, opponent: Player, life_points:
     opponent.decrease_life_points(life_points)
 
 
+@register_effect
 def destroy_all_monsters(player: Player, opponent: Player):
     """Destroys all monsters on the field and sends them to the respective player's graveyard.
     """
@@ -35,6 +52,7 @@ def destroy_all_monsters(player: Player, opponent: Player):
             opponent.send_card_to_graveyard(field_idx, -1)
 
 
+@register_effect
 def destroy_opponent_monster_with_lowest_atk(player: Player, opponent: Player):
     """Destroy the opponent's monster with the lowest attack points.
     """
@@ -44,6 +62,7 @@ def destroy_opponent_monster_with_lowest_atk(player: Player, opponent: Player):
     opponent.send_card_to_graveyard(min_atk_idx, -1)
 
 
+@register_effect
 def alter_monster_stats(monster, attack_points: int, defense_points: int):
     """Buffs and/or de-buffs a specified monster's attack and defense by specified values.
 
@@ -0,0 +1,275 @@
+# Compiles sources/cards.csv into a binary card catalog that can be memory-mapped by every server, worker and test
+# process instead of being parsed by each of them.
+#
+# Layout (little-endian):
+#   header    magic, format version, checksum and size of the source csv, checksum of everything after the header,
+#             record count and the offsets of the three sections below
+#   records   one fixed-width record per card, in catalog order. The position of a record is the card's id.
+#   index     open-addressing hash table from the crc32 of a normalized card name to record position + 1 (0 = empty)
+#   strings   interned string pool. Each entry is a u16 byte length followed by utf-8 bytes, and every distinct string
+#             is stored once.
+import csv
+import io
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+MAGIC = b'YGOC'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<4sHHIIIIIIIII')
+RECORD = struct.Struct('<BBHiiIIIIII')
+INDEX_SLOT = struct.Struct('<I')
+STRING_LENGTH = struct.Struct('<H')
+
+MONSTER = 1
+SPELL = 2
+KINDS = {"Monster": MONSTER, "Spell": SPELL}
+
+NO_STRING = 0xFFFFFFFF
+ARG_SEPARATOR = '\x1f'
+
+
+class StaleCatalogError(ValueError):
+    """Raised when a compiled catalog is corrupt, has an unknown format or was compiled from a different csv file.
+    """
+
+
+def normalize_card_name(card_name: str) -> str:
+    """Normalizes a card name so that lookups ignore case and spacing.
+
+    Args:
+        card_name: The name of a card.
+
+    Returns: the card name in lower case with every space removed.
+    """
+    return card_name.lower().replace(" ", "")
+
+
+def name_hash(normalized_name: str) -> int:
+    """
+    Returns: the hash used by the index of a compiled catalog. It is stable across processes.
+    """
+    return zlib.crc32(normalized_name.encode('utf-8'))
+
+
+def compiled_path_for(csv_path: str) -> str:
+    """
+    Returns: the default path of the compiled catalog for a csv catalog, next to the csv file.
+    """
+    return os.path.splitext(csv_path)[0] + '.bin'
+
+
+def compile_catalog(source: bytes) -> bytes:
+    """Compiles the contents of a csv card catalog into the binary catalog format.
+
+    Args:
+        source: the raw bytes of the csv file.
+
+    Returns: the compiled catalog. If two rows share a normalized name, only the first one is compiled.
+    """
+    strings = bytearray()
+    string_refs = {}
+
+    def intern(value):
+        if value is None:
+            return NO_STRING
+        if value not in string_refs:
+            encoded = value.encode('utf-8')
+            string_refs[value] = len(strings)
+            strings.extend(STRING_LENGTH.pack(len(encoded)))
+            strings.extend(encoded)
+        return string_refs[value]
+
+    records = bytearray()
+    keys = []
+    seen = set()
+    for row in csv.reader(io.StringIO(source.decode('utf-8'))):
+        if len(row) < 2 or row[1] not in KINDS or normalize_card_name(row[0]) in seen:
+            continue
+        key = normalize_card_name(row[0])
+        keys.append(key)
+        seen.add(key)
+        if row[1] == "Monster":
+            records.extend(RECORD.pack(MONSTER, int(row[4]), 0, int(row[5]), int(row[6]), intern(key),
+                                       intern(row[0]), intern(row[7]), intern(row[2]), intern(row[3]), NO_STRING))
+        else:
+            records.extend(RECORD.pack(SPELL, 0, 0, 0, 0, intern(key), intern(row[0]), intern(row[3]),
+                                       intern(row[2]), intern(row[4].strip()), intern(ARG_SEPARATOR.join(row[5:]))))
+
+    slots = 1
+    while slots < 2 * len(keys):
+        slots *= 2
+    index = [0] * slots
+    for position, key in enumerate(keys):
+        slot = name_hash(key) & (slots - 1)
+        while index[slot]:
+            slot = (slot + 1) & (slots - 1)
+        index[slot] = position + 1
+
+    records_offset = HEADER.size
+    index_offset = records_offset + len(records)
+    strings_offset = index_offset + slots * INDEX_SLOT.size
+    body = bytes(records) + struct.pack('<%dI' % slots, *index) + bytes(strings)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, zlib.crc32(source), len(source), zlib.crc32(body), len(keys),
+                         slots, records_offset, index_offset, strings_offset, len(strings))
+    return header + body
+
+
+def compile_catalog_file(csv_path: str, compiled_path: str = None) -> str:
+    """Compiles a csv card catalog and writes it next to the csv file, replacing any previous compiled catalog
+    atomically so that processes reading the old file are not disturbed.
+
+    Args:
+        csv_path: path of the csv card catalog.
+        compiled_path: path to write the compiled catalog to. Defaults to compiled_path_for(csv_path).
+
+    Returns: the path of the compiled catalog
+    """
+    compiled_path = compiled_path or compiled_path_for(csv_path)
+    with open(csv_path, 'rb') as csvfile:
+        compiled = compile_catalog(csvfile.read())
+    tmp_path = "%s.%d.tmp" % (compiled_path, os.getpid())
+    with open(tmp_path, 'wb') as outfile:
+        outfile.write(compiled)
+    os.replace(tmp_path, compiled_path)
+    return compiled_path
+
+
+class CompiledCatalog:
+    """Read-only view of a compiled card catalog, backed by a memory map or an in-memory buffer.
+    """
+    def __init__(self, buffer, source: bytes = None):
+        """Validates the header and checksums of a compiled catalog.
+
+        Args:
+            buffer: the compiled catalog, usually a read-only mmap.
+            source: the raw bytes of the csv file the catalog should have been compiled from. When given, the
+                catalog is rejected if it was compiled from a different file.
+
+        Raises:
+            StaleCatalogError: the catalog is corrupt, uses another format version or is stale.
+        """
+        if len(buffer) < HEADER.size:
+            raise StaleCatalogError("Compiled catalog is truncated")
+        (magic, version, _, self.source_crc, self.source_size, body_crc, self.record_count, self.index_slots,
+         self.records_offset, self.index_offset, self.strings_offset, strings_size) = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise StaleCatalogError("Unknown compiled catalog format")
+        if self.strings_offset + strings_size != len(buffer) or zlib.crc32(buffer[HEADER.size:]) != body_crc:
+            raise StaleCatalogError("Compiled catalog is corrupt")
+        if source is not None and (len(source) != self.source_size or zlib.crc32(source) != self.source_crc):
+            raise StaleCatalogError("Compiled catalog is stale")
+        self.buffer = buffer
+
+    @classmethod
+    def open(cls, compiled_path: str, source: bytes = None) -> 'CompiledCatalog':
+        """Memory-maps a compiled catalog file so that every process reading it shares the same pages.
+
+        Args:
+            compiled_path: path of the compiled catalog.
+            source: see CompiledCatalog.__init__
+
+        Returns: the compiled catalog
+        """
+        with open(compiled_path, 'rb') as compiled_file:
+            buffer = mmap.mmap(compiled_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(buffer, source)
+        except StaleCatalogError:
+            buffer.close()
+            raise
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def _string(self, offset: int):
+        if offset == NO_STRING:
+            return None
+        start = self.strings_offset + offset
+        length, = STRING_LENGTH.unpack_from(self.buffer, start)
+        start += STRING_LENGTH.size
+        return self.buffer[start:start + length].decode('utf-8')
+
+    def find(self, card_name: str) -> int:
+        """Looks up a card by name in the hash index.
+
+        Args:
+            card_name: The name of the card to look up.
+
+        Returns: the id of the card, or -1 if no card exists with that name
+        """
+        key = normalize_card_name(card_name)
+        mask = self.index_slots - 1
+        slot = name_hash(key) & mask
+        while True:
+            entry, = INDEX_SLOT.unpack_from(self.buffer, self.index_offset + slot * INDEX_SLOT.size)
+            if not entry:
+                return -1
+            key_ref, = INDEX_SLOT.unpack_from(self.buffer, self.records_offset + (entry - 1) * RECORD.size + 12)
+            if self._string(key_ref) == key:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def record(self, card_id: int) -> dict:
+        """Reads the record of a card.
+
+        Args:
+            card_id: the id of the card, as returned by find.
+
+        Returns: dictionary of the card's fields. Monsters have the keys kind, name, description, attribute,
+            monster_type, level, attack_points and defense_points. Spells have the keys kind, name, description,
+            icon, effect and effect_args, where effect_args is a list of strings.
+        """
+        if not 0 <= card_id < self.record_count:
+            raise IndexError("card id out of range")
+        (kind, level, _, atk, defense, _, name, description, field1, field2,
+         args) = RECORD.unpack_from(self.buffer, self.records_offset + card_id * RECORD.size)
+        if kind == MONSTER:
+            return {"kind": "Monster", "name": self._string(name), "description": self._string(description),
+                    "attribute": self._string(field1), "monster_type": self._string(field2), "level": level,
+                    "attack_points": atk, "defense_points": defense}
+        args = self._string(args)
+        return {"kind": "Spell", "name": self._string(name), "description": self._string(description),
+                "icon": self._string(field1), "effect": self._string(field2),
+                "effect_args": args.split(ARG_SEPARATOR) if args else []}
+
+
+def load_compiled_catalog(csv_path: str, compiled_path: str = None) -> CompiledCatalog:
+    """Opens the compiled version of a csv card catalog, compiling it first when it is missing or stale.
+
+    If the csv file does not exist, the compiled catalog is used as is. If the compiled catalog cannot be written,
+    the catalog is compiled into memory instead.
+
+    Args:
+        csv_path: path of the csv card catalog.
+        compiled_path: path of the compiled catalog. Defaults to compiled_path_for(csv_path).
+
+    Returns: the compiled catalog
+    """
+    compiled_path = compiled_path or compiled_path_for(csv_path)
+    try:
+        with open(csv_path, 'rb') as csvfile:
+            source = csvfile.read()
+    except FileNotFoundError:
+        return CompiledCatalog.open(compiled_path)
+    try:
+        return CompiledCatalog.open(compiled_path, source)
+    except (FileNotFoundError, StaleCatalogError, ValueError):
+        pass
+    try:
+        compile_catalog_file(csv_path, compiled_path)
+        return CompiledCatalog.open(compiled_path, source)
+    except OSError:
+        return CompiledCatalog(compile_catalog(source), source)
+
+
+if __name__ == "__main__":
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else 'sources/cards.csv'
+    print("Compiled " + compile_catalog_file(csv_file, sys.argv[2] if len(sys.argv) > 2 else None))
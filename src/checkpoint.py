@@ -0,0 +1,208 @@
+# Crash-safe checkpoints of the sessions of YugiohServer. Each session has an append-only file of JSON lines in the
+# checkpoint directory: a checkpoint record holding a snapshot of the game (see src.state_sync), its turn counter, its
+# game log and the resume tokens of its players, followed by the request of every command applied to the game since.
+#
+# The server only queues the requests of the commands it applies. A writer task appends the queued requests of every
+# session in one batch every FLUSH_INTERVAL seconds, from a worker thread, and replaces the file of a session with a
+# fresh checkpoint once COMPACT_AFTER requests have been appended to it. A server that crashes loses at most the
+# requests of the last interval. On startup, each session is rebuilt from its checkpoint by replaying the requests
+# after it; a record cut short by the crash is ignored.
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Callable, Optional
+
+from src.moves import InvalidCommand, decode_command
+from src.session import Session
+from src.yugioh import Yugioh
+
+FLUSH_INTERVAL = 0.05
+COMPACT_AFTER = 256
+CHECKPOINT_VARIABLE = "YUGIOH_CHECKPOINT_DIR"
+CHECKPOINT_FILE = re.compile(r"session-(\d+)\.log")
+
+
+class CheckpointStore:
+    """Writes the checkpoints of sessions to a directory, and reads them back.
+    """
+    def __init__(self, directory: str, flush_interval: float = FLUSH_INTERVAL, compact_after: int = COMPACT_AFTER,
+                 fsync: bool = True):
+        """
+        Args:
+            directory: directory of the checkpoint files. It is created if needed.
+            flush_interval: seconds between two writes of the queued requests
+            compact_after: number of requests appended to the file of a session before it is replaced by a new
+                checkpoint
+            fsync: whether writes are flushed to disk before the next ones
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self.fsync = fsync
+        self.sessions: dict[int, Session] = {}
+        self.pending: dict[int, list] = {}  # requests waiting to be written, by session id
+        self.unsaved: set[int] = set()  # sessions needing a new checkpoint
+        self.appended: dict[int, int] = {}  # requests written since the last checkpoint, by session id
+        self.removed: set[int] = set()
+        self.writes = 0
+        self.writing: Optional[asyncio.Future] = None  # the write of the last flush
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, session_id: int) -> str:
+        return os.path.join(self.directory, "session-%d.log" % session_id)
+
+    def track(self, session: Session):
+        """Starts checkpointing a session. Its first checkpoint is written by the next flush.
+        """
+        self.sessions[session.session_id] = session
+        self.unsaved.add(session.session_id)
+        self.removed.discard(session.session_id)
+
+    def record(self, session: Session, request: dict):
+        """Queues the request of a command applied to the game of a tracked session. The request must not be changed
+        afterwards.
+        """
+        if session.session_id in self.sessions:
+            self.pending.setdefault(session.session_id, []).append(request)
+
+    def forget(self, session: Session):
+        """Stops checkpointing a session, and deletes its file with the next flush.
+        """
+        self.sessions.pop(session.session_id, None)
+        self.pending.pop(session.session_id, None)
+        self.unsaved.discard(session.session_id)
+        self.appended.pop(session.session_id, None)
+        self.removed.add(session.session_id)
+
+    def checkpoint(self, session: Session) -> dict:
+        """
+        Returns: the checkpoint record of the current state of a session. It only shares immutable data with the
+            session, so it can be serialized from another thread.
+        """
+        game = session.game
+        return {"checkpoint": game.history.record(game.game), "session_id": session.session_id,
+                "turn": game.current_turn, "logs": list(game.game_logger.game_actions), "tokens": list(session.tokens)}
+
+    def collect(self) -> list[tuple]:
+        """Takes the queued requests and checkpoints, to be written by write.
+
+        Returns: a list of ("append", path, records), ("replace", path, records) and ("remove", path) operations
+        """
+        operations = [("remove", self.path(session_id)) for session_id in self.removed]
+        self.removed = set()
+        for session_id in self.unsaved | self.pending.keys():
+            requests = self.pending.get(session_id, [])
+            appended = self.appended.get(session_id, 0) + len(requests)
+            if session_id in self.unsaved or appended >= self.compact_after:
+                # The snapshot is taken after every queued request was applied, so they are not written
+                operations.append(("replace", self.path(session_id), [self.checkpoint(self.sessions[session_id])]))
+                self.appended[session_id] = 0
+            else:
+                operations.append(("append", self.path(session_id), [{"request": request} for request in requests]))
+                self.appended[session_id] = appended
+        self.pending = {}
+        self.unsaved = set()
+        return operations
+
+    def write(self, operations: list[tuple]):
+        """Runs the operations returned by collect. Files are replaced by renaming a new file over them, so a crash
+        leaves either the old or the new checkpoint.
+        """
+        for operation, path, *records in operations:
+            try:
+                if operation == "remove":
+                    if os.path.exists(path):
+                        os.remove(path)
+                    continue
+                lines = "".join(json.dumps(record) + "\n" for record in records[0])
+                target = path + ".tmp" if operation == "replace" else path
+                with open(target, 'w' if operation == "replace" else 'a') as outfile:
+                    outfile.write(lines)
+                    if self.fsync:
+                        outfile.flush()
+                        os.fsync(outfile.fileno())
+                if operation == "replace":
+                    os.replace(target, path)
+            except OSError as error:
+                logging.error("Could not write checkpoint %s: %s", path, error)
+        self.writes += 1
+
+    async def flush(self):
+        """Writes the queued requests and checkpoints from a worker thread.
+        """
+        operations = self.collect()
+        if operations:
+            self.writing = asyncio.get_running_loop().run_in_executor(None, self.write, operations)
+            await asyncio.shield(self.writing)  # a cancelled flush still writes
+
+    async def run(self):
+        """Flushes every flush_interval seconds, forever. The last requests are flushed when the task is cancelled.
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            if self.writing is not None and not self.writing.done():
+                await asyncio.wait([self.writing])  # the operations of the last flush come first
+            self.write(self.collect())
+
+    def load(self, owns: Callable[[int], bool] = None) -> list[tuple[int, Yugioh, list]]:
+        """Rebuilds the games of the checkpointed sessions.
+
+        Args:
+            owns: returns whether a session id is handled by this server. Every session is loaded if not given.
+
+        Returns: the id, rebuilt game and resume tokens of each session
+        """
+        restored = []
+        for name in sorted(os.listdir(self.directory)):
+            match = CHECKPOINT_FILE.fullmatch(name)
+            if match is None or (owns is not None and not owns(int(match.group(1)))):
+                continue
+            try:
+                restored.append(self.load_session(os.path.join(self.directory, name)))
+            except (OSError, ValueError, IndexError, KeyError, TypeError) as error:
+                logging.error("Could not restore checkpoint %s: %s", name, error)
+        return restored
+
+    def load_session(self, path: str) -> tuple[int, Yugioh, list]:
+        """
+        Returns: the id, game and resume tokens of the session checkpointed in a file
+        """
+        with open(path) as infile:
+            lines = infile.read().split("\n")
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break  # the end of the file, or a record the server crashed while writing
+        checkpoint = records[0]
+        game = Yugioh()
+        game.restore(checkpoint["checkpoint"], checkpoint["turn"], checkpoint["logs"])
+        for record in records[1:]:
+            replay(game, record["request"])
+        logging.info("Restored session %d at version %d, %d requests replayed", checkpoint["session_id"],
+                     game.version, len(records) - 1)
+        return checkpoint["session_id"], game, checkpoint["tokens"]
+
+
+def replay(game: Yugioh, request: dict):
+    """Applies a request recorded in a checkpoint again. Requests that failed when they were first applied fail again
+    the same way.
+    """
+    try:
+        game.execute(decode_command(request))
+    except (InvalidCommand, IndexError, AttributeError, TypeError, ValueError):
+        pass
+
+
+def checkpoints_from_environment() -> Optional[CheckpointStore]:
+    """
+    Returns: a CheckpointStore writing to the directory set by YUGIOH_CHECKPOINT_DIR, or None if it is not set.
+    """
+    directory = os.environ.get(CHECKPOINT_VARIABLE)
+    return CheckpointStore(directory) if directory else None
@@ -1,17 +1,28 @@
 # Class for a command line interface to control the yugioh yugioh_game
+import asyncio
 import json
 import os
-import pickle
 import socket
 from asyncio.log import logger
-from typing import Union, Any
+from typing import Optional, Union, Any
 
 import inquirer
 import websockets
+import websockets.exceptions
 from inquirer import errors
 
 from src.card import monster_card_to_string, spell_card_to_string, Monster, Spell, Card
 from src.game import GameController, GameStatus
+from src.compression import codec_of, load_compressor
+from src.protocol import BINARY_SUBPROTOCOL, decode_snapshot, encode_request, is_snapshot_frame, subprotocols, \
+    wire_format
+from src.state_codec import STATE, decode_state
+from src.state_sync import apply_patch, game_from_snapshot
+
+RESUME_ATTEMPTS = 5
+RESUME_DELAY = 0.5
+ERROR = "error"
+BATCH = "batch"
 
 
 class NetworkCli:
@@ -28,10 +39,12 @@ class NetworkCli:
         self.players = []
         self.yugioh_game: GameController = GameController(0)
         self.client_socket = None
+        self.compressor = None
         self.session_id = 0
         self.player_place = 0
         self.other_player_place = 1
         self.session_id = 0
+        self.resume_token = None
         self.name = name
         self.deck = deck
         self.server_ip = server_ip
@@ -96,22 +109,19 @@ class NetworkCli:
         print("Waiting for another player...")
         game_state = await self.connect_to_server()
         self.player_place, self.session_id = game_state["player"], game_state["session_id"]
+        self.resume_token = game_state.get("token")
         self.other_player_place = 1 if self.player_place == 0 else 0
         logger.debug("Send Create Game")
-        await self.client_socket.send(json.dumps(
+        await self.send_data_and_update_game(
             {"operation": "create", "session_id": self.session_id,
              "player_name": self.name,
-             "deck": self.deck, "get_pickle": True, "player_place": self.player_place}).encode('utf-8'))
-
-        data = await self.client_socket.recv()
-        self.yugioh_game = pickle.loads(data)
+             "deck": self.deck, "get_state": True, "player_place": self.player_place})
 
         while self.yugioh_game.game_status == GameStatus.WAITING:
-            data = await self.client_socket.recv()
-            self.yugioh_game = pickle.loads(data)
+            await self.receive_game_update()
         await self.send_data_and_update_game(
             {"operation": "update", "player": self.player_place, "session_id": self.session_id,
-             "move": "draw_card", "args": [3], "get_pickle": True})
+             "move": "draw_card", "args": [3], "get_state": True})
         while GameStatus.ONGOING:
             self.num_rounds += 1
             if self.yugioh_game.current_player != self.player_place:
@@ -135,11 +145,15 @@ class NetworkCli:
         Connects to the game server.
         :return: The game state that the server has
         """
-        self.client_socket = await websockets.connect(self.server_ip + ":" + str(self.port), timeout=60,
-                                                      close_timeout=60)
+        await self.open_connection()
         # Keep recieving until get a session_id that is not 0
         while True:
             game_state = json.loads(await self.client_socket.recv())
+            if "retry_after" in game_state:
+                print("Server busy, retrying in %d seconds..." % game_state["retry_after"])
+                await asyncio.sleep(game_state["retry_after"])
+                await self.open_connection()
+                continue
             if game_state["session_id"] != 0:
                 logger.debug("Recieved game start message")
                 break
@@ -147,6 +161,43 @@ class NetworkCli:
                 logger.debug("Recieved alive message")
         return game_state
 
+    async def open_connection(self, path: str = ""):
+        """
+        Opens a websocket to the server, negotiating compression if a dictionary is available.
+        Args:
+            path: path of the request, such as /resume/<session_id>?token=<resume token>
+        """
+        compressor = load_compressor()
+        self.client_socket = await websockets.connect(
+            self.server_ip + ":" + str(self.port) + path, open_timeout=60, close_timeout=60,
+            subprotocols=subprotocols([compressor.codec] if compressor else []))
+        self.compressor = None
+        if compressor is not None and codec_of(self.client_socket.subprotocol) == compressor.codec:
+            self.compressor = compressor
+
+    async def resume(self, error: websockets.exceptions.ConnectionClosed):
+        """
+        Reconnects to the game after the connection to the server dropped, with the resume token sent with the seat.
+        The server then sends the changes made since the version of the game the client has, in one state frame.
+        Args:
+            error: the error the dropped connection raised, raised again if the game cannot be resumed
+        """
+        if self.resume_token is None:
+            raise error
+        for attempt in range(RESUME_ATTEMPTS):
+            await asyncio.sleep(RESUME_DELAY * 2 ** attempt)
+            try:
+                await self.open_connection("/resume/%d?token=%s&ack=%d" % (self.session_id, self.resume_token,
+                                                                          self.game_version()))
+                seat = json.loads(await self.client_socket.recv())
+            except (OSError, websockets.exceptions.WebSocketException):
+                continue
+            if seat.get("type") == ERROR:
+                raise error
+            logger.debug("Resumed session %d", self.session_id)
+            return
+        raise error
+
     def setState(self, phase: 'Phase'):
         self._phase = phase
         self._phase.context = self
@@ -158,11 +209,93 @@ class NetworkCli:
             data: data to send to the server
         """
         try:
-            await self.client_socket.send(json.dumps(data).encode("utf-8"))
-            self.yugioh_game = pickle.loads(await self.client_socket.recv())
+            await self.send_request(dict(data, delta=True, ack=self.game_version()))
+            await self.receive_game_update()
         except socket.error:
             pass
 
+    async def send_request(self, data: dict):
+        """
+        Sends a request to the server in the wire format negotiated when connecting: a binary request frame if the
+        server accepted the binary subprotocol, JSON otherwise. If the connection dropped, the game is resumed and the
+        request is sent on the new connection.
+        Args:
+            data: the request to send
+        """
+        try:
+            if wire_format(self.client_socket.subprotocol) == BINARY_SUBPROTOCOL:
+                await self.client_socket.send(encode_request(data))
+            else:
+                await self.client_socket.send(json.dumps(data).encode("utf-8"))
+        except websockets.exceptions.ConnectionClosedError as error:
+            await self.resume(error)
+            self.apply_state_frame(await self.receive_frame())
+            await self.send_request(dict(data, ack=self.game_version()) if "ack" in data else data)
+
+    def game_version(self) -> int:
+        """
+        Returns: the version of the game state the client has, or -1 if it has none.
+        """
+        return getattr(self.yugioh_game, "version", -1)
+
+    async def receive_game_update(self):
+        """
+        Receives state frames from the server until one of them updates the game. If a delta frame does not apply to
+        the version of the game the client has, or the server rejected the request, asks the server for a full
+        snapshot.
+        """
+        sync_requested = False
+        while True:
+            updated = self.apply_state_frame(await self.receive_frame())
+            if updated:
+                return
+            if updated is not None and not sync_requested:
+                await self.send_request(
+                    {"operation": "read", "session_id": self.session_id, "get_state": True, "delta": True, "ack": -1})
+                sync_requested = True
+
+    async def receive_frame(self) -> Union[bytes, str]:
+        """
+        Returns: the next message from the server, decompressed if compression was negotiated when connecting. If
+            the connection dropped, the game is resumed on a new connection, whose first state frame is returned.
+        """
+        try:
+            data = await self.client_socket.recv()
+        except websockets.exceptions.ConnectionClosedError as error:
+            await self.resume(error)
+            data = await self.client_socket.recv()
+        if self.compressor is not None and isinstance(data, bytes):
+            data = self.compressor.decompress(data)
+        return data
+
+    def apply_state_frame(self, data: bytes) -> Optional[bool]:
+        """
+        Updates the game from a state frame sent by the server. The message of an error frame, sent when the server
+        rejected a request, is shown and the game is kept.
+        Args:
+            data: a binary snapshot frame (see src.protocol), a JSON state frame (see src.state_codec), a JSON
+                delta frame (see Yugioh.state_frame), or a JSON error or batch frame. Delta frames with a base of -1
+                replace the whole game.
+        Returns: True if the game was updated, False if the frame is a delta from another version of the game or an
+            error, or None for a batch frame, which comes before the state frame of its batch.
+        """
+        if is_snapshot_frame(data):
+            self.yugioh_game = game_from_snapshot(decode_snapshot(data))
+            return True
+        frame = json.loads(data)
+        if frame.get("type") == STATE:
+            self.yugioh_game = decode_state(frame)
+            return True
+        if frame.get("type") == ERROR:
+            print(frame["message"])
+            return False
+        if frame.get("type") == BATCH:
+            return None
+        if frame["base"] not in (-1, self.game_version()):
+            return False
+        self.yugioh_game = apply_patch(self.yugioh_game, frame["ops"])
+        return True
+
     async def close_game(self):
         """
         Sends a "delete" to the server and closes the client and game
@@ -175,20 +308,20 @@ class NetworkCli:
                 print("You lost")
                 game_result = "l"
                 await self.send_data_and_update_game(
-                    {"operation": "delete", "session_id": self.session_id, "get_pickle": True})
+                    {"operation": "delete", "session_id": self.session_id, "get_state": True})
             elif self.yugioh_game.players[self.other_player_place].life_points <= 0 or len(self.yugioh_game.players[self.other_player_place].deck) <=0:
                 print("You won!")
                 game_result = "w"
                 await self.send_data_and_update_game(
-                    {"operation": "delete", "session_id": self.session_id, "get_pickle": True})
+                    {"operation": "delete", "session_id": self.session_id, "get_state": True})
             else:
                 print("Tie")
                 game_result = "d"
                 await self.send_data_and_update_game(
-                    {"operation": "delete", "session_id": self.session_id, "get_pickle": True})
-            await self.client_socket.send(json.dumps({"operation": "read", "get_game_actions": True}).encode("utf-8"))
+                    {"operation": "delete", "session_id": self.session_id, "get_state": True})
+            await self.send_request({"operation": "read", "get_game_actions": True})
 
-            game_actions = await self.client_socket.recv()
+            game_actions = await self.receive_frame()
             await self.client_socket.close()
             return {"game_result": game_result, "game_actions": json.loads(game_actions)}
 
@@ -224,7 +357,7 @@ class DrawPhase(Phase):
     async def conduct_phase(self) -> bool:
         await self.context.send_data_and_update_game(
             {"operation": "update", "player": self._context.player_place, "session_id": self._context.session_id,
-             "move": "draw_card", "args": [1], "get_pickle": True})
+             "move": "draw_card", "args": [1], "get_state": True})
         if self.context.yugioh_game.get_winner() != False:
             return False
         self.context.display_board()
@@ -318,12 +451,12 @@ class MainPhase(Phase):
             await self.context.send_data_and_update_game(
                 {"operation": "update", "session_id": self.context.session_id,
                  "move": "normal_summon", "args":
-                     [monster_to_summon], "get_pickle": True})
+                     [monster_to_summon], "get_state": True})
         elif position == "Face Down":
             await self.context.send_data_and_update_game(
                 {"operation": "update", "session_id": self.context.session_id,
                  "move": "normal_set", "args":
-                     [monster_to_summon], "get_pickle": True})
+                     [monster_to_summon], "get_state": True})
             self.context.display_board()
 
     async def tribute_summon(self, monster_to_summon):
@@ -355,7 +488,7 @@ class MainPhase(Phase):
         await self.context.send_data_and_update_game(
             {"operation": "update", "session_id": self.context.session_id,
              "move": "tribute_summon", "args":
-                 [monster_to_summon, monsters_to_sacrifice[0], monsters_to_sacrifice[1]], "get_pickle": True})
+                 [monster_to_summon, monsters_to_sacrifice[0], monsters_to_sacrifice[1]], "get_state": True})
         self.context.display_board()
 
     async def activate_spell(self, spell):
@@ -382,7 +515,7 @@ class MainPhase(Phase):
         if spell_icon == Spell.Icon.NORMAL:
             await self.context.send_data_and_update_game(
                 {"operation": "update", "session_id": self.context.session_id, "move": "normal_spell",
-                 "args": [spell], "get_pickle": True}
+                 "args": [spell], "get_state": True}
             )
         elif spell_icon == Spell.Icon.EQUIP:
             required_type = get_required_type(self.context.yugioh_game.get_current_player().hand[spell].name)
@@ -403,7 +536,7 @@ class MainPhase(Phase):
 
             await self.context.send_data_and_update_game(
                 {"operation": "update", "session_id": self.context.session_id, "move": "equip_spell",
-                 "args": [monster, spell], "get_pickle": True}
+                 "args": [monster, spell], "get_state": True}
             )
         self.context.display_board()
         
@@ -422,7 +555,7 @@ class MainPhase(Phase):
         await self.context.send_data_and_update_game(
             {"operation": "update", "session_id": self.context.session_id,
              "move": "flip_summon", "args":
-                 [card_to_flip], "get_pickle": True})
+                 [card_to_flip], "get_state": True})
         self.context.display_board()
 
 
@@ -468,12 +601,12 @@ class BattlePhase(Phase):
                     await self.context.send_data_and_update_game(
                         {"operation": "update", "session_id": self.context.session_id,
                          "move": "attack_player", "args": [attacking_monster],
-                         "get_pickle": True})
+                         "get_state": True})
                 else:
                     await self.context.send_data_and_update_game(
                         {"operation": "update", "move": "attack_monster", "args":
                             [attacking_monster, targeted_monster],
-                         "get_pickle": True})
+                         "get_state": True})
             self.context.display_board()
             if self.context.yugioh_game.is_there_winner():
                 return False
@@ -489,7 +622,7 @@ class EndPhase(Phase):
     async def conduct_phase(self) -> bool:
         await self.context.send_data_and_update_game(
             {"operation": "update", "session_id": self.context.session_id, "move": "change_turn",
-             "args": [], "get_pickle": True})
+             "args": [], "get_state": True})
         self.context.display_board()
         self.context.setState(WaitPhase())
         return True
@@ -505,8 +638,7 @@ class WaitPhase(Phase):
         while self.context.yugioh_game.current_player != self.context.player_place:
             self.context.display_board()
             print("It is not your turn yet")
-            data = await self.context.client_socket.recv()
-            self.context.yugioh_game = pickle.loads(data)
+            await self.context.receive_game_update()
             if self.context.yugioh_game.game_status == GameStatus.ENDED:
                 return False
         self.context.num_rounds += 1
@@ -0,0 +1,212 @@
+# Optional compression of the frames YugiohServer sends, using a preset dictionary trained on recorded game states.
+#
+# Frames repeat the same card names, descriptions and field names, so most of a frame can be copied from a dictionary
+# that both sides already have. Each frame is compressed on its own as raw deflate with the dictionary as its preset
+# (zlib's zdict), so a compressed frame can be shared by every connection that negotiated the same dictionary and
+# cached with the frame it was made from.
+#
+# The codec and dictionary are negotiated with the websocket subprotocol: a client that has the dictionary offers
+# "<format>+zlib.<dictionary id>", where the dictionary id is the crc32 of the dictionary in hex, and the server
+# accepts it only if it has the same dictionary.
+#
+# Train a dictionary from scripted games between the preset decks: python -m src.compression [output path]
+import logging
+import random
+import re
+import sys
+import time
+import zlib
+from collections import Counter
+from typing import Optional
+
+DICTIONARY_PATH = 'sources/state_frames.zdict'
+MAX_DICTIONARY_SIZE = 32 * 1024
+ZLIB = "zlib"
+LEVEL = 6
+WBITS = -15
+MAX_CACHED_FRAMES = 64
+REPORT_INTERVAL = 1000
+
+SEGMENT = re.compile(rb'[{\[,:]*"(?:[^"\\]|\\.)*"[:,]?|[\]}]+')
+
+
+def dictionary_id(dictionary: bytes) -> str:
+    """
+    Returns: the id of a dictionary, used to check that both ends of a connection have the same one.
+    """
+    return "%08x" % zlib.crc32(dictionary)
+
+
+def train_dictionary(samples: list, size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """Builds a preset dictionary from sample frames.
+
+    The frames are split into JSON strings and the punctuation around them. Segments found in more than one sample
+    are ranked by how many bytes they would save over all samples, and the most valuable ones go at the end of the
+    dictionary, where deflate reaches them with the shortest distances. The space left is filled with the end of the
+    samples themselves, which holds the longer runs that whole frames share.
+
+    Args:
+        samples: encoded frames recorded from games
+        size: maximum size of the dictionary. Deflate can only refer to the last 32 KiB.
+
+    Returns: the dictionary
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(SEGMENT.findall(sample)))
+    ranked = sorted((segment for segment, count in counts.items() if count > 1 and len(segment) > 3),
+                    key=lambda segment: (counts[segment] * len(segment), segment), reverse=True)
+    chosen = []
+    total = 0
+    for segment in ranked:
+        if total + len(segment) > size:
+            continue
+        chosen.append(segment)
+        total += len(segment)
+    segments = b''.join(reversed(chosen))
+    filler = b''.join(samples)[-(size - len(segments)):] if size > len(segments) else b''
+    return filler + segments
+
+
+class FrameCompressor:
+    """Compresses frames with a preset dictionary, and keeps the statistics needed to decide whether compression is
+    worth enabling: the compression ratio and the CPU time spent per frame.
+    """
+    def __init__(self, dictionary: bytes, level: int = LEVEL):
+        """
+        Args:
+            dictionary: the preset dictionary, as returned by train_dictionary.
+            level: the zlib compression level.
+        """
+        self.dictionary = dictionary
+        self.level = level
+        self.id = dictionary_id(dictionary)
+        self.codec = "%s.%s" % (ZLIB, self.id)
+        self._frames = {}
+        self.frames_sent = 0
+        self.frames_compressed = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.cpu_seconds = 0.0
+
+    def compress(self, frame: bytes) -> bytes:
+        """
+        Returns: the compressed frame. Frames that were compressed recently are taken from a cache, since the same
+            frame object is usually sent to several clients.
+        """
+        cached = self._frames.get(id(frame))
+        if cached is not None and cached[0] is frame:
+            compressed = cached[1]
+        else:
+            start = time.process_time()
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, WBITS, zdict=self.dictionary)
+            compressed = compressor.compress(frame) + compressor.flush()
+            self.cpu_seconds += time.process_time() - start
+            self.frames_compressed += 1
+            if len(self._frames) >= MAX_CACHED_FRAMES:
+                self._frames.clear()
+            self._frames[id(frame)] = (frame, compressed)
+        self.frames_sent += 1
+        self.raw_bytes += len(frame)
+        self.compressed_bytes += len(compressed)
+        if self.frames_sent % REPORT_INTERVAL == 0:
+            logging.info("Frame compression %s: %s", self.codec, self.report())
+        return compressed
+
+    def decompress(self, frame: bytes) -> bytes:
+        """
+        Returns: the original frame.
+
+        Raises:
+            zlib.error: the frame was not compressed with this dictionary.
+        """
+        decompressor = zlib.decompressobj(WBITS, zdict=self.dictionary)
+        return decompressor.decompress(frame) + decompressor.flush()
+
+    def report(self) -> dict:
+        """
+        Returns: dictionary of the frames sent and compressed, the compression ratio (raw bytes / compressed bytes)
+            and the CPU time in microseconds spent per compressed frame.
+        """
+        return {"frames_sent": self.frames_sent, "frames_compressed": self.frames_compressed,
+                "ratio": round(self.raw_bytes / self.compressed_bytes, 2) if self.compressed_bytes else None,
+                "cpu_us_per_frame": round(self.cpu_seconds * 1e6 / self.frames_compressed, 1)
+                if self.frames_compressed else None}
+
+
+def load_compressor(path: str = DICTIONARY_PATH) -> Optional[FrameCompressor]:
+    """
+    Returns: a FrameCompressor using the dictionary at path, or None if there is no dictionary, in which case
+        compression is not offered.
+    """
+    try:
+        with open(path, 'rb') as dictionary_file:
+            return FrameCompressor(dictionary_file.read())
+    except FileNotFoundError:
+        return None
+
+
+def codec_of(subprotocol: Optional[str]) -> Optional[str]:
+    """
+    Returns: the compression codec part of a subprotocol, such as "zlib.0123abcd", or None if it has none.
+    """
+    if not subprotocol or "+" not in subprotocol:
+        return None
+    return subprotocol.split("+", 1)[1]
+
+
+def record_sample_frames(seed: int = 0, games: int = 3) -> list:
+    """Plays scripted games with decks drawn from the preset decks and records the frames sent to clients at every
+    step, in every format. The decks, the number of turns and the moves of each turn are picked at random, so other
+    seeds give other games.
+
+    Args:
+        seed: seed of the games
+        games: number of games to play
+
+    Returns: list of encoded frames
+    """
+    from src.card import create_list_from_preset
+    from src.yugioh import Yugioh
+
+    rng = random.Random(seed)
+    random.seed(seed)  # GameController picks the first player with the global generator
+    pool = sorted({card for idx in range(1, 4) for card in create_list_from_preset("sources/preset%d" % idx)})
+    frames = []
+    for _ in range(games):
+        game = Yugioh()
+        moves = [("create", {"player_name": name, "deck": rng.sample(pool, 8)}) for name in ("Yugi", "Kaiba")]
+        for player in range(2):
+            moves.append(("update", {"player": player, "move": "draw_card", "args": [5]}))
+        for turn in range(rng.randint(4, 8)):
+            moves.append(("update", {"move": "draw_card", "args": [1]}))
+            for _ in range(rng.randint(1, 2)):
+                move = rng.choice(["normal_summon", "normal_set", "normal_spell", "attack_player"])
+                moves.append(("update", {"move": move, "args": [rng.randrange(3)]}))
+            moves.append(("update", {"move": "change_turn", "args": []}))
+        for operation, request in moves:
+            request = dict(request, session_id=1)
+            if "player" not in request and operation == "update":
+                request["player"] = game.game.current_player
+            base = game.version
+            try:
+                getattr(game, "%s_game" % operation)(request)
+            except (IndexError, AttributeError, TypeError, ValueError):
+                continue
+            frames += [game.json_frame(), game.snapshot_frame(0), game.snapshot_frame(1),
+                       game.state_frame(base, 0), game.state_frame(base, 1), game.binary_frame(0),
+                       game.binary_frame(1)]
+    return frames
+
+
+if __name__ == "__main__":
+    output_path = sys.argv[1] if len(sys.argv) > 1 else DICTIONARY_PATH
+    samples = record_sample_frames()
+    dictionary = train_dictionary(samples)
+    with open(output_path, 'wb') as outfile:
+        outfile.write(dictionary)
+    compressor = FrameCompressor(dictionary)
+    for sample in samples:
+        compressor.compress(sample)
+    print("Wrote %s (%d bytes, id %s) from %d frames: %s" % (output_path, len(dictionary), compressor.id,
+                                                             len(samples), compressor.report()))
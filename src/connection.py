@@ -0,0 +1,163 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Union
+
+from src.compression import FrameCompressor, codec_of
+from src.protocol import BINARY_SUBPROTOCOL, decode_request, wire_format
+from src.yugioh import Yugioh
+
+HIGH_WATER = 256 * 1024
+SEND_LIMIT = 4 * 1024 * 1024
+HIGH_WATER_VARIABLE = "YUGIOH_SEND_HIGH_WATER"
+SEND_LIMIT_VARIABLE = "YUGIOH_SEND_LIMIT"
+FULL_STATE_VARIABLE = "YUGIOH_DEBUG_FULL_STATE"
+
+
+@dataclass(frozen=True)
+class SendLimits:
+    """Limits on the number of bytes waiting to be sent to a client.
+    """
+    high_water: int = HIGH_WATER  # past it, broadcasts skip the client until it catches up on the latest state
+    limit: int = SEND_LIMIT  # past it, the client is disconnected
+
+
+def send_limits_from_environment() -> SendLimits:
+    """
+    Returns: the SendLimits set by the environment: YUGIOH_SEND_HIGH_WATER and YUGIOH_SEND_LIMIT, in bytes.
+    """
+    return SendLimits(int(os.environ.get(HIGH_WATER_VARIABLE, HIGH_WATER)),
+                      int(os.environ.get(SEND_LIMIT_VARIABLE, SEND_LIMIT)))
+
+
+def full_state_from_environment() -> bool:
+    """
+    Returns: whether YUGIOH_DEBUG_FULL_STATE is set to 1, which lets JSON clients asking for get_json, or for no
+        format, receive the whole game with nothing hidden. For debugging only: it shows every player the opponent's
+        hand, deck and face-down monsters.
+    """
+    return os.environ.get(FULL_STATE_VARIABLE) == "1"
+
+
+class ClientConnection:
+    """Server-side state of a client's websocket connection: the wire format and compression negotiated when it
+    connected, the seat of the client's player, the state format the client asked for and, for clients using delta
+    frames, the last version of the game they have. It also tracks how far behind the client is in reading its
+    frames.
+    """
+
+    def __init__(self, websocket, compressor: FrameCompressor = None, full_state: bool = False):
+        """
+        Args:
+            websocket: websocket associated with the client
+            compressor: the server's frame compressor, used if the client negotiated its codec
+            full_state: whether the client is trusted with the whole game in plain JSON frames, for debugging.
+                Otherwise every frame only holds the view of the client's seat.
+        """
+        self.websocket = websocket
+        subprotocol = getattr(websocket, "subprotocol", None)
+        self.binary = wire_format(subprotocol) == BINARY_SUBPROTOCOL
+        self.compressor = compressor if compressor is not None and codec_of(subprotocol) == compressor.codec else None
+        self.seat = None
+        self.delta = False
+        self.state = None
+        self.version = -1
+        self.lagging = False  # whether broadcasts skip the client until it catches up
+        self.skipped_frames = 0
+        self.max_buffered = 0
+        self.bucket = None  # TokenBucket limiting the rate of the client's requests, if any
+        self.full_state = full_state
+
+    @property
+    def buffered(self) -> int:
+        """
+        Returns: the number of bytes waiting in the write buffer of the connection. The highest value seen is kept in
+            max_buffered.
+        """
+        buffered = self.websocket.transport.get_write_buffer_size()
+        self.max_buffered = max(self.max_buffered, buffered)
+        return buffered
+
+    def metrics(self) -> dict:
+        """
+        Returns: the seat of the client, the bytes waiting to be sent to it now and at most, whether it is lagging and
+            the number of broadcast frames it skipped.
+        """
+        return {"seat": self.seat, "buffered": self.buffered, "max_buffered": self.max_buffered,
+                "lagging": self.lagging, "skipped_frames": self.skipped_frames}
+
+    def decode_request(self, message: Union[bytes, str]) -> dict:
+        """Decodes a request received from the client in the wire format of the connection.
+
+        Args:
+            message: the websocket message holding the request
+
+        Returns: the request as a dictionary, holding the seat of the client. Requests from binary connections always
+            ask for binary frames.
+        """
+        if self.binary:
+            request = decode_request(message)
+            request["get_binary"] = True
+        else:
+            request = json.loads(message)
+        request["seat"] = self.seat
+        return request
+
+    def update_preferences(self, request: dict):
+        """Records the state format a client asked for in a request, and the game version it acknowledged. Pickles
+        are never sent over the network, so get_pickle asks for state frames like get_state.
+
+        Args:
+            request: a request received from the client
+        """
+        if "delta" in request:
+            self.delta = request["delta"]
+        for key in ("get_pickle", "get_state"):
+            if key in request:
+                self.state = request[key]
+        if "ack" in request:
+            self.version = request["ack"]
+
+    @property
+    def coalesces(self) -> bool:
+        """
+        Returns: whether the client can be sent one state per batch of commands. Clients using plain JSON frames
+            expect a frame for each command that changes the game.
+        """
+        return self.binary or self.delta or bool(self.state)
+
+    def state_frame(self, game: Yugioh, default: dict = None) -> Union[bytes, str]:
+        """Encodes the state of a game for this client.
+
+        Args:
+            game: the game to encode
+            default: request whose format is used if the client has not asked for a format yet, usually the request
+                that changed the game. A delta asked for there is sent as a full delta (base -1), since the version
+                the client has is unknown.
+
+        Returns: a binary snapshot frame for binary connections, a delta frame for clients using delta frames,
+            otherwise a state frame. Every frame only holds the view of the client's seat, except the plain JSON of
+            the whole game sent to full_state clients that asked for no other format.
+        """
+        if self.binary:
+            return game.binary_frame(self.seat)
+        if self.delta:
+            frame = game.state_frame(self.version, self.seat)
+            self.version = game.version
+            return frame
+        if self.state is None and default is not None:
+            if default.get("delta", False):
+                return game.state_frame(-1, self.seat)
+            if default.get("get_state", False):
+                return game.snapshot_frame(self.seat)
+        if self.state or not self.full_state:
+            return game.snapshot_frame(self.seat)
+        return game.json_frame()
+
+    def encode_frame(self, frame: bytes) -> bytes:
+        """
+        Returns: the frame as sent on this connection, compressed if the client negotiated compression.
+        """
+        if self.compressor is None:
+            return frame
+        return self.compressor.compress(frame)
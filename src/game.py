@@ -28,6 +28,7 @@ class GameController:
         self.session_id = session_id
         self.game_status = GameStatus.WAITING
         self.is_first_turn = True
+        self.version = 0
 
     def determine_first_player(self):
         """Sets starting turn order.
@@ -0,0 +1,186 @@
+# Matchmaking for YugiohServer: players waiting for an opponent are kept in a FIFO queue and paired as soon as a second
+# player arrives. Tickets of players that leave the queue (timeout or closed connection) are only marked as cancelled
+# and skipped when they reach the front, so joining, pairing and leaving are all O(1).
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+MATCH_TIMEOUT = 300
+
+
+class MatchmakingError(Exception):
+    """Raised when a player leaves the queue without being matched.
+    """
+
+
+class MatchTimeout(MatchmakingError):
+    """Raised when no opponent was found before the timeout.
+    """
+
+
+class MatchCancelled(MatchmakingError):
+    """Raised when the player's connection closed while waiting for an opponent.
+    """
+
+
+class MatchmakerClosed(MatchmakingError):
+    """Raised when the matchmaker stopped pairing players, because the server is draining.
+    """
+
+
+class SessionIdAllocator:
+    """Allocates session ids that are never reused, so a late message for an old session cannot reach a new one.
+    """
+    def __init__(self, start: int = 1, step: int = 1):
+        """
+        Args:
+            start: the first session id to allocate.
+            step: difference between consecutive ids. Shards of a server use the same step and different starts, so
+                their ids never collide.
+        """
+        self.start = start
+        self.next = start
+        self.step = step
+
+    def allocate(self) -> int:
+        """
+        Returns: a new session id, greater than every id allocated or reserved before.
+        """
+        session_id = self.next
+        self.next += self.step
+        return session_id
+
+    def owns(self, session_id: int) -> bool:
+        """
+        Returns: whether a session id is one this allocator allocates, such as the ids of the sessions of a shard.
+        """
+        return session_id >= self.start and (session_id - self.start) % self.step == 0
+
+    def reserve(self, session_id: int):
+        """Makes sure a session id used before the server restarted is never allocated again.
+        """
+        if session_id >= self.next:
+            self.next += (session_id - self.next) // self.step * self.step + self.step
+
+
+@dataclass(frozen=True)
+class Match:
+    """The game a player was matched into.
+    """
+    session_id: int
+    seat: int
+
+
+@dataclass(eq=False)
+class Ticket:
+    """A player's place in the matchmaking queue.
+    """
+    player: object
+    match: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    cancelled: bool = False
+
+
+class Matchmaker:
+    """Pairs waiting players in arrival order. The player who waited gets seat 0 and the newcomer seat 1.
+    """
+    def __init__(self, session_ids: SessionIdAllocator = None, timeout: float = MATCH_TIMEOUT,
+                 on_match: Callable[[int, list], None] = None, on_leave: Callable[[object], None] = None):
+        """
+        Args:
+            session_ids: allocator of the session ids of new games.
+            timeout: default number of seconds a player waits for an opponent.
+            on_match: called with the session id and the list of players by seat when two players are paired, before
+                either of them is told about the match.
+            on_leave: called with the player when a player leaves the queue without being matched.
+        """
+        self.session_ids = session_ids or SessionIdAllocator()
+        self.timeout = timeout
+        self.on_match = on_match
+        self.on_leave = on_leave
+        self.queue: asyncio.Queue[Ticket] = asyncio.Queue()
+        self.waiting = 0
+        self.matches = 0
+        self.closed = False
+
+    def join(self, player) -> Ticket:
+        """Adds a player to the queue, or pairs them with the player who has waited longest.
+
+        Args:
+            player: the player, usually their websocket.
+
+        Returns: the player's ticket. Its match is already set if the player was paired.
+        """
+        ticket = Ticket(player)
+        if self.closed:
+            ticket.match.set_exception(MatchmakerClosed("No longer pairing players"))
+            return ticket
+        while not self.queue.empty():
+            waiting = self.queue.get_nowait()
+            if waiting.cancelled:
+                continue
+            self.waiting -= 1
+            self.matches += 1
+            session_id = self.session_ids.allocate()
+            if self.on_match is not None:
+                self.on_match(session_id, [waiting.player, player])
+            waiting.match.set_result(Match(session_id, 0))
+            ticket.match.set_result(Match(session_id, 1))
+            return ticket
+        self.queue.put_nowait(ticket)
+        self.waiting += 1
+        return ticket
+
+    def cancel(self, ticket: Ticket):
+        """Removes a player from the queue. Does nothing if the player was already matched.
+        """
+        if ticket.match.done() or ticket.cancelled:
+            return
+        ticket.cancelled = True
+        self.waiting -= 1
+        if self.on_leave is not None:
+            self.on_leave(ticket.player)
+
+    def close(self):
+        """Stops pairing players. The players waiting, and those joining from now on, get MatchmakerClosed.
+        """
+        self.closed = True
+        while not self.queue.empty():
+            waiting = self.queue.get_nowait()
+            if not waiting.cancelled:
+                self.waiting -= 1
+                waiting.match.set_exception(MatchmakerClosed("No longer pairing players"))
+
+    async def find_match(self, player, closed: Optional[Awaitable] = None, timeout: float = None) -> Match:
+        """Waits until the player is paired with an opponent.
+
+        Args:
+            player: the player, usually their websocket.
+            closed: awaitable that completes when the player's connection closes, such as websocket.wait_closed().
+            timeout: number of seconds to wait. Defaults to the matchmaker's timeout.
+
+        Returns: the player's match
+
+        Raises:
+            MatchTimeout: no opponent was found in time.
+            MatchCancelled: closed completed before an opponent was found.
+            MatchmakerClosed: the matchmaker was closed before an opponent was found.
+        """
+        ticket = self.join(player)
+        if ticket.match.done():
+            if asyncio.iscoroutine(closed):
+                closed.close()
+            return ticket.match.result()
+        closed_task = asyncio.ensure_future(closed) if closed is not None else None
+        try:
+            waiters = {ticket.match} if closed_task is None else {ticket.match, closed_task}
+            await asyncio.wait(waiters, timeout=self.timeout if timeout is None else timeout,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if ticket.match.done():
+                return ticket.match.result()
+            if closed_task is not None and closed_task.done():
+                raise MatchCancelled("Connection closed while waiting for an opponent")
+            raise MatchTimeout("No opponent found")
+        finally:
+            self.cancel(ticket)
+            if closed_task is not None and not closed_task.done():
+                closed_task.cancel()
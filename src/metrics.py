@@ -0,0 +1,270 @@
+# Instrumentation of YugiohServer: command latency histograms by operation and move, bytes and messages received and
+# sent by message type, and event loop lag, as sampled by the admission controller (see src.admission), together with
+# gauges read from the server when the metrics are collected.
+# Recording only updates preallocated counters, so metrics stay on in production.
+#
+# MetricsExporter serves the metrics over HTTP, in the Prometheus text format at /metrics and as JSON at
+# /metrics.json, and can dump the JSON to a file periodically.
+import asyncio
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Optional
+
+LATENCY_BUCKETS = (50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3, 1.0)
+LOOP_LAG_BUCKETS = (1e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3, 500e-3, 1.0, 5.0)
+DUMP_INTERVAL = 60
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9555
+PORT_VARIABLE = "YUGIOH_METRICS_PORT"
+DUMP_VARIABLE = "YUGIOH_METRICS_FILE"
+DUMP_INTERVAL_VARIABLE = "YUGIOH_METRICS_INTERVAL"
+
+
+class Histogram:
+    """Counts observed values in fixed buckets.
+    """
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        """
+        Args:
+            bounds: upper bounds of the buckets, in increasing order. Values above the last bound are counted in an
+                extra bucket.
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """
+        Returns: the number of values at most each bound, as Prometheus "le" labels and counts, ending with "+Inf".
+        """
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return buckets
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "buckets": dict(self.cumulative())}
+
+
+class Metrics:
+    """The metrics of a server.
+    """
+    def __init__(self):
+        self.commands: dict[tuple[str, str], Histogram] = {}  # by operation and move ("" for other operations)
+        self.errors: dict[tuple[str, str], int] = {}
+        self.received: dict[str, list[int]] = {}  # messages and bytes, by message type
+        self.sent: dict[str, list[int]] = {}
+        self.loop_lag = Histogram(LOOP_LAG_BUCKETS)
+        self.events: dict[str, int] = {}  # counts of other events, by name
+        self.started = time.time()
+
+    def observe_command(self, operation: str, move: str, seconds: float, failed: bool = False):
+        """Records the time taken to run a command, and whether it failed.
+        """
+        key = (operation, move)
+        histogram = self.commands.get(key)
+        if histogram is None:
+            histogram = self.commands[key] = Histogram()
+        histogram.observe(seconds)
+        if failed:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def count_received(self, message_type: str, size: int):
+        """Records a message received from a client.
+        """
+        self._count(self.received, message_type, 1, size)
+
+    def count_sent(self, message_type: str, size: int, messages: int = 1):
+        """Records a frame sent to one or more clients.
+        """
+        self._count(self.sent, message_type, messages, size * messages)
+
+    def count_event(self, name: str):
+        """Records an event, such as a slow client being disconnected.
+        """
+        self.events[name] = self.events.get(name, 0) + 1
+
+    @staticmethod
+    def _count(counters: dict, message_type: str, messages: int, size: int):
+        counter = counters.get(message_type)
+        if counter is None:
+            counter = counters[message_type] = [0, 0]
+        counter[0] += messages
+        counter[1] += size
+
+    def to_dict(self, gauges: dict = None) -> dict:
+        """
+        Args:
+            gauges: current values read from the server, by name. Values may be dicts of values by label.
+
+        Returns: the metrics as a JSON-serializable dict
+        """
+        return {"time": time.time(), "uptime": time.time() - self.started, "gauges": gauges or {},
+                "commands": {"%s:%s" % key if key[1] else key[0]: dict(histogram.to_dict(),
+                                                                       errors=self.errors.get(key, 0))
+                             for key, histogram in self.commands.items()},
+                "received": {message_type: {"messages": messages, "bytes": size}
+                             for message_type, (messages, size) in self.received.items()},
+                "sent": {message_type: {"messages": messages, "bytes": size}
+                         for message_type, (messages, size) in self.sent.items()},
+                "loop_lag": self.loop_lag.to_dict(), "events": dict(self.events)}
+
+    def to_prometheus(self, gauges: dict = None) -> str:
+        """
+        Args:
+            gauges: current values read from the server, by name. Values may be dicts of values by label.
+
+        Returns: the metrics in the Prometheus text exposition format
+        """
+        lines = []
+        lines.append("# TYPE yugioh_command_seconds histogram")
+        for (operation, move), histogram in self.commands.items():
+            _histogram_lines(lines, "yugioh_command_seconds", 'operation="%s",move="%s"' % (operation, move),
+                             histogram)
+        lines.append("# TYPE yugioh_command_errors_total counter")
+        for (operation, move), errors in self.errors.items():
+            lines.append('yugioh_command_errors_total{operation="%s",move="%s"} %d' % (operation, move, errors))
+        for direction, counters in (("received", self.received), ("sent", self.sent)):
+            lines.append("# TYPE yugioh_messages_%s_total counter" % direction)
+            lines.extend('yugioh_messages_%s_total{type="%s"} %d' % (direction, message_type, messages)
+                         for message_type, (messages, _) in counters.items())
+            lines.append("# TYPE yugioh_bytes_%s_total counter" % direction)
+            lines.extend('yugioh_bytes_%s_total{type="%s"} %d' % (direction, message_type, size)
+                         for message_type, (_, size) in counters.items())
+        for name, count in self.events.items():
+            lines.append("# TYPE yugioh_%s_total counter" % name)
+            lines.append("yugioh_%s_total %d" % (name, count))
+        lines.append("# TYPE yugioh_loop_lag_seconds histogram")
+        _histogram_lines(lines, "yugioh_loop_lag_seconds", "", self.loop_lag)
+        for name, value in (gauges or {}).items():
+            lines.append("# TYPE yugioh_%s gauge" % name)
+            if isinstance(value, dict):
+                label = "state" if name == "sessions" else "type"
+                lines.extend('yugioh_%s{%s="%s"} %s' % (name, label, key, item) for key, item in value.items())
+            else:
+                lines.append("yugioh_%s %s" % (name, value))
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(lines: list, name: str, labels: str, histogram: Histogram):
+    prefix = labels + "," if labels else ""
+    for bound, count in histogram.cumulative():
+        lines.append('%s_bucket{%sle="%s"} %d' % (name, prefix, bound, count))
+    labels = "{%s}" % labels if labels else ""
+    lines.append("%s_sum%s %r" % (name, labels, histogram.sum))
+    lines.append("%s_count%s %d" % (name, labels, histogram.count))
+
+
+class MetricsExporter:
+    """Serves the metrics of a server over HTTP and dumps them to a file periodically.
+    """
+    def __init__(self, metrics: Metrics, gauges: Callable[[], dict], port: Optional[int] = METRICS_PORT,
+                 dump_path: str = None, dump_interval: float = DUMP_INTERVAL, host: str = METRICS_HOST):
+        """
+        Args:
+            metrics: the metrics to export
+            gauges: returns the current gauges of the server, by name
+            port: port of the HTTP endpoint, or None to not serve the metrics
+            dump_path: file the JSON metrics are written to every dump_interval seconds, or None to not dump them
+            dump_interval: seconds between dumps
+            host: address of the HTTP endpoint. It only listens locally by default.
+        """
+        self.metrics = metrics
+        self.gauges = gauges
+        self.port = port
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.host = host
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answers an HTTP request for /metrics or /metrics.json.
+        """
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # headers
+            parts = request_line.split()
+            path = parts[1].decode("latin-1") if len(parts) == 3 else ""
+            if path == "/metrics":
+                status, content_type = "200 OK", "text/plain; version=0.0.4"
+                body = self.metrics.to_prometheus(self.gauges()).encode("utf-8")
+            elif path == "/metrics.json":
+                status, content_type = "200 OK", "application/json"
+                body = json.dumps(self.metrics.to_dict(self.gauges())).encode("utf-8")
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+            writer.write(("HTTP/1.0 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n\r\n"
+                          % (status, content_type, len(body))).encode("latin-1") + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def dump(self):
+        """Writes the JSON metrics to dump_path, replacing the previous dump at once.
+        """
+        temporary = self.dump_path + ".tmp"
+        with open(temporary, 'w') as outfile:
+            json.dump(self.metrics.to_dict(self.gauges()), outfile)
+        os.replace(temporary, self.dump_path)
+
+    async def run_dumps(self):
+        while True:
+            await asyncio.sleep(self.dump_interval)
+            try:
+                self.dump()
+            except OSError as error:
+                logging.error("Could not dump metrics to %s: %s", self.dump_path, error)
+
+    async def run(self):
+        """Serves the metrics and dumps them, forever.
+        """
+        server = None
+        if self.port is not None:
+            try:
+                server = await asyncio.start_server(self.handle, self.host, self.port)
+                logging.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+            except OSError as error:
+                logging.error("Could not serve metrics on %s:%d: %s", self.host, self.port, error)
+        try:
+            if self.dump_path:
+                await self.run_dumps()
+            else:
+                await asyncio.get_running_loop().create_future()  # serves the metrics until cancelled
+        finally:
+            if server is not None:
+                server.close()
+
+
+def exporter_from_environment(metrics: Metrics, gauges: Callable[[], dict], instance: int = None) -> MetricsExporter:
+    """
+    Args:
+        metrics: the metrics to export
+        gauges: returns the current gauges of the server, by name
+        instance: index of the shard exporting the metrics, if the server is sharded. Shard i serves its metrics on
+            the metrics port + i and dumps them to the dump file suffixed with .i.
+
+    Returns: a MetricsExporter configured by the environment: YUGIOH_METRICS_PORT sets the port of the HTTP endpoint
+        (none if empty), YUGIOH_METRICS_FILE the file the metrics are dumped to (not dumped if not set) and
+        YUGIOH_METRICS_INTERVAL the seconds between dumps.
+    """
+    port = os.environ.get(PORT_VARIABLE, str(METRICS_PORT))
+    port = int(port) if port else None
+    dump_path = os.environ.get(DUMP_VARIABLE) or None
+    if instance is not None:
+        port = port + instance if port is not None else None
+        dump_path = "%s.%d" % (dump_path, instance) if dump_path else None
+    return MetricsExporter(metrics, gauges, port, dump_path, float(os.environ.get(DUMP_INTERVAL_VARIABLE,
+                                                                                  DUMP_INTERVAL)))
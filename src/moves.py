@@ -0,0 +1,217 @@
+# Table-driven dispatch of the requests YugiohServer receives. Every operation and every move of an update is declared
+# once in OPERATIONS and MOVES, with the arguments it takes, how it is logged and which sockets receive the game state
+# after it. Each operation and move also has a fixed code, its number in binary request frames. Requests are decoded into Command
+# objects in a single pass by decode_command, which rejects unknown moves and bad arguments before they reach
+# GameController. An update_batch request holds a list of moves, decoded into the commands of its Command, which Yugioh
+# applies all or nothing.
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from src.state_sync import MAX_PLAYERS, MAX_ZONE_SIZE
+
+ALL = "all"
+REQUESTER = "requester"
+
+CREATE = "create"
+READ = "read"
+UPDATE = "update"
+DELETE = "delete"
+UPDATE_BATCH = "update_batch"
+
+MAX_BATCH_MOVES = 64
+
+
+class InvalidCommand(ValueError):
+    """Raised when a request names an unknown operation or move, or has bad arguments.
+    """
+
+
+class BatchFailed(ValueError):
+    """Raised when a move of an update_batch request fails. None of the moves of the batch are applied.
+    """
+    def __init__(self, index: int, move: str, error: Exception):
+        """
+        Args:
+            index: index of the failed move in the batch
+            move: name of the failed move
+            error: the error raised by the move
+        """
+        super().__init__("Move %d of the batch (%s) failed: %r" % (index, move, error))
+        self.index = index
+        self.move = move
+
+
+@dataclass(frozen=True)
+class Operation:
+    """A CRUD operation of Yugioh.
+    """
+    name: str
+    code: int  # number of the operation in binary request frames (see src.protocol), which must never be reused
+    method: str  # name of the Yugioh method running the operation
+    audience: str = ALL  # ALL sockets of the game or only the REQUESTER receive the state after the operation
+
+
+@dataclass(frozen=True)
+class Move:
+    """A move of an update request.
+    """
+    name: str
+    code: int  # number of the move in binary request frames (see src.protocol), which must never be reused
+    play: Callable  # called with the Yugioh game and the Command
+    args: tuple = ()  # names of the integer arguments of the move
+    optional: int = 0  # number of trailing arguments that may be left out
+    log: Optional[str] = None  # name of the GameLogger method writing the log message, or None to not log the move
+    audience: str = ALL
+    needs_player: bool = False  # whether the request must say which player makes the move
+
+
+@dataclass(frozen=True)
+class Command:
+    """A decoded request.
+    """
+    operation: Operation
+    request: dict  # the request the command was decoded from, which also holds the format of the reply
+    move: Optional[Move] = None
+    player: Optional[int] = None
+    args: tuple = ()
+    commands: tuple = ()  # the moves of an update_batch request, as update Commands
+
+    @property
+    def audience(self) -> str:
+        """
+        Returns: ALL if every socket of the game receives the state after the command, or REQUESTER if only the
+            socket that sent it does. A batch is seen by ALL if any of its moves is.
+        """
+        if self.commands:
+            return ALL if any(command.audience == ALL for command in self.commands) else REQUESTER
+        return self.move.audience if self.move is not None else self.operation.audience
+
+
+OPERATIONS: dict[str, Operation] = {operation.name: operation for operation in [
+    Operation(CREATE, 0, "create_game"),
+    Operation(READ, 1, "read_game", REQUESTER),
+    Operation(UPDATE, 2, "update_game"),
+    Operation(DELETE, 3, "delete_game"),
+    Operation(UPDATE_BATCH, 4, "update_batch"),
+]}
+
+MOVES: dict[str, Move] = {}
+
+
+def register_move(name: str, code: int, args: tuple = (), optional: int = 0, log: str = None, audience: str = ALL,
+                  needs_player: bool = False) -> Callable:
+    """Adds a move to MOVES, the registry of moves update requests may name.
+
+    Args:
+        name: the name of the move in requests.
+        code: the number of the move in binary request frames, from 1. Codes of removed moves must not be reused.
+        args: names of the integer arguments of the move, in order.
+        optional: number of trailing arguments that may be left out.
+        log: name of the GameLogger method writing the log message of the move, or None to not log it.
+        audience: ALL if every socket of the game receives the state after the move, REQUESTER if only the sender.
+        needs_player: whether the request must say which player makes the move.
+
+    Returns: a decorator registering the function playing the move, which is called with the Yugioh game and the
+        Command.
+    """
+    if any(move.code == code for move in MOVES.values()):
+        raise ValueError("Move code %d is already used" % code)
+
+    def decorator(play: Callable) -> Callable:
+        MOVES[name] = Move(name, code, play, tuple(args), optional, log, audience, needs_player)
+        return play
+    return decorator
+
+
+@register_move("draw_card", 1, ("count",), optional=1, audience=REQUESTER, needs_player=True)
+def draw_card(yugioh, command: Command):
+    yugioh.game.players[command.player].draw_card(*command.args)
+
+
+@register_move("change_turn", 10)
+def change_turn(yugioh, command: Command):
+    yugioh.current_turn += 1
+    yugioh.game.change_turn()
+
+
+@register_move("normal_summon", 2, ("hand_idx",), log="log_normal_summon_message")
+def normal_summon(yugioh, command: Command):
+    yugioh.game.normal_summon(*command.args)
+
+
+@register_move("normal_set", 3, ("hand_idx",), log="log_normal_set_message")
+def normal_set(yugioh, command: Command):
+    yugioh.game.normal_set(*command.args)
+
+
+@register_move("flip_summon", 4, ("field_idx",), log="log_flip_summon_message")
+def flip_summon(yugioh, command: Command):
+    yugioh.game.flip_summon(*command.args)
+
+
+@register_move("tribute_summon", 5, ("hand_idx", "tribute1_idx", "tribute2_idx"), log="log_tribute_summon_message")
+def tribute_summon(yugioh, command: Command):
+    yugioh.game.tribute_summon_monster(*command.args)
+
+
+@register_move("attack_monster", 6, ("attacking_monster", "attacked_monster"), log="log_attack_monster_message")
+def attack_monster(yugioh, command: Command):
+    yugioh.game.attack_monster(*command.args)
+
+
+@register_move("attack_player", 7, ("attacking_monster",), log="log_attack_player_message")
+def attack_player(yugioh, command: Command):
+    yugioh.game.attack_player(*command.args)
+
+
+@register_move("normal_spell", 8, ("spell_idx",), log="log_activate_spell_message")
+def normal_spell(yugioh, command: Command):
+    yugioh.game.activate_spell(*command.args)
+
+
+@register_move("equip_spell", 9, ("target_monster_idx", "spell_idx"), log="log_activate_equip_spell_message")
+def equip_spell(yugioh, command: Command):
+    yugioh.game.equip_spell(*command.args)
+
+
+def _is_index(value, limit: int) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value < limit
+
+
+def decode_command(request: dict, operation: str = None) -> Command:
+    """Decodes a request into a Command.
+
+    Args:
+        request: a request to Yugioh, as described in its CRUD methods.
+        operation: the operation of the request, if it is not given by request["operation"].
+
+    Returns: the command
+
+    Raises:
+        InvalidCommand: the operation or move is unknown, the player is not a seat of the game, or the arguments
+            are not the move's arguments. For update_batch requests, moves is not a list of 1 to MAX_BATCH_MOVES
+            moves or one of them is invalid.
+    """
+    if not isinstance(request, dict):
+        raise InvalidCommand("Request must be an object")
+    operation = OPERATIONS.get(operation or request.get("operation"))
+    if operation is None:
+        raise InvalidCommand("Invalid operation")
+    if operation.name == UPDATE_BATCH:
+        moves = request.get("moves")
+        if not isinstance(moves, list) or not 1 <= len(moves) <= MAX_BATCH_MOVES:
+            raise InvalidCommand("update_batch takes a list of 1 to %d moves" % MAX_BATCH_MOVES)
+        return Command(operation, request, commands=tuple(decode_command(move, UPDATE) for move in moves))
+    if operation.name != UPDATE:
+        return Command(operation, request)
+    move = MOVES.get(request.get("move"))
+    if move is None:
+        raise InvalidCommand("Invalid move")
+    player = request.get("player")
+    if player is None and move.needs_player or player is not None and not _is_index(player, MAX_PLAYERS):
+        raise InvalidCommand("Invalid player for %s" % move.name)
+    args = request.get("args", [])
+    if not isinstance(args, list) or not len(move.args) - move.optional <= len(args) <= len(move.args) or \
+            not all(_is_index(arg, MAX_ZONE_SIZE) for arg in args):
+        raise InvalidCommand("%s takes arguments %s" % (move.name, ", ".join(move.args) or "none"))
+    return Command(operation, request, move, player, tuple(args))
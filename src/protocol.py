@@ -0,0 +1,397 @@
+# Versioned binary wire format for game state snapshots and requests. A client opts in by offering BINARY_SUBPROTOCOL
+# when it opens its websocket; connections without a subprotocol keep using JSON (and state or delta frames). Either
+# format can be combined with frame compression (see src.compression) as "<format>+<codec>".
+#
+# Cards are sent as their id in the compiled card catalog (see src.catalog_compiler). Snapshots carry the checksum of
+# the catalog they were encoded with, so a client using another catalog rejects them instead of misreading card ids.
+#
+# Snapshot frame (little-endian):
+#   header   "YG", format version, frame type, catalog checksum, state version, session id, game status,
+#            current player, other player, is first turn, player count
+#   player   name (u16 length + utf-8), life points (u32), then each zone of CARD_ZONES as a u16 count of cards. A
+#            hidden zone (see src.state_sync.view_game) has HIDDEN_ZONE set in its count and no cards.
+#   card     u16 card id (EMPTY_SLOT for an empty field slot, HIDDEN_SLOT for a hidden monster) and a u8 of STATE_*
+#            flags, followed by the attack and defense points if STATE_STATS is set, the card id of the equipped spell
+#            if STATE_EQUIPPED_SPELL is set and the zone and index of the equipped monster if STATE_EQUIPPED_MONSTER
+#            is set
+#
+# Request frame:
+#   header   format version, operation code and move code (see src.moves, 0 for no move), flags, session id, player, argument
+#            count, then i16 arguments
+#   create   player place (NO_PLAYER when not given), player name (u16 length + utf-8), u16 deck size and card ids
+#   batch    u16 move count, then the move, flags, player and argument count of each move and its i16 arguments
+import struct
+
+from src.card import Monster, MonsterTemplate, card_catalog
+from src.moves import MOVES, OPERATIONS
+from src.state_sync import CARD_ZONES, HIDDEN_MONSTER, REFERENCE_ZONES
+
+BINARY_SUBPROTOCOL = "yugioh.binary.v1"
+JSON_SUBPROTOCOL = "yugioh.json"
+FORMATS = (BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL)
+
+MAGIC = b'YG'
+FORMAT_VERSION = 1
+SNAPSHOT_FRAME = 1
+
+SNAPSHOT_HEADER = struct.Struct('<2sBBIIiBBBBB')
+PLAYER_HEADER = struct.Struct('<I')
+LENGTH = struct.Struct('<H')
+CARD = struct.Struct('<HB')
+STATS = struct.Struct('<ii')
+REFERENCE = struct.Struct('<BB')
+REQUEST_HEADER = struct.Struct('<BBBBibB')
+MOVE_HEADER = struct.Struct('<BBbB')
+ARG = struct.Struct('<h')
+
+EMPTY_SLOT = 0xFFFF
+HIDDEN_SLOT = 0xFFFE
+HIDDEN_ZONE = 0x8000
+NO_PLAYER = -128
+
+STATE_STATS = 1
+STATE_FACE_DOWN = 2
+STATE_DEF = 4
+STATE_CAN_ATTACK = 8
+STATE_EQUIPPED_SPELL = 16
+STATE_EQUIPPED_MONSTER = 32
+
+OPERATION_NAMES = {operation.code: name for name, operation in OPERATIONS.items()}
+MOVE_NAMES = {move.code: name for name, move in MOVES.items()}  # 0 is no move
+
+REQUEST_HAS_PLAYER = 1
+REQUEST_HAS_ARGS = 2
+REQUEST_GET_GAME_ACTIONS = 4
+
+
+class ProtocolError(ValueError):
+    """Raised when a binary frame is malformed or was encoded with another card catalog.
+    """
+
+
+def subprotocols(codecs=()) -> list:
+    """
+    Args:
+        codecs: the compression codecs available, such as "zlib.0123abcd" (see src.compression)
+
+    Returns: every subprotocol combining a wire format with one of the codecs or with no compression, in order of
+        preference.
+    """
+    return ["%s+%s" % (wire_format, codec) for codec in codecs for wire_format in FORMATS] + list(FORMATS)
+
+
+def select_subprotocol(offered: list, supported: list):
+    """Picks the subprotocol of a new websocket connection. Unlike the websockets default, clients that offer no
+    subprotocol we support are accepted and use the legacy JSON format.
+
+    Args:
+        offered: the subprotocols offered by the client, in its order of preference
+        supported: the subprotocols supported by the server
+
+    Returns: the first offered subprotocol that is supported, or None for the legacy format
+    """
+    for subprotocol in offered:
+        if subprotocol in supported:
+            return subprotocol
+    return None
+
+
+def wire_format(subprotocol) -> str:
+    """
+    Returns: the wire format of a subprotocol, JSON_SUBPROTOCOL for connections without one.
+    """
+    return subprotocol.split("+", 1)[0] if subprotocol else JSON_SUBPROTOCOL
+
+
+def catalog_checksum() -> int:
+    """
+    Returns: the checksum of the card catalog that card ids refer to.
+    """
+    return card_catalog.checksum()
+
+
+def _card_id(card_name: str) -> int:
+    card_id = card_catalog.card_id(card_name)
+    if card_id < 0:
+        raise ProtocolError("Unknown card %s" % card_name)
+    return card_id
+
+
+def _card_name(card_id: int) -> str:
+    try:
+        return card_catalog.template_by_id(card_id).name
+    except IndexError:
+        raise ProtocolError("Unknown card id %d" % card_id) from None
+
+
+def _write_string(value: str, out: bytearray):
+    encoded = value.encode('utf-8')
+    out += LENGTH.pack(len(encoded))
+    out += encoded
+
+
+def _write_card(card, out: bytearray):
+    if card is None:
+        out += CARD.pack(EMPTY_SLOT, 0)
+        return
+    if card == HIDDEN_MONSTER:
+        out += CARD.pack(HIDDEN_SLOT, 0)
+        return
+    if isinstance(card, str):
+        out += CARD.pack(_card_id(card), 0)
+        return
+    flags = 0
+    if "attack_points" in card or "defense_points" in card:
+        flags |= STATE_STATS
+    if card.get("face_pos") == Monster.FACE_DOWN or card.get("position") == "down":
+        flags |= STATE_FACE_DOWN
+    if card.get("battle_pos") == Monster.DEF:
+        flags |= STATE_DEF
+    if card.get("can_attack"):
+        flags |= STATE_CAN_ATTACK
+    if card.get("equipped_spell"):
+        flags |= STATE_EQUIPPED_SPELL
+    if card.get("equipped_monster"):
+        flags |= STATE_EQUIPPED_MONSTER
+    card_id = _card_id(card["name"])
+    out += CARD.pack(card_id, flags)
+    if flags & STATE_STATS:
+        base = card_catalog.template_by_id(card_id)
+        out += STATS.pack(card.get("attack_points", base.attack_points),
+                          card.get("defense_points", base.defense_points))
+    if flags & STATE_EQUIPPED_SPELL:
+        out += LENGTH.pack(_card_id(card["equipped_spell"]))
+    if flags & STATE_EQUIPPED_MONSTER:
+        zone, idx = card["equipped_monster"]
+        out += REFERENCE.pack(REFERENCE_ZONES.index(zone), idx)
+
+
+def encode_snapshot(snapshot: dict) -> bytes:
+    """Encodes a game snapshot as a binary snapshot frame.
+
+    Args:
+        snapshot: a game snapshot, as returned by src.state_sync.snapshot_game
+
+    Returns: the binary snapshot frame
+    """
+    out = bytearray(SNAPSHOT_HEADER.pack(MAGIC, FORMAT_VERSION, SNAPSHOT_FRAME, catalog_checksum(),
+                                         snapshot["version"], snapshot["session_id"] or 0, snapshot["game_status"],
+                                         snapshot["current_player"], snapshot["other_player"],
+                                         snapshot["is_first_turn"], len(snapshot["players"])))
+    for player in snapshot["players"]:
+        _write_string(player["name"], out)
+        out += PLAYER_HEADER.pack(player["life_points"])
+        for zone in CARD_ZONES:
+            if isinstance(player[zone], int):
+                out += LENGTH.pack(HIDDEN_ZONE | player[zone])
+                continue
+            out += LENGTH.pack(len(player[zone]))
+            for card in player[zone]:
+                _write_card(card, out)
+    return bytes(out)
+
+
+def is_snapshot_frame(data: bytes) -> bool:
+    """
+    Returns: True if data is a binary snapshot frame
+    """
+    return isinstance(data, (bytes, bytearray)) and data[:2] == MAGIC
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, layout: struct.Struct) -> tuple:
+        try:
+            values = layout.unpack_from(self.data, self.offset)
+        except struct.error as error:
+            raise ProtocolError("Truncated frame") from error
+        self.offset += layout.size
+        return values
+
+    def string(self) -> str:
+        length, = self.unpack(LENGTH)
+        value = self.data[self.offset:self.offset + length]
+        if len(value) != length:
+            raise ProtocolError("Truncated frame")
+        self.offset += length
+        return bytes(value).decode('utf-8')
+
+
+def _read_card(reader: _Reader):
+    card_id, flags = reader.unpack(CARD)
+    if card_id == EMPTY_SLOT:
+        return None
+    if card_id == HIDDEN_SLOT:
+        return HIDDEN_MONSTER
+    name = _card_name(card_id)
+    if not flags:
+        return name
+    card = {"name": name}
+    is_monster = isinstance(card_catalog.template_by_id(card_id), MonsterTemplate)
+    if flags & STATE_STATS:
+        card["attack_points"], card["defense_points"] = reader.unpack(STATS)
+    if flags & STATE_FACE_DOWN:
+        if is_monster:
+            card["face_pos"] = Monster.FACE_DOWN
+        else:
+            card["position"] = "down"
+    if flags & STATE_DEF:
+        card["battle_pos"] = Monster.DEF
+    if flags & STATE_CAN_ATTACK:
+        card["can_attack"] = True
+    if flags & STATE_EQUIPPED_SPELL:
+        card["equipped_spell"] = _card_name(reader.unpack(LENGTH)[0])
+    if flags & STATE_EQUIPPED_MONSTER:
+        zone, idx = reader.unpack(REFERENCE)
+        card["equipped_monster"] = [REFERENCE_ZONES[zone], idx]
+    return card
+
+
+def decode_snapshot(data: bytes) -> dict:
+    """Decodes a binary snapshot frame.
+
+    Args:
+        data: the binary snapshot frame
+
+    Returns: the game snapshot, which src.state_sync.game_from_snapshot turns into a GameController
+
+    Raises:
+        ProtocolError: the frame is malformed, uses another format version or another card catalog
+    """
+    reader = _Reader(data)
+    (magic, version, frame_type, checksum, state_version, session_id, game_status, current_player, other_player,
+     is_first_turn, player_count) = reader.unpack(SNAPSHOT_HEADER)
+    if magic != MAGIC or version != FORMAT_VERSION or frame_type != SNAPSHOT_FRAME:
+        raise ProtocolError("Unknown frame format")
+    if checksum != catalog_checksum():
+        raise ProtocolError("Frame was encoded with another card catalog")
+    players = []
+    for _ in range(player_count):
+        player = {"name": reader.string(), "life_points": reader.unpack(PLAYER_HEADER)[0]}
+        for zone in CARD_ZONES:
+            count, = reader.unpack(LENGTH)
+            if count & HIDDEN_ZONE:
+                player[zone] = count & ~HIDDEN_ZONE
+            else:
+                player[zone] = [_read_card(reader) for _ in range(count)]
+        players.append(player)
+    return {"version": state_version, "session_id": session_id, "game_status": game_status,
+            "current_player": current_player, "other_player": other_player, "is_first_turn": bool(is_first_turn),
+            "players": players}
+
+
+def _request_flags(request: dict) -> int:
+    flags = 0
+    if "player" in request:
+        flags |= REQUEST_HAS_PLAYER
+    if "args" in request:
+        flags |= REQUEST_HAS_ARGS
+    if request.get("get_game_actions", False):
+        flags |= REQUEST_GET_GAME_ACTIONS
+    return flags
+
+
+def _operation_code(name) -> int:
+    """
+    Returns: the code of an operation in request frames.
+    """
+    if name not in OPERATIONS:
+        raise ProtocolError("Unknown operation %r" % name)
+    return OPERATIONS[name].code
+
+
+def _move_code(name) -> int:
+    """
+    Returns: the code of a move in request frames, 0 for requests without a move.
+    """
+    if not name:
+        return 0
+    if name not in MOVES:
+        raise ProtocolError("Unknown move %r" % name)
+    return MOVES[name].code
+
+
+def _read_move(reader: _Reader) -> dict:
+    move, flags, player, arg_count = reader.unpack(MOVE_HEADER)
+    if move not in MOVE_NAMES:
+        raise ProtocolError("Unknown move")
+    request = {"move": MOVE_NAMES[move]}
+    if flags & REQUEST_HAS_PLAYER:
+        request["player"] = player
+    args = [reader.unpack(ARG)[0] for _ in range(arg_count)]
+    if flags & REQUEST_HAS_ARGS:
+        request["args"] = args
+    return request
+
+
+def encode_request(request: dict) -> bytes:
+    """Encodes a request as a binary request frame. Keys other than those listed in Yugioh's CRUD methods are
+    dropped, since binary connections always receive binary snapshots.
+
+    Args:
+        request: a request, as sent to YugiohServer in JSON
+
+    Returns: the binary request frame
+    """
+    args = request.get("args", [])
+    out = bytearray(REQUEST_HEADER.pack(FORMAT_VERSION, _operation_code(request["operation"]),
+                                        _move_code(request.get("move")), _request_flags(request),
+                                        request.get("session_id", 0), request.get("player", 0), len(args)))
+    for arg in args:
+        out += ARG.pack(arg)
+    if request["operation"] == "update_batch":
+        out += LENGTH.pack(len(request["moves"]))
+        for move in request["moves"]:
+            move_args = move.get("args", [])
+            out += MOVE_HEADER.pack(_move_code(move["move"]), _request_flags(move), move.get("player", 0),
+                                    len(move_args))
+            for arg in move_args:
+                out += ARG.pack(arg)
+    if request["operation"] == "create":
+        out += struct.pack('<b', request.get("player_place", NO_PLAYER))
+        _write_string(request["player_name"], out)
+        out += LENGTH.pack(len(request["deck"]))
+        for card_name in request["deck"]:
+            out += LENGTH.pack(_card_id(card_name))
+    return bytes(out)
+
+
+def decode_request(data: bytes) -> dict:
+    """Decodes a binary request frame.
+
+    Args:
+        data: the binary request frame
+
+    Returns: the request as a dictionary, in the same form as a JSON request
+
+    Raises:
+        ProtocolError: the frame is malformed or uses another format version
+    """
+    reader = _Reader(data)
+    version, operation, move, flags, session_id, player, arg_count = reader.unpack(REQUEST_HEADER)
+    if version != FORMAT_VERSION or operation not in OPERATION_NAMES or (move and move not in MOVE_NAMES):
+        raise ProtocolError("Unknown request format")
+    request = {"operation": OPERATION_NAMES[operation], "session_id": session_id}
+    if move:
+        request["move"] = MOVE_NAMES[move]
+    if flags & REQUEST_HAS_PLAYER:
+        request["player"] = player
+    args = [reader.unpack(ARG)[0] for _ in range(arg_count)]
+    if flags & REQUEST_HAS_ARGS:
+        request["args"] = args
+    if flags & REQUEST_GET_GAME_ACTIONS:
+        request["get_game_actions"] = True
+    if request["operation"] == "update_batch":
+        move_count, = reader.unpack(LENGTH)
+        request["moves"] = [_read_move(reader) for _ in range(move_count)]
+    if request["operation"] == "create":
+        player_place, = reader.unpack(struct.Struct('<b'))
+        if player_place != NO_PLAYER:
+            request["player_place"] = player_place
+        request["player_name"] = reader.string()
+        deck_size, = reader.unpack(LENGTH)
+        request["deck"] = [_card_name(reader.unpack(LENGTH)[0]) for _ in range(deck_size)]
+    return request
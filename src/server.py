@@ -4,26 +4,83 @@
 import asyncio
 import json
 import logging
+import os
+import re
+import signal
 import socket
+import time
 from collections import defaultdict
+from typing import Awaitable, Callable, Optional
 
 import websockets
+from websockets.protocol import State
 
-from src.yugioh import Yugioh
+from src.admission import AdmissionController, AdmissionLimits, admission_limits_from_environment
+from src.checkpoint import CheckpointStore, checkpoints_from_environment
+from src.connection import ClientConnection, SendLimits, full_state_from_environment, send_limits_from_environment
+from src.compression import load_compressor
+from src.metrics import Metrics, exporter_from_environment
+from src.matchmaking import Match, MatchCancelled, Matchmaker, MatchmakerClosed, MatchTimeout, SessionIdAllocator
+from src.moves import ALL, READ, BatchFailed, InvalidCommand, decode_command
+from src.protocol import select_subprotocol, subprotocols
+from src.state_sync import SPECTATOR
+from src.session import Session, SessionActor, SessionRegistry, registry_from_environment
+from src.yugioh import BatchReply, Yugioh
 
 JOIN = {}
 
-WATCH = {}
+WATCH_PATH = re.compile(r"/watch/(\d+)")
+RESUME_PATH = re.compile(r"/resume/(\d+)\?token=([\w-]+)(?:&ack=(-?\d+))?")
+PING_TIMEOUT = 160
+SLOW_CLIENT_CLOSE_CODE = 1013  # try again later
+OVERLOADED_CLOSE_CODE = 1013  # try again later
+RESTART_CLOSE_CODE = 1012  # service restart
+DRAIN_TIMEOUT = 60
+DRAIN_TIMEOUT_VARIABLE = "YUGIOH_DRAIN_TIMEOUT"
+DRAIN_POLL_INTERVAL = 0.5
+
+# Events of YugiohServer.on_session_event
+SESSION_STARTED = "started"
+SESSION_ENDED = "ended"
+PLAYER_LEFT = "left"
+
+
+def session_of_path(path: str) -> Optional[int]:
+    """
+    Returns: the session a spectator or a reconnecting player asks for in the path of their request, or None for the
+        other paths, of new players.
+    """
+    match = WATCH_PATH.fullmatch(path) or RESUME_PATH.fullmatch(path)
+    return int(match.group(1)) if match is not None else None
 
 
 class YugiohServer:
-    def __init__(self, server_ip: str, port: int):
-        self.games: dict[int, Yugioh] = {}
-        self.id_count = 0
-        self.id_to_sockets: dict[int, list[socket.socket]] = defaultdict(
-            list)  # Dict that maps session_id to sockets associated with the game
+    def __init__(self, server_ip: str, port: int, session_ids: SessionIdAllocator = None,
+                 sessions: SessionRegistry = None, send_limits: SendLimits = None,
+                 checkpoints: CheckpointStore = None, admission_limits: AdmissionLimits = None,
+                 drain_timeout: float = None):
+        self.sessions = sessions or registry_from_environment()
+        self.metrics = Metrics()
+        self.admission = AdmissionController(admission_limits or admission_limits_from_environment(),
+                                             self.max_inbox_depth, observe_loop_lag=self.metrics.loop_lag.observe)
+        self.checkpoints = checkpoints or checkpoints_from_environment()
+        if self.checkpoints is not None:
+            self.sessions.on_evict = self.checkpoints.forget
+        self.sessions.on_retain = lambda session: self.on_session_event(session, SESSION_ENDED)
+        self.send_limits = send_limits or send_limits_from_environment()
+        self.full_state = full_state_from_environment()
+        self.matchmaker = Matchmaker(session_ids, on_match=self.start_game,
+                                     on_leave=lambda player: self.on_session_event(None, PLAYER_LEFT))
+        self.connections: dict[socket.socket, ClientConnection] = {}
+        self.exporter = exporter_from_environment(self.metrics, self.gauges)
+        self.compressor = load_compressor()
+        self.subprotocols = subprotocols([self.compressor.codec] if self.compressor else [])
         self.server_ip = server_ip
         self.port = port
+        # Seconds the games in progress may go on once the server drains
+        self.drain_timeout = float(os.environ.get(DRAIN_TIMEOUT_VARIABLE, DRAIN_TIMEOUT)) \
+            if drain_timeout is None else drain_timeout
+        self.draining = asyncio.Event()
 
     async def error(self, websocket, message):
         """
@@ -33,103 +90,528 @@ class YugiohServer:
             "type": "error",
             "message": message,
         }
-        await websocket.send(json.dumps(event))
+        frame = json.dumps(event)
+        self.metrics.count_sent("error", len(frame))
+        await websocket.send(frame)
 
     # TODO: Put the processing crud part here
     async def play(self, websocket, session_id: int):
         """
         Receive and process moves from a player.
         """
-        async for data in websocket:
+        connection = self.connections[websocket]
+        async for message in websocket:
+            if connection.bucket is not None:
+                delay = connection.bucket.delay()
+                if delay > 0:
+                    # The next messages wait in the socket, so a chatty client only slows itself down
+                    self.metrics.count_event("throttled")
+                    await asyncio.sleep(delay)
             # Parse a "play" event from the UI.
             logging.info("Recieved data from " + str(websocket))
-            data = json.loads(data)
-            send_data = None
-            if session_id in self.games:
-                game = self.games[session_id]
-                broadcast_sockets = self.id_to_sockets[session_id]
-                if data["operation"] == "create":
-                    send_data = game.create_game(data)
-                elif data["operation"] == "read":
-                    send_data = game.read_game(data)
-                    broadcast_sockets = [websocket]
-                elif data["operation"] == "update":
-                    send_data = game.update_game(data)
-                    if data["move"] == "draw_card":
-                        broadcast_sockets = [websocket]
-                elif data["operation"] == "delete":
-                    send_data = game.delete_game(data)
-                else:
-                    logging.warning("Invalid operation")
-                # Don't broadcast to both players if was a read_game
-                if data.get("get_pickle", False):
-                    websockets.broadcast(broadcast_sockets, send_data)
-                else:
-                    websockets.broadcast(broadcast_sockets, json.dumps(send_data).encode("utf-8"))
-
-    # TODO: Put the initializing game and join part here
-    async def create_new_game(self, websocket, id: int):
-        """
-        Handle a connection from the first player: start a new game.
+            try:
+                data = connection.decode_request(message)
+            except ValueError as error:
+                self.metrics.count_received("invalid", len(message))
+                await self.error(websocket, str(error))
+                continue
+            connection.update_preferences(data)
+            if data.pop("get_pickle", False):
+                data["get_state"] = True
+            if not data.get("get_state", False) and not data.get("delta", False):
+                # The whole game only goes to trusted debugging clients, the others get the view of their seat
+                data["get_json" if connection.full_state else "get_state"] = True
+            try:
+                command = decode_command(data)
+            except InvalidCommand as error:
+                self.metrics.count_received("invalid", len(message))
+                await self.error(websocket, str(error))
+                continue
+            self.metrics.count_received(command.operation.name, len(message))
+            session = self.sessions.get(session_id)
+            if session is None:
+                await self.error(websocket, "Session has ended.")
+                continue
+            await session.actor.submit(websocket, command)
+
+    def process_batch(self, session: Session, batch: list):
+        """
+        Apply a batch of commands from the inbox of a session, in order. Each command is answered on its own, and
+        update_batch requests are first answered with the results of their moves in a batch frame. Clients
+        using plain JSON frames get the state after each command seen by every player; the others get it once after
+        the batch, unless a reply already held it.
         Args:
-        websocket: websocket associated with the client
-        id: id associated with the client
+            session: the session whose game the commands are applied to
+            batch: list of (websocket, command) pairs
+        """
+        game = session.game
+        replied = {}
+        changed = None
+        for websocket, command in batch:
+            connection = self.connections.get(websocket)
+            if connection is None:
+                continue  # the player disconnected after sending the command
+            if self.checkpoints is not None and command.operation.name != READ:
+                self.checkpoints.record(session, command.request)  # failed moves change the version too
+            move = command.move.name if command.move is not None else ""
+            start = time.perf_counter()
+            try:
+                reply = game.execute(command)
+            except BatchFailed as error:
+                self.metrics.observe_command(command.operation.name, move, time.perf_counter() - start, True)
+                self.send(websocket, json.dumps({"type": "error", "message": str(error), "index": error.index})
+                          .encode("utf-8"), "error")
+                continue
+            except (IndexError, AttributeError, TypeError, ValueError) as error:
+                self.metrics.observe_command(command.operation.name, move, time.perf_counter() - start, True)
+                logging.warning(f"Session {session.session_id}: {command.request} failed: {error!r}")
+                self.send(websocket, json.dumps({"type": "error", "message": "Invalid move."}).encode("utf-8"),
+                          "error")
+                continue
+            self.metrics.observe_command(command.operation.name, move, time.perf_counter() - start)
+            self.sessions.update(session)
+            if isinstance(reply, BatchReply):
+                self.send(websocket, json.dumps({"type": "batch", "version": game.version, "results": reply.results})
+                          .encode("utf-8"), "batch")
+                reply = reply.reply
+            if not isinstance(reply, bytes):
+                reply = json.dumps(reply).encode("utf-8")
+            if "get_game_actions" not in command.request:
+                replied[websocket] = game.version
+                if connection.delta:
+                    connection.version = game.version
+            self.send(websocket, reply)
+            if command.audience == ALL:
+                changed = command
+                self.broadcast_state(game, [sock for sock in session.sockets
+                                            if sock is not websocket and not self.connections[sock].coalesces],
+                                     command.request)
+        if changed is not None:
+            self.broadcast_state(game, [sock for sock in session.sockets
+                                        if replied.get(sock) != game.version and self.connections[sock].coalesces],
+                                 changed.request)
+            if session.watchers:
+                self.broadcast_watchers(session)
+
+    def send(self, websocket, frame: bytes, message_type: str = "reply"):
+        """
+        Send a frame to a socket without waiting, compressed if the client negotiated compression. Replies are sent
+        even to lagging clients, which are disconnected once they pass the send limit.
+        """
+        frame = self.connections[websocket].encode_frame(frame)
+        self.metrics.count_sent(message_type, len(frame))
+        websockets.broadcast([websocket], frame)
+        if self.connections[websocket].buffered > self.send_limits.limit:
+            self.disconnect_slow_client(websocket)
+
+    def lagging(self, websocket, latest_frame: Callable[[], bytes]) -> bool:
+        """Checks whether a broadcast should skip a client because it is not reading its frames fast enough. Once
+        more than the high-water mark is waiting to be sent to a client, broadcasts skip it until its buffer drains,
+        and it is then sent only the latest state. Clients past the send limit are disconnected.
+
+        Args:
+            websocket: the client's websocket
+            latest_frame: returns the frame, as sent on the connection, of the latest state for the client
+
+        Returns: whether the broadcast skips the client
         """
-        # Initialize a Connect Four game, the set of WebSocket connections
-        # receiving moves from this game, and secret access tokens.
-        session_id = ((self.id_count - 1) // 2) + 1
-        self.games[session_id] = Yugioh()
+        connection = self.connections[websocket]
+        buffered = connection.buffered
+        if buffered > self.send_limits.limit:
+            self.disconnect_slow_client(websocket)
+            return True
+        if not connection.lagging and buffered > self.send_limits.high_water:
+            logging.info(f"Client at seat {connection.seat} is lagging with {buffered} bytes unsent")
+            connection.lagging = True
+            asyncio.ensure_future(self.catch_up(websocket, latest_frame))
+        if connection.lagging:
+            connection.skipped_frames += 1
+        return connection.lagging
+
+    async def catch_up(self, websocket, latest_frame: Callable[[], bytes]):
+        """
+        Wait until the write buffer of a lagging client drains, then send it the latest state.
+        """
+        await websocket.drain()
+        connection = self.connections.get(websocket)
+        if connection is None or websocket.state is not State.OPEN:
+            return
+        connection.lagging = False
         try:
-            await self.play(websocket, session_id)
-        except websockets.exceptions.ConnectionClosedError:
-            logging.info(f"Client {id} disconnected")
-        finally:
-            self.id_count -= 1
-            self.id_to_sockets[session_id].remove(websocket)
+            frame = latest_frame()
+            self.metrics.count_sent("catch_up", len(frame))
+            await websocket.send(frame)
+        except websockets.exceptions.ConnectionClosed:
+            pass
 
-    # TODO: Put the join existing code here
-    async def join_existing_game(self, websocket, session_id: int):
+    def disconnect_slow_client(self, websocket):
         """
-        Handle a connection from the second player: join an existing game.
+        Close the connection of a client that fell too far behind. Its session is retained, so it can come back.
         """
+        connection = self.connections[websocket]
+        if websocket.state is not State.OPEN:
+            return
+        logging.warning(f"Disconnecting client at seat {connection.seat}: {connection.metrics()}")
+        self.metrics.count_event("slow_disconnects")
+        asyncio.ensure_future(websocket.close(SLOW_CLIENT_CLOSE_CODE, "Too far behind"))
+
+    def connection_metrics(self) -> list[dict]:
+        """
+        Returns: the metrics of every connection, as returned by ClientConnection.metrics.
+        """
+        return [connection.metrics() for connection in self.connections.values()]
+
+    def max_inbox_depth(self) -> int:
+        """
+        Returns: the number of commands waiting in the deepest session inbox.
+        """
+        return max((session.actor.inbox.qsize() for session in self.sessions.sessions.values()
+                    if session.actor is not None), default=0)
+
+    def gauges(self) -> dict:
+        """
+        Returns: the current number of sessions by state, of connections, spectators, lagging connections, players
+            waiting for an opponent and commands waiting in session inboxes, the bytes waiting to be sent, and the
+            event loop lag and whether the server is overloaded, as last sampled by the admission controller, and
+            whether the server is draining.
+        """
+        sessions = self.sessions.sessions.values()
+        return {"sessions": self.sessions.gauge(), "connections": len(self.connections),
+                "spectators": sum(len(watchers) for session in sessions for watchers in session.watchers.values()),
+                "lagging_connections": sum(connection.lagging for connection in self.connections.values()),
+                "buffered_bytes": sum(connection.buffered for connection in self.connections.values()),
+                "waiting_players": self.matchmaker.waiting,
+                "inbox_depth": sum(session.actor.inbox.qsize() for session in sessions if session.actor is not None),
+                "loop_lag_seconds": self.admission.loop_lag, "overloaded": int(self.admission.overloaded),
+                "draining": int(self.draining.is_set())}
+
+    def broadcast_state(self, game: Yugioh, sockets: list, default: dict = None):
+        """
+        Send the state of a game to each socket in the format its client asked for. Clients using delta frames get a
+        patch from the version they have, and clients that negotiated compression get compressed frames, so frames
+        are grouped by content before being broadcast.
+        Args:
+            game: the game whose state is sent
+            sockets: sockets to send the state to
+            default: request whose format is used for clients that have not asked for a format yet
+        """
+        frames = defaultdict(list)
+        for sock in sockets:
+            connection = self.connections.get(sock)
+            if connection is not None and not self.lagging(
+                    sock, lambda connection=connection: connection.encode_frame(connection.state_frame(game, default))):
+                frames[connection.encode_frame(connection.state_frame(game, default))].append(sock)
+        for frame, frame_sockets in frames.items():
+            self.metrics.count_sent("broadcast", len(frame), len(frame_sockets))
+            websockets.broadcast(frame_sockets, frame)
+
+    def start_game(self, session_id: int, sockets: list):
+        """
+        Creates the game of two matched players, before either of them is told about it.
+        Args:
+            session_id: id of the new game
+            sockets: websockets of the players, by seat
+        """
+        session = self.sessions.create(session_id, sockets)
+        session.actor = SessionActor(session, self.process_batch)
+        session.actor.start()
+        for seat, websocket in enumerate(sockets):
+            self.connections[websocket].seat = seat
+        if self.checkpoints is not None:
+            self.checkpoints.track(session)
+        self.on_session_event(session, SESSION_STARTED)
+
+    def on_session_event(self, session: Optional[Session], event: str):
+        """
+        Extension point called when the games or the matchmaking queue of the server change. It does nothing here;
+        ShardServer reports the events to its front process, which routes new players by them. The events are:
+            SESSION_STARTED: a game started, or a player reconnected to a game all its players had left
+            SESSION_ENDED: a live game ended or was abandoned by all its players. Sent once each time a game stops
+                being live, so it follows each SESSION_STARTED of the game.
+            PLAYER_LEFT: a new player left without being matched, from the matchmaking queue or refused. session is
+                None.
+        """
+
+    def recover(self):
+        """
+        Restores the sessions checkpointed before the server stopped, of the session ids this server allocates. Their
+        players can reconnect with their resume tokens for the grace period.
+        """
+        if self.checkpoints is None:
+            return
+        for session_id, game, tokens in self.checkpoints.load(self.matchmaker.session_ids.owns):
+            session = self.sessions.restore(session_id, game, tokens)
+            session.actor = SessionActor(session, self.process_batch)
+            session.actor.start()
+            self.matchmaker.session_ids.reserve(session_id)
+            self.checkpoints.track(session)
+
+    async def join_game(self, websocket, match: Match):
+        """
+        Handle a matched player: send them their seat and resume token, and play the game.
+        """
+        session = self.sessions.get(match.session_id)
         try:
-            self.games[session_id]
-        except KeyError:
+            frame = json.dumps({"session_id": match.session_id, "player": match.seat,
+                                "token": session.tokens[match.seat]})
+            self.metrics.count_sent("match", len(frame))
+            await websocket.send(frame)
+        except websockets.exceptions.ConnectionClosed:
+            self.leave_game(session, websocket)
+            return
+        await self.attend(websocket, session)
+
+    async def resume(self, websocket, session_id: int, token: str, ack: int = None):
+        """
+        Handle a player reconnecting to their game, after losing their connection or after the server restarted: send
+        them their seat, then what they missed, and play the game.
+        Args:
+            websocket: the player's new websocket
+            session_id: id of the game
+            token: the player's resume token, sent with their seat when they were matched
+            ack: the last version of the game the player received, if they use delta frames. The version of a game is
+                the sequence number of the state frames of its session.
+        """
+        session = self.sessions.get(session_id)
+        if session is None or token not in session.tokens:
             await self.error(websocket, "Game not found.")
             return
+        connection = self.connections[websocket]
+        connection.seat = session.tokens.index(token)
         try:
-            for player_place, websocket in enumerate(self.id_to_sockets[session_id]):
-                event = {
-                    "session_id": session_id,
-                    "player": player_place,
-                }
-                await websocket.send(json.dumps(event))
-            await self.play(websocket, session_id)
+            frame = json.dumps({"session_id": session_id, "player": connection.seat, "token": token})
+            self.metrics.count_sent("match", len(frame))
+            await websocket.send(frame)
+        except websockets.exceptions.ConnectionClosed:
+            return
+        if self.sessions.get(session_id) is not session:
+            await self.error(websocket, "Game not found.")
+            return  # evicted while the seat was sent
+        for sock in list(session.sockets):
+            if self.connections[sock].seat == connection.seat:
+                logging.info(f"Replacing the connection of seat {connection.seat} of session {session_id}")
+                asyncio.ensure_future(sock.close(reason="Reconnected"))
+        if self.sessions.reconnect(session, websocket):
+            self.on_session_event(session, SESSION_STARTED)
+        logging.info(f"Player {connection.seat} reconnected to session {session_id} at version {ack}")
+        # Sent as the socket joins the session, so that no broadcast reaches the client before it
+        self.send(websocket, self.resume_frame(connection, session.game, ack), "resume")
+        await self.attend(websocket, session)
+
+    def resume_frame(self, connection: ClientConnection, game: Yugioh, ack: int = None) -> bytes:
+        """
+        Returns: the state of a game for a reconnecting client. A client that acknowledged a version still held in the
+            game's history gets a delta frame patching it with every change it missed, other clients the full state.
+        """
+        if ack is None or connection.binary:
+            self.metrics.count_event("resume_snapshots")
+            return connection.state_frame(game, {"get_state": True})
+        connection.update_preferences({"delta": True, "ack": ack})
+        self.metrics.count_event("resume_replays" if ack in game.history else "resume_snapshots")
+        return connection.state_frame(game)
+
+    async def attend(self, websocket, session: Session):
+        """
+        Play a game with a player whose socket joined its session, until they disconnect.
+        """
+        try:
+            await self.play(websocket, session.session_id)
+        except websockets.exceptions.ConnectionClosed:
+            logging.info(f"Client of session {session.session_id} disconnected")
         finally:
-            self.id_count -= 1
-            self.id_to_sockets[session_id].remove(websocket)
+            self.leave_game(session, websocket)
+
+    def leave_game(self, session: Session, websocket):
+        """
+        Removes a disconnected player from their session. The game is abandoned when its last player leaves.
+        """
+        self.sessions.disconnect(session, websocket)
+        if not session.sockets:
+            logging.info(f"Last player of session {session.session_id} left, commands: {session.actor.stats()}, "
+                         f"sessions: {self.sessions.gauge()}")
+
+    async def watch(self, websocket, session_id: int):
+        """
+        Handle a spectator: send them the public view of a session after every change, until they disconnect.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            await self.error(websocket, "Game not found.")
+            return
+        connection = self.connections[websocket]
+        connection.seat = SPECTATOR
+        watchers = session.watchers.setdefault((connection.binary, connection.compressor is not None), set())
+        watchers.add(websocket)
+        logging.info(f"Spectator joined session {session_id}, {sum(map(len, session.watchers.values()))} watching")
+        try:
+            frame = connection.encode_frame(self.spectator_frame(session.game, connection.binary))
+            self.metrics.count_sent("spectator", len(frame))
+            await websocket.send(frame)
+            async for _ in websocket:
+                pass  # spectators cannot make moves
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            watchers.discard(websocket)
+
+    def spectator_frame(self, game: Yugioh, binary: bool) -> bytes:
+        """
+        Returns: the public view of the current state of a game, as a binary snapshot frame or a JSON state frame.
+        """
+        return game.binary_frame(SPECTATOR) if binary else game.snapshot_frame(SPECTATOR)
+
+    def broadcast_watchers(self, session: Session):
+        """
+        Send the public view of a game to its spectators. The frame is encoded and compressed once for each format
+        and written to every spectator without waiting. Lagging spectators skip it, as lagging players do.
+        """
+        for (binary, compressed), watchers in session.watchers.items():
+            ready = [watcher for watcher in watchers if not self.lagging(
+                watcher, lambda connection=self.connections[watcher]: connection.encode_frame(
+                    self.spectator_frame(session.game, connection.binary)))]
+            if not ready:
+                continue
+            frame = self.spectator_frame(session.game, binary)
+            if compressed:
+                frame = self.compressor.compress(frame)
+            self.metrics.count_sent("spectator", len(frame), len(ready))
+            websockets.broadcast(ready, frame)
 
-    # TODO: Put the connecting sockets part here
     async def handler(self, websocket):
         """
-        Handle a connection and dispatch it according to who is connecting.
+        Handle a connection: spectators watch the session in the path they connected to, /watch/<session_id>, and
+        players reconnect to their game at /resume/<session_id>?token=<resume token>&ack=<last version received>.
+        Other players wait for an opponent in the matchmaking queue, then play the game. While the server is
+        overloaded or draining, only reconnecting players are accepted.
+        """
+        connection = self.connections[websocket] = ClientConnection(websocket, self.compressor, self.full_state)
+        connection.bucket = self.admission.bucket()
+        try:
+            resume = RESUME_PATH.fullmatch(websocket.request.path)
+            if resume is not None:
+                ack = resume.group(3)
+                await self.resume(websocket, int(resume.group(1)), resume.group(2), int(ack) if ack else None)
+                return
+            watch = WATCH_PATH.fullmatch(websocket.request.path)
+            if self.draining.is_set() or not self.admission.admit():
+                await self.refuse(websocket, watch is None)
+                return
+            if watch is not None:
+                await self.watch(websocket, int(watch.group(1)))
+                return
+            logging.info("Client connected, %d waiting for an opponent", self.matchmaker.waiting)
+            try:
+                match = await self.matchmaker.find_match(websocket, websocket.wait_closed())
+            except MatchTimeout:
+                await self.error(websocket, "No opponent found.")
+                return
+            except MatchCancelled:
+                logging.info("Client disconnected while waiting for an opponent")
+                return
+            except MatchmakerClosed:
+                await self.refuse(websocket)
+                return
+            await self.join_game(websocket, match)
+        finally:
+            del self.connections[websocket]
 
+    async def refuse(self, websocket, player: bool = True):
         """
-        # Receive and parse the "init" event from the UI.
-        logging.info(f'Client {self.id_count + 1} connected')
-        self.id_count += 1
-        logging.info("Id count: " + str(self.id_count))
-        session_id = ((self.id_count - 1) // 2) + 1
-        self.id_to_sockets[session_id].append(websocket)
-        if self.id_count % 2 == 1:
-            await self.create_new_game(websocket, self.id_count)
+        Tell a new client that the server is overloaded or restarting and when to try again, then close its connection.
+        Args:
+            websocket: the client's websocket
+            player: whether the client is a new player, or else a spectator
+        """
+        self.metrics.count_event("refused")
+        if player:
+            self.on_session_event(None, PLAYER_LEFT)
+        if self.draining.is_set():
+            message, code = "Server restarting", RESTART_CLOSE_CODE
         else:
-            # Second player joins an existing game.
-            await self.join_existing_game(websocket, session_id)
+            message, code = "Server busy", OVERLOADED_CLOSE_CODE
+        frame = json.dumps({"type": "error", "message": message + ".", "retry_after": self.admission.retry_after()})
+        self.metrics.count_sent("error", len(frame))
+        try:
+            await websocket.send(frame)
+            await websocket.close(code, message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def select_subprotocol(self, connection, offered: list):
+        """
+        Picks the wire format and compression of a new connection from the subprotocols offered by the client.
+        """
+        return select_subprotocol(offered, self.subprotocols)
+
+    def start_tasks(self) -> list[asyncio.Task]:
+        """
+        Restores the checkpointed sessions, and starts the background tasks of the server: the session reaper, the
+        metrics exporter, the admission controller and the checkpoint writer.
+        """
+        self.recover()
+        tasks = [asyncio.ensure_future(self.sessions.run_reaper()), asyncio.ensure_future(self.exporter.run()),
+                 asyncio.ensure_future(self.admission.run())]
+        if self.checkpoints is not None:
+            tasks.append(asyncio.ensure_future(self.checkpoints.run()))
+        return tasks
+
+    def drain(self):
+        """
+        Starts draining the server before it stops, on SIGTERM: new players and spectators are refused and the players
+        waiting for an opponent are sent away, while the games in progress go on until they end or the drain timeout
+        passes.
+        """
+        if self.draining.is_set():
+            return
+        logging.info("Draining %d games in progress", self.sessions.gauge()["live"])
+        self.draining.set()
+        self.matchmaker.close()
+
+    async def drained(self):
+        """
+        Waits until the server drained: every game in progress ended, or the drain timeout passed since the drain
+        started. The connections left are then closed as the server restarts, and their players resume their games
+        from their checkpoints on the next server.
+        """
+        await self.draining.wait()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        while True:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)  # the refused clients are told first
+            if not self.sessions.gauge()["live"] or loop.time() >= deadline:
+                break
+        live = self.sessions.gauge()["live"]
+        if live:
+            logging.warning("Drain timed out, closing %d games in progress%s", live,
+                            "" if self.checkpoints is not None else " without checkpoints")
+        await asyncio.gather(*(websocket.close(RESTART_CLOSE_CODE, "Server restarting")
+                               for websocket in list(self.connections)), return_exceptions=True)
+        logging.info("Drained")
+
+    async def run_until_drained(self, *waiters: Awaitable):
+        """
+        Runs the background tasks of the server until it drained after a SIGTERM, or until one of the waiters
+        completes. The checkpoint writer saves the last commands as it stops.
+        """
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.drain)
+        except NotImplementedError:
+            pass  # no signal handlers on Windows, where the server stops at once
+        tasks = self.start_tasks()
+        stops = [asyncio.ensure_future(self.drained())] + [asyncio.ensure_future(waiter) for waiter in waiters]
+        try:
+            done, _ = await asyncio.wait(tasks + stops, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # a background task failed
+        finally:
+            for task in tasks + stops:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     async def main(self):
-        async with websockets.serve(self.handler, self.server_ip, self.port, ping_timeout=160):
-            await asyncio.Future()  # run forever
+        async with websockets.serve(self.handler, self.server_ip, self.port, ping_timeout=PING_TIMEOUT,
+                                    select_subprotocol=self.select_subprotocol):
+            await self.run_until_drained()
 
 
 def initialize_server():
@@ -0,0 +1,271 @@
+# Lifecycle of the game sessions of YugiohServer. A session is created when two players are matched, is live while
+# its game is played, and is retained for a grace period once its game has ended or all its players have
+# disconnected, so that late requests and reconnecting players still find it. The reaper then evicts it, dropping the
+# game, both decks and the game log, after handing the log to the archive if there is one.
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Callable, Optional
+
+from src.game import GameStatus
+from src.yugioh import Yugioh
+
+GRACE_PERIOD = 300
+REAP_INTERVAL = 30
+INBOX_SIZE = 32
+GRACE_PERIOD_VARIABLE = "YUGIOH_SESSION_GRACE"
+ARCHIVE_VARIABLE = "YUGIOH_LOG_ARCHIVE"
+
+
+class SessionState(Enum):
+    """
+    WAITING: the players were matched but have not both joined the game yet
+    ONGOING: the game is being played
+    ENDED: the game has ended
+    ABANDONED: every player disconnected before the game ended
+    """
+    WAITING = "waiting"
+    ONGOING = "ongoing"
+    ENDED = "ended"
+    ABANDONED = "abandoned"
+
+
+LIVE_STATES = (SessionState.WAITING, SessionState.ONGOING)
+
+
+@dataclass(eq=False)
+class Session:
+    """A game session and the sockets of its players.
+    """
+    session_id: int
+    game: Yugioh
+    sockets: list = field(default_factory=list)
+    state: SessionState = SessionState.WAITING
+    retained_since: Optional[float] = None  # time.monotonic() at which the session stopped being live
+    actor: Optional["SessionActor"] = None
+    watchers: dict = field(default_factory=dict)  # websockets of spectators, by wire format and compression
+    tokens: list = field(default_factory=list)  # resume tokens of the players, by seat
+
+    @property
+    def live(self) -> bool:
+        return self.state in LIVE_STATES
+
+
+class SessionActor:
+    """Applies the commands of a session's players in the order they arrived, from a bounded inbox drained by a
+    single task. Every command waiting in the inbox when the task wakes up is handled as one batch, so the state is
+    broadcast once per batch. A player whose commands fill the inbox waits before their next command is read.
+    """
+    def __init__(self, session: Session, handle_batch: Callable[[Session, list], None], inbox_size: int = INBOX_SIZE):
+        """
+        Args:
+            session: the session whose commands are applied
+            handle_batch: called with the session and a list of (websocket, command) pairs to apply them. It must
+                not await, so that a batch is applied atomically.
+            inbox_size: maximum number of commands waiting in the inbox
+        """
+        self.session = session
+        self.handle_batch = handle_batch
+        self.inbox: asyncio.Queue = asyncio.Queue(inbox_size)
+        self.task: Optional[asyncio.Task] = None
+        self.commands = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.service_seconds = 0.0
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def submit(self, websocket, command):
+        """Adds a player's command to the inbox, waiting while the inbox is full.
+        """
+        await self.inbox.put((websocket, command))
+        self.max_depth = max(self.max_depth, self.inbox.qsize())
+
+    async def run(self):
+        while True:
+            batch = [await self.inbox.get()]
+            while not self.inbox.empty():
+                batch.append(self.inbox.get_nowait())
+            start = time.perf_counter()
+            try:
+                self.handle_batch(self.session, batch)
+            except Exception:
+                logging.exception("Session %d could not apply a batch of %d commands", self.session.session_id,
+                                  len(batch))
+            self.service_seconds += time.perf_counter() - start
+            self.commands += len(batch)
+            self.batches += 1
+
+    def stats(self) -> dict:
+        """
+        Returns: the current and maximum number of commands waiting in the inbox, the number of commands and batches
+            applied, and the mean time in microseconds spent applying a batch.
+        """
+        return {"depth": self.inbox.qsize(), "max_depth": self.max_depth, "commands": self.commands,
+                "batches": self.batches,
+                "service_us_per_batch": round(self.service_seconds * 1e6 / self.batches, 1) if self.batches else None}
+
+
+class LogArchive:
+    """Archives the game log of each evicted session as a JSON file in a directory.
+    """
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: directory the logs are written to. It is created if needed.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, session: Session):
+        path = os.path.join(self.directory, "session-%d.json" % session.session_id)
+        with open(path, 'w') as outfile:
+            json.dump({"session_id": session.session_id, "state": session.state.value,
+                       "players": [player.name for player in session.game.game.players],
+                       "logs": session.game.game_logger.get_logs()}, outfile)
+
+
+class SessionRegistry:
+    """The sessions of a server, indexed by session id.
+    """
+    def __init__(self, grace_period: float = GRACE_PERIOD, archive: Callable[[Session], None] = None):
+        """
+        Args:
+            grace_period: number of seconds an ended or abandoned session is retained before it is evicted.
+            archive: called with each session before it is evicted, such as a LogArchive.
+        """
+        self.grace_period = grace_period
+        self.archive = archive
+        self.sessions: dict[int, Session] = {}
+        self.evicted = 0
+        self.on_evict: Optional[Callable[[Session], None]] = None  # called with each evicted session
+        self.on_retain: Optional[Callable[[Session], None]] = None  # called with each session that stops being live
+
+    def __contains__(self, session_id: int) -> bool:
+        return session_id in self.sessions
+
+    def get(self, session_id: int) -> Optional[Session]:
+        return self.sessions.get(session_id)
+
+    def create(self, session_id: int, sockets: list) -> Session:
+        """
+        Returns: a new session with a new game, played by sockets, with a resume token for each player.
+        """
+        session = self.sessions[session_id] = Session(session_id, Yugioh(), list(sockets),
+                                                      tokens=[secrets.token_urlsafe(16) for _ in sockets])
+        return session
+
+    def restore(self, session_id: int, game: Yugioh, tokens: list) -> Session:
+        """
+        Returns: a session restored from a checkpoint, with no players connected. It is retained for the grace
+            period so that its players can reconnect.
+        """
+        session = self.sessions[session_id] = Session(session_id, game, tokens=list(tokens))
+        if game.game.game_status == GameStatus.ENDED:
+            self._retain(session, SessionState.ENDED)
+        else:
+            self._retain(session, SessionState.ABANDONED)
+        return session
+
+    def reconnect(self, session: Session, websocket) -> bool:
+        """Adds the socket of a returning player to a session.
+
+        Returns: whether the session was abandoned and is live again
+        """
+        session.sockets.append(websocket)
+        if session.state != SessionState.ABANDONED:
+            return False
+        session.state = SessionState.ONGOING if session.game.game.game_status == GameStatus.ONGOING \
+            else SessionState.WAITING
+        session.retained_since = None
+        logging.info("Session %d %s again", session.session_id, session.state.value)
+        return True
+
+    def update(self, session: Session):
+        """Updates the state of a session after a request changed its game.
+        """
+        status = session.game.game.game_status
+        if status == GameStatus.ONGOING and session.state == SessionState.WAITING:
+            session.state = SessionState.ONGOING
+        elif status == GameStatus.ENDED and session.live:
+            self._retain(session, SessionState.ENDED)
+            if self.on_retain is not None:
+                self.on_retain(session)
+
+    def disconnect(self, session: Session, websocket):
+        """Removes a player's socket from a session. The session is abandoned when its last player leaves.
+        """
+        session.sockets.remove(websocket)
+        if not session.sockets and session.live:
+            self._retain(session, SessionState.ABANDONED)
+            if self.on_retain is not None:
+                self.on_retain(session)
+
+    def _retain(self, session: Session, state: SessionState):
+        session.state = state
+        session.retained_since = time.monotonic()
+        logging.info("Session %d %s", session.session_id, state.value)
+
+    def reap(self, now: float = None) -> list[int]:
+        """Evicts the sessions whose grace period is over.
+
+        Args:
+            now: the current time.monotonic()
+
+        Returns: the ids of the evicted sessions
+        """
+        now = time.monotonic() if now is None else now
+        expired = [session for session in self.sessions.values()
+                   if not session.live and now - session.retained_since >= self.grace_period]
+        for session in expired:
+            if self.archive is not None:
+                try:
+                    self.archive(session)
+                except OSError as error:
+                    logging.error("Could not archive session %d: %s", session.session_id, error)
+            if session.actor is not None:
+                session.actor.stop()
+            for watchers in session.watchers.values():
+                for watcher in watchers:
+                    asyncio.ensure_future(watcher.close(reason="Session ended"))
+            if self.on_evict is not None:
+                self.on_evict(session)
+            del self.sessions[session.session_id]
+        self.evicted += len(expired)
+        return [session.session_id for session in expired]
+
+    def gauge(self) -> dict:
+        """
+        Returns: the number of live sessions, of retained (ended or abandoned) sessions and of sessions evicted
+            since the server started.
+        """
+        live = sum(session.live for session in self.sessions.values())
+        return {"live": live, "retained": len(self.sessions) - live, "evicted": self.evicted}
+
+    async def run_reaper(self, interval: float = REAP_INTERVAL):
+        """Reaps sessions every interval seconds, forever.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            if self.reap():
+                logging.info("Sessions: %s", self.gauge())
+
+
+def registry_from_environment() -> SessionRegistry:
+    """
+    Returns: a SessionRegistry configured by the environment: YUGIOH_SESSION_GRACE sets the grace period in seconds
+        and YUGIOH_LOG_ARCHIVE the directory game logs are archived to. Logs are not archived if it is not set.
+    """
+    directory = os.environ.get(ARCHIVE_VARIABLE)
+    return SessionRegistry(float(os.environ.get(GRACE_PERIOD_VARIABLE, GRACE_PERIOD)),
+                           LogArchive(directory) if directory else None)
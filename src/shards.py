@@ -0,0 +1,380 @@
+# Multi-process mode of YugiohServer: a front process accepts TCP connections on the public port and hands each socket
+# to one of N pre-forked shard processes, each running its own YugiohServer with its own games. Sockets are passed
+# with SCM_RIGHTS (socket.send_fds) over a Unix socket pair, so the front never reads or writes game traffic.
+#
+# Matchmaking stays inside the shards. Every shard pairs the players it is given in arrival order, so it has at most
+# one player waiting at a time; the front sends each new connection to a shard with a waiting player if there is one,
+# which puts both players of a session in the same shard, and otherwise to the shard with the fewest games. Shards
+# report when a game starts or is revived and when it ends or is abandoned, once each time it stops being live, and
+# when a waiting player leaves the queue. A player connection that closes before reaching the handler, such as a failed
+# handshake or a plain HTTP request, is reported as having left the queue too. A shard whose process exited or whose
+# channel failed gets no more connections.
+#
+# An overloaded shard refuses new players (see src.admission) and reports them as having left its queue.
+#
+# Spectators connect to /watch/<session_id> and reconnecting players to /resume/<session_id>. The front peeks at the
+# request line of each connection without reading it, and sends both to the shard that allocated the session id,
+# which is also the shard that restores the session from its checkpoint after a restart.
+#
+# On SIGTERM the front forwards the signal to the shards, each of which drains as YugiohServer does, and exits once they
+# all exited. It keeps handing connections to the draining shards meanwhile, which refuse the new players.
+#
+# Only available where socket.send_fds is (Unix).
+import asyncio
+import logging
+import multiprocessing
+import signal
+import socket
+from typing import Optional
+
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.server import ServerProtocol
+
+from src.matchmaking import SessionIdAllocator
+from src.metrics import exporter_from_environment
+from src.server import PING_TIMEOUT, PLAYER_LEFT, SESSION_ENDED, SESSION_STARTED, YugiohServer, session_of_path
+from src.session import Session
+
+HANDOFF = b"c"
+PLAYER_HANDOFF = b"p"
+STARTED = b"s"
+ENDED = b"e"
+LEFT = b"l"
+BACKLOG = 1024
+REQUEST_LINE_SIZE = 2048
+REQUEST_LINE_TIMEOUT = 10
+EVENTS = {SESSION_STARTED: STARTED, SESSION_ENDED: ENDED, PLAYER_LEFT: LEFT}
+
+
+class ShardRouter:
+    """Picks the shard of each new connection, from what the front knows about the shards.
+    """
+    def __init__(self, shards: int):
+        """
+        Args:
+            shards: number of shards
+        """
+        self.sessions = [0] * shards
+        self.waiting = [False] * shards
+        self.available = [True] * shards
+
+    def route(self) -> Optional[int]:
+        """
+        Returns: the shard to send a new connection to: a shard with a player waiting for an opponent, or else the
+            available shard with the fewest games. None if no shard is available.
+        """
+        if any(self.waiting):
+            shard = self.waiting.index(True)
+        else:
+            shards = [shard for shard, available in enumerate(self.available) if available]
+            if not shards:
+                return None
+            shard = min(shards, key=self.sessions.__getitem__)
+        self.waiting[shard] = not self.waiting[shard]
+        return shard
+
+    def route_session(self, session_id: int) -> Optional[int]:
+        """
+        Returns: the shard of the game a spectator watches or a player reconnects to, the shard that allocated its
+            session id, or None if that shard is not available.
+        """
+        shard = (session_id - 1) % len(self.sessions)
+        return shard if self.available[shard] else None
+
+    def remove(self, shard: int):
+        """
+        Stops routing connections to a shard whose process exited or whose channel failed.
+        """
+        self.available[shard] = False
+        self.waiting[shard] = False
+
+    def report(self, shard: int, event: bytes):
+        """Updates the state of a shard from an event it reported.
+
+        The queue of a shard holds at most one player, and both a new connection and a player leaving the queue
+        flip whether a player is waiting, so the front's view is right once every event has arrived whatever order
+        they arrived in.
+        """
+        if event == STARTED:
+            self.sessions[shard] += 1
+        elif event == ENDED:
+            self.sessions[shard] -= 1
+        elif event == LEFT:
+            self.waiting[shard] = not self.waiting[shard]
+
+
+class ShardServer(YugiohServer):
+    """The YugiohServer of a shard process. It serves the connections handed to it by the front process and reports
+    its games and waiting players back to it.
+    """
+    def __init__(self, server_ip: str, channel: socket.socket, shard: int, shards: int):
+        """
+        Args:
+            server_ip: address the front listens on, used in logs.
+            channel: the shard's end of the socket pair shared with the front process.
+            shard: index of this shard
+            shards: number of shards. Shard i allocates the session ids i + 1, i + 1 + shards, ...
+        """
+        super().__init__(server_ip, 0, SessionIdAllocator(shard + 1, shards))
+        self.channel = channel
+        self.shard = shard
+        self.exporter = exporter_from_environment(self.metrics, self.gauges, shard)
+        # Player connections handed to the shard that have not reached the handler yet
+        self.unserved: set[ServerConnection] = set()
+
+    def send_event(self, event: bytes):
+        """
+        Reports an event to the front process. Events are dropped once the front has exited, while the shard closes.
+        """
+        try:
+            self.channel.send(event)
+        except OSError as error:
+            logging.warning("Shard %d could not report %r: %s", self.shard, event, error)
+
+    def on_session_event(self, session: Optional[Session], event: str):
+        super().on_session_event(session, event)
+        self.send_event(EVENTS[event])
+
+    async def handler(self, websocket):
+        self.unserved.discard(websocket)
+        await super().handler(websocket)
+
+    def accept(self, server, sock: socket.socket, player: bool):
+        """
+        Starts serving a socket accepted by the front process.
+        Args:
+            server: the websockets server whose handler serves the connection
+            sock: the accepted socket
+            player: whether the front routed the connection as a new player's
+        """
+        protocol = ServerProtocol(
+            select_subprotocol=lambda protocol, offered: self.select_subprotocol(connection, offered))
+        connection = ServerConnection(protocol, server, ping_timeout=PING_TIMEOUT)
+        asyncio.ensure_future(self.serve_accepted(connection, sock, player))
+
+    async def serve_accepted(self, connection: ServerConnection, sock: socket.socket, player: bool):
+        """
+        Serves a socket accepted by the front process. A player connection that closes before it reaches the handler
+        never joins the matchmaking queue, so it is reported as having left it, as the front counted it as waiting.
+        """
+        if player:
+            self.unserved.add(connection)
+        try:
+            await asyncio.get_running_loop().connect_accepted_socket(lambda: connection, sock)
+        except OSError as error:
+            logging.warning("Shard %d could not serve a connection: %s", self.shard, error)
+            sock.close()
+        else:
+            await connection.wait_closed()
+        if connection in self.unserved:
+            self.unserved.discard(connection)
+            self.send_event(LEFT)
+
+    def receive_sockets(self, server):
+        """
+        Serves the sockets waiting in the channel.
+        """
+        while True:
+            try:
+                message, fds, _, _ = socket.recv_fds(self.channel, 1, 16)
+            except BlockingIOError:
+                return
+            if not fds:
+                logging.info("Shard %d: front process closed", self.shard)
+                asyncio.get_running_loop().remove_reader(self.channel)
+                server.close()
+                return
+            for fd in fds:
+                self.accept(server, socket.socket(fileno=fd), message == PLAYER_HANDOFF)
+
+    async def main(self):
+        # The websockets server only listens on an unused loopback port: its connections come from the channel.
+        async with serve(self.handler, "127.0.0.1", 0, ping_timeout=PING_TIMEOUT,
+                         select_subprotocol=self.select_subprotocol) as server:
+            self.channel.setblocking(False)
+            asyncio.get_running_loop().add_reader(self.channel, self.receive_sockets, server)
+            await self.run_until_drained(server.wait_closed())
+
+
+def run_shard(server_ip: str, channel: socket.socket, shard: int, shards: int, inherited: list):
+    """
+    Runs a shard process.
+    Args:
+        inherited: sockets of the front process inherited by the fork, which the shard closes so that the front
+            exiting closes the channel.
+    """
+    for sock in inherited:
+        sock.close()
+    logging.getLogger().setLevel(logging.INFO)
+    server = ShardServer(server_ip, channel, shard, shards)
+    asyncio.run(server.main())
+
+
+class FrontServer:
+    """Accepts connections on the public port and hands them to the shard processes.
+    """
+    def __init__(self, server_ip: str, port: int, shards: int):
+        """
+        Args:
+            server_ip: address to listen on
+            port: port to listen on
+            shards: number of shard processes to start
+        """
+        self.server_ip = server_ip
+        self.port = port
+        self.router = ShardRouter(shards)
+        self.channels: list[socket.socket] = []
+        self.processes: list[multiprocessing.Process] = []
+        self.draining = asyncio.Event()
+
+    def start_shards(self, listener: socket.socket):
+        """
+        Forks the shard processes, each with a socket pair to the front.
+        Args:
+            listener: the front's listening socket, which the shards close.
+        """
+        shards = len(self.router.sessions)
+        pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET) for _ in range(shards)]
+        context = multiprocessing.get_context("fork")
+        for shard, (front_end, shard_end) in enumerate(pairs):
+            inherited = [listener] + [sock for pair in pairs for sock in pair if sock is not shard_end]
+            process = context.Process(target=run_shard, args=(self.server_ip, shard_end, shard, shards, inherited),
+                                      daemon=True)
+            process.start()
+            self.processes.append(process)
+        for front_end, shard_end in pairs:
+            shard_end.close()
+            self.channels.append(front_end)
+
+    def receive_events(self, shard: int):
+        try:
+            event = self.channels[shard].recv(1)
+        except BlockingIOError:
+            return
+        except OSError as error:
+            logging.error("Channel of shard %d failed: %s", shard, error)
+            event = b""
+        if not event:
+            if self.draining.is_set():
+                logging.info("Shard %d drained", shard)
+            else:
+                logging.error("Shard %d exited", shard)
+            asyncio.get_running_loop().remove_reader(self.channels[shard])
+            self.router.remove(shard)
+            return
+        self.router.report(shard, event)
+
+    async def request_path(self, connection: socket.socket) -> Optional[str]:
+        """
+        Returns: the path in the request line of a new connection, which is left unread in the socket, or None if
+            the client closed the connection or sent no request line in time.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + REQUEST_LINE_TIMEOUT
+        data = b""
+        while b"\r\n" not in data and len(data) < REQUEST_LINE_SIZE:
+            if data:
+                await asyncio.sleep(0.01)  # the socket stays readable until the rest of the line arrives
+            readable = loop.create_future()
+            loop.add_reader(connection, lambda: readable.done() or readable.set_result(None))
+            try:
+                await asyncio.wait_for(readable, deadline - loop.time())
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                loop.remove_reader(connection)
+            data = connection.recv(REQUEST_LINE_SIZE, socket.MSG_PEEK)
+            if not data:
+                return None
+        request_line = data.split(b"\r\n", 1)[0].split(b" ")
+        return request_line[1].decode("latin-1") if len(request_line) == 3 else None
+
+    async def dispatch(self, connection: socket.socket):
+        """
+        Sends an accepted connection to its shard: the shard of the game for a spectator or a reconnecting player, or
+        the shard picked by the router for a new player. Connections without a request line or without an available
+        shard are closed.
+        """
+        try:
+            path = await self.request_path(connection)
+        except OSError:
+            path = None
+        if path is None:
+            connection.close()
+            return
+        session_id = session_of_path(path)
+        shard = self.router.route() if session_id is None else self.router.route_session(session_id)
+        if shard is None:
+            connection.close()
+            return
+        self.hand_off(connection, shard, session_id is None)
+
+    def hand_off(self, connection: socket.socket, shard: int, player: bool = True):
+        """
+        Sends an accepted connection to a shard. The front's copy of the socket is closed. The shard is not routed to
+        anymore if its channel failed; if the channel was only full, a player is counted as having left the queue.
+        Args:
+            connection: the accepted connection
+            shard: the shard to send it to
+            player: whether the connection is a player's, who joins the shard's matchmaking queue
+        """
+        try:
+            socket.send_fds(self.channels[shard], [PLAYER_HANDOFF if player else HANDOFF], [connection.fileno()])
+        except BlockingIOError:
+            logging.warning("Channel of shard %d is full, dropping a connection", shard)
+            if player:
+                self.router.report(shard, LEFT)
+        except OSError as error:
+            logging.error("Could not hand a connection to shard %d: %s", shard, error)
+            self.router.remove(shard)
+        finally:
+            connection.close()
+
+    async def accept_connections(self, listener: socket.socket):
+        """
+        Dispatches the connections accepted on the public port, forever.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            connection, _ = await loop.sock_accept(listener)
+            connection.setblocking(False)
+            asyncio.ensure_future(self.dispatch(connection))
+
+    async def drain(self):
+        """
+        Sends SIGTERM to the shards, and returns once they drained and exited.
+        """
+        logging.info("Draining %d shards", len(self.processes))
+        for process in self.processes:
+            process.terminate()
+        await asyncio.get_running_loop().run_in_executor(None, lambda: [process.join() for process in self.processes])
+
+    async def main(self):
+        listener = socket.create_server((self.server_ip, self.port), backlog=BACKLOG)
+        listener.setblocking(False)
+        self.start_shards(listener)
+        loop = asyncio.get_running_loop()
+        for shard, channel in enumerate(self.channels):
+            channel.setblocking(False)
+            loop.add_reader(channel, self.receive_events, shard)
+        # Installed after the fork, so the shards start with the default handler until they install their own
+        loop.add_signal_handler(signal.SIGTERM, self.draining.set)
+        logging.info("Listening on %s:%d with %d shards", self.server_ip, self.port, len(self.channels))
+        accepting = asyncio.ensure_future(self.accept_connections(listener))
+        draining = asyncio.ensure_future(self.draining.wait())
+        try:
+            await asyncio.wait([accepting, draining], return_when=asyncio.FIRST_COMPLETED)
+            if accepting.done():
+                accepting.result()
+            await self.drain()
+        finally:
+            accepting.cancel()
+            draining.cancel()
+            listener.close()
+            for process in self.processes:
+                process.terminate()
+
+
+def initialize_sharded_server(shards: int, server_ip: str = "0.0.0.0", port: int = 5555):
+    logging.getLogger().setLevel(logging.INFO)
+    asyncio.run(FrontServer(server_ip, port, shards).main())
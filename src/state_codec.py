@@ -0,0 +1,40 @@
+# Full game state frames for JSON clients, replacing pickled GameControllers on the wire.
+#
+# A state frame is the JSON object {"type": "state", "state": snapshot}, where snapshot is a game snapshot or view
+# (see src.state_sync). Decoding goes through game_from_snapshot, which only accepts the fields of the snapshot
+# format and cards of the catalog, and takes spell effects from the card catalog and its effect registry
+# (src.card_effects.EFFECTS) instead of from the frame. A hostile server can send a wrong game, but not run code.
+import json
+
+from src.game import GameController
+from src.state_sync import game_from_snapshot
+
+STATE = "state"
+
+
+def encode_state(snapshot: dict) -> bytes:
+    """
+    Args:
+        snapshot: a game snapshot or view, as returned by src.state_sync.StateHistory.view
+
+    Returns: the state frame of the snapshot
+    """
+    return json.dumps({"type": STATE, "state": snapshot}, separators=(',', ':')).encode('utf-8')
+
+
+def decode_state(frame) -> GameController:
+    """Rebuilds a game from a state frame.
+
+    Args:
+        frame: the state frame, either encoded or already parsed from JSON
+
+    Returns: the game described by the frame
+
+    Raises:
+        ValueError: the frame is not a valid state frame
+    """
+    if isinstance(frame, (bytes, bytearray, str)):
+        frame = json.loads(frame)
+    if not isinstance(frame, dict) or frame.get("type") != STATE:
+        raise ValueError("Not a state frame")
+    return game_from_snapshot(frame["state"])
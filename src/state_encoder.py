@@ -0,0 +1,143 @@
+# Encoders for the full JSON state of a game, the format sent to clients that do not use delta frames.
+#
+# game_to_dict builds the dictionaries directly and encode_game writes the JSON bytes in a single walk of the game,
+# instead of serializing every object through its __dict__ and parsing the result back. Only data is encoded: spell
+# effect functions are left out. The JSON of the fields a card shares with its template is computed once per template.
+from json.encoder import encode_basestring_ascii as encode_string
+
+from src.card import Card, Monster, Spell
+from src.game import GameController
+from src.player import Player
+
+MAX_CACHED_TEMPLATES = 4096
+
+_template_json = {}
+
+
+def card_to_dict(card):
+    """
+    Returns: dictionary of the data fields of a card, or None for an empty field slot.
+    """
+    if card is None:
+        return None
+    card_dict = card.to_dict()
+    if isinstance(card, Spell):
+        card_dict["icon"] = card.icon.value
+        card_dict["position"] = card.position.value
+        card_dict["effect_args"] = list(card.effect_args)
+        card_dict["equipped_monster"] = card_to_dict(card.equipped_monster)
+    return card_dict
+
+
+def player_to_dict(player: Player) -> dict:
+    """
+    Returns: dictionary of the fields of a player, with every card converted by card_to_dict.
+    """
+    return {"life_points": player.life_points, "name": player.name,
+            "deck": [card_to_dict(card) for card in player.deck],
+            "hand": [card_to_dict(card) for card in player.hand],
+            "graveyard": [card_to_dict(card) for card in player.graveyard],
+            "monster_field": [card_to_dict(card) for card in player.monster_field],
+            "spell_trap_field": [card_to_dict(card) for card in player.spell_trap_field]}
+
+
+def game_to_dict(game: GameController) -> dict:
+    """
+    Returns: dictionary of the fields of a game, with every player converted by player_to_dict.
+    """
+    return {"players": [player_to_dict(player) for player in game.players], "current_player": game.current_player,
+            "other_player": game.other_player, "session_id": game.session_id, "game_status": int(game.game_status),
+            "is_first_turn": game.is_first_turn, "version": game.version}
+
+
+def _json_value(value) -> str:
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, str):
+        return encode_string(value)
+    return str(int(value))
+
+
+def _template_prefix(card) -> str:
+    """
+    Returns: the opening of a card's JSON object, holding every field the card shares with its template.
+    """
+    template = card.template
+    cached = _template_json.get(id(template))
+    if cached is not None and cached[0] is template:
+        return cached[1]
+    if isinstance(card, Monster):
+        prefix = '{"name":%s,"description":%s,"attribute":%s,"base_atk":%d,"base_def":%d,"level":%d,' \
+                 '"monster_type":%s,' % (encode_string(template.name), encode_string(template.description),
+                                         encode_string(template.attribute), template.attack_points,
+                                         template.defense_points, template.level, encode_string(template.monster_type))
+    elif isinstance(card, Spell):
+        prefix = '{"name":%s,"icon":%s,"description":%s,"speed":%d,"effect_args":[%s],' \
+                 '"required_monster_type":%s,' % (encode_string(template.name), encode_string(template.icon.value),
+                                                  encode_string(template.description), template.speed,
+                                                  ','.join(_json_value(arg) for arg in template.effect_args),
+                                                  _json_value(template.required_monster_type))
+    else:
+        prefix = '{"name":%s,"description":%s' % (encode_string(template.name), encode_string(template.description))
+    if len(_template_json) >= MAX_CACHED_TEMPLATES:
+        _template_json.clear()
+    _template_json[id(template)] = (template, prefix)
+    return prefix
+
+
+def _write_card(card, out: list):
+    if card is None:
+        out.append('null')
+    elif isinstance(card, Monster):
+        out.append(_template_prefix(card))
+        out.append('"attack_points":%d,"defense_points":%d,"face_pos":%s,"battle_pos":%s,"equipped_spell":%s,'
+                   '"can_attack":%s}' % (card.attack_points, card.defense_points, encode_string(card.face_pos),
+                                         encode_string(card.battle_pos), _json_value(card.equipped_spell),
+                                         _json_value(card.can_attack)))
+    elif isinstance(card, Spell):
+        out.append(_template_prefix(card))
+        out.append('"position":%s,"equipped_monster":' % encode_string(card.position.value))
+        _write_card(card.equipped_monster, out)
+        out.append('}')
+    elif isinstance(card, Card):
+        out.append(_template_prefix(card))
+        out.append('}')
+
+
+def _write_cards(cards: list, out: list):
+    out.append('[')
+    for idx, card in enumerate(cards):
+        if idx:
+            out.append(',')
+        _write_card(card, out)
+    out.append(']')
+
+
+def encode_game(game: GameController) -> bytes:
+    """Encodes a game as compact JSON. The result decodes to game_to_dict(game).
+
+    Returns: the utf-8 encoded JSON of the game.
+    """
+    out = ['{"players":[']
+    for idx, player in enumerate(game.players):
+        if idx:
+            out.append(',')
+        out.append('{"life_points":%d,"name":%s,"deck":' % (player.life_points, encode_string(player.name)))
+        _write_cards(player.deck, out)
+        out.append(',"hand":')
+        _write_cards(player.hand, out)
+        out.append(',"graveyard":')
+        _write_cards(player.graveyard, out)
+        out.append(',"monster_field":')
+        _write_cards(player.monster_field, out)
+        out.append(',"spell_trap_field":')
+        _write_cards(player.spell_trap_field, out)
+        out.append('}')
+    out.append('],"current_player":%d,"other_player":%d,"session_id":%s,"game_status":%d,"is_first_turn":%s,'
+               '"version":%d}' % (game.current_player, game.other_player, _json_value(game.session_id),
+                                  game.game_status, _json_value(game.is_first_turn), game.version))
+    return ''.join(out).encode('utf-8')
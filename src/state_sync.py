@@ -0,0 +1,472 @@
+# Versioned game state synchronization. The server keeps plain-data snapshots of a game at recent versions and sends
+# clients only the patch between the version they acknowledged and the current one. Clients apply the patches in
+# place to their GameController.
+#
+# A snapshot is made of dicts, lists, strings, numbers and None. Cards are stored by name, as a plain string while they
+# are in their starting state or as a dict of the name and the fields that differ from the starting state otherwise.
+# An equip spell refers to its monster as [zone, index] in the zones of the spell's owner.
+#
+# The view of a seat is the snapshot with what that player may not see taken out: decks and the opponent's hand are
+# replaced by their number of cards, and the opponent's face-down monsters by HIDDEN_MONSTER. Games built from a view
+# hold None for every hidden card and a placeholder monster for every hidden monster.
+#
+# A patch is a list of operations:
+#   ["=", path, value]                          sets the value at path
+#   ["~", path, start, delete_count, items]     replaces delete_count items of the list at path, starting at start
+# A path is a list of attribute names and list indexes starting from the GameController.
+#
+# Decoding only builds the objects listed here, from cards of the catalog: snapshots and patches that do not follow
+# this format, name unknown cards or paths to other attributes are rejected with a ValueError, so a game received
+# from a server cannot run code or set arbitrary attributes the way a pickle can.
+from src.card import Monster, MonsterTemplate, Spell, card_catalog
+from src.game import GameController, GameStatus
+from src.player import Player
+
+SET = "="
+SPLICE = "~"
+
+CARD_ZONES = ("deck", "hand", "graveyard", "monster_field", "spell_trap_field")
+REFERENCE_ZONES = ("monster_field", "graveyard")
+
+MONSTER_FIELDS = ("attack_points", "defense_points", "face_pos", "battle_pos", "equipped_spell", "can_attack")
+
+GAME_FIELDS = {"version": int, "session_id": (int, type(None)), "game_status": int, "current_player": int,
+               "other_player": int, "is_first_turn": bool}
+PLAYER_FIELDS = {"name": str, "life_points": int}
+CARD_FIELDS = {"name": str, "attack_points": int, "defense_points": int, "face_pos": str, "battle_pos": str,
+               "equipped_spell": (str, type(None)), "can_attack": bool, "position": str, "equipped_monster": list}
+MAX_PLAYERS = 2
+MAX_ZONE_SIZE = 1000
+
+HIDDEN_MONSTER = "?"
+SPECTATOR = -1  # seat of spectators, who see what both players see of their opponent
+HIDDEN_MONSTER_TEMPLATE = MonsterTemplate(name="Face-down monster", description="", attribute="", monster_type="",
+                                          level=1, attack_points=0, defense_points=0)
+
+
+def snapshot_card(card, owner: Player):
+    """
+    Args:
+        card: The card to snapshot, or None for an empty field slot.
+        owner: The player whose zones hold the card, used to refer to an equipped monster.
+
+    Returns: the card's name if the card is in its starting state, otherwise a dict of its name and changed fields.
+    """
+    if card is None:
+        return None
+    changed = {}
+    if isinstance(card, Monster):
+        if card.attack_points != card.base_atk:
+            changed["attack_points"] = card.attack_points
+        if card.defense_points != card.base_def:
+            changed["defense_points"] = card.defense_points
+        if card.face_pos != Monster.FACE_UP:
+            changed["face_pos"] = card.face_pos
+        if card.battle_pos != Monster.ATK:
+            changed["battle_pos"] = card.battle_pos
+        if card.equipped_spell is not None:
+            changed["equipped_spell"] = card.equipped_spell
+        if card.can_attack:
+            changed["can_attack"] = True
+    else:
+        if card.position != Spell.Position.FACE_UP:
+            changed["position"] = card.position.value
+        if card.equipped_monster is not None:
+            changed["equipped_monster"] = _monster_reference(card.equipped_monster, owner)
+    if not changed:
+        return card.name
+    changed["name"] = card.name
+    return changed
+
+
+def _monster_reference(monster: Monster, owner: Player):
+    for zone in REFERENCE_ZONES:
+        for idx, card in enumerate(getattr(owner, zone)):
+            if card is monster:
+                return [zone, idx]
+    return None
+
+
+def snapshot_player(player: Player) -> dict:
+    """
+    Returns: plain-data snapshot of a player and every card they own.
+    """
+    snapshot = {"name": player.name, "life_points": player.life_points}
+    for zone in CARD_ZONES:
+        snapshot[zone] = [snapshot_card(card, player) for card in getattr(player, zone)]
+    return snapshot
+
+
+def snapshot_game(game: GameController) -> dict:
+    """
+    Returns: plain-data snapshot of a game, which only holds dicts, lists, strings, numbers and None.
+    """
+    return {"version": game.version, "session_id": game.session_id, "game_status": int(game.game_status),
+            "current_player": game.current_player, "other_player": game.other_player,
+            "is_first_turn": game.is_first_turn, "players": [snapshot_player(player) for player in game.players]}
+
+
+def _is_face_down_monster(card) -> bool:
+    return isinstance(card, dict) and card.get("face_pos") == Monster.FACE_DOWN
+
+
+def view_player(player: dict, is_owner: bool) -> dict:
+    """
+    Args:
+        player: A player snapshot, as returned by snapshot_player.
+        is_owner: Whether the view is for the player themselves.
+
+    Returns: the part of the player snapshot that the owner or the opponent may see.
+    """
+    view = dict(player, deck=len(player["deck"]))
+    if not is_owner:
+        view["hand"] = len(player["hand"])
+        view["monster_field"] = [HIDDEN_MONSTER if _is_face_down_monster(card) else card
+                                 for card in player["monster_field"]]
+    return view
+
+
+def view_game(snapshot: dict, seat) -> dict:
+    """
+    Args:
+        snapshot: A game snapshot, as returned by snapshot_game.
+        seat: The index of the player viewing the game, SPECTATOR for the public view of spectators, or None for a
+            view with nothing hidden.
+
+    Returns: the part of the game snapshot that the player at seat may see.
+    """
+    if seat is None:
+        return snapshot
+    return dict(snapshot, players=[view_player(player, idx == seat) for idx, player in enumerate(snapshot["players"])])
+
+
+def hidden_monster() -> Monster:
+    """
+    Returns: a placeholder for a face-down monster whose card is hidden from the viewer.
+    """
+    monster = Monster.from_template(HIDDEN_MONSTER_TEMPLATE)
+    monster.face_pos = Monster.FACE_DOWN
+    monster.battle_pos = Monster.DEF
+    return monster
+
+
+def card_from_snapshot(data):
+    """Creates a card from its snapshot. Equipped monster references are left as they are in the snapshot and are
+    resolved by link_equipped_monsters once the owner's zones are complete.
+
+    Args:
+        data: A card snapshot, as returned by snapshot_card.
+
+    Returns: the card, or None for an empty field slot.
+    """
+    if data is None:
+        return None
+    if isinstance(data, str):
+        if data == HIDDEN_MONSTER:
+            return hidden_monster()
+        card = card_catalog.create_card(data)
+        if card is None:
+            raise ValueError("Unknown card %s" % data)
+        return card
+    _check_fields(data, CARD_FIELDS, required=("name",))
+    card = card_catalog.create_card(data["name"])
+    if card is None:
+        raise ValueError("Unknown card %s" % data["name"])
+    if isinstance(card, Monster):
+        if data.get("face_pos", Monster.FACE_UP) not in (Monster.FACE_UP, Monster.FACE_DOWN) or \
+                data.get("battle_pos", Monster.ATK) not in (Monster.ATK, Monster.DEF):
+            raise ValueError("Invalid position for %s" % data["name"])
+        for field in MONSTER_FIELDS:
+            if field in data:
+                setattr(card, field, data[field])
+    else:
+        if "position" in data:
+            card.position = Spell.Position(data["position"])
+        reference = data.get("equipped_monster")
+        if reference is not None and (len(reference) != 2 or reference[0] not in REFERENCE_ZONES or
+                                      type(reference[1]) is not int):
+            raise ValueError("Invalid equipped monster for %s" % data["name"])
+        card.equipped_monster = reference
+    return card
+
+
+def _check_fields(data, fields: dict, required=()):
+    """Checks that data is a dict holding only the specified fields, with values of the specified types.
+
+    Raises:
+        ValueError: data does not match the fields.
+    """
+    if not isinstance(data, dict) or not data.keys() <= fields.keys() or not all(key in data for key in required):
+        raise ValueError("Invalid snapshot %r" % (data,))
+    for key, value in data.items():
+        expected = fields[key]
+        # bool is a subclass of int, but is never a valid count or index
+        if not isinstance(value, expected) or (isinstance(value, bool) and expected is int):
+            raise ValueError("Invalid value for %s" % key)
+
+
+def unlink_equipped_monsters(player: Player):
+    """Replaces the equipped monsters of a player's spells with references to where the monsters are, so that they
+    can be linked again after the player's cards have been patched.
+    """
+    for zone in CARD_ZONES:
+        for card in getattr(player, zone):
+            if isinstance(card, Spell) and isinstance(card.equipped_monster, Monster):
+                card.equipped_monster = _monster_reference(card.equipped_monster, player)
+
+
+def link_equipped_monsters(player: Player):
+    """Replaces the equipped monster references of a player's spells with the referenced monsters.
+    """
+    for zone in CARD_ZONES:
+        for card in getattr(player, zone):
+            if isinstance(card, Spell) and isinstance(card.equipped_monster, list):
+                zone_name, idx = card.equipped_monster
+                monster = getattr(player, zone_name)[idx] if 0 <= idx < len(getattr(player, zone_name)) else None
+                if not isinstance(monster, Monster):
+                    raise ValueError("%s is equipped to a missing monster" % card.name)
+                card.equipped_monster = monster
+
+
+def _zone_from_snapshot(data) -> list:
+    if isinstance(data, int) and not isinstance(data, bool) and 0 <= data <= MAX_ZONE_SIZE:
+        return [None] * data
+    if not isinstance(data, list) or len(data) > MAX_ZONE_SIZE:
+        raise ValueError("Invalid zone snapshot")
+    return [card_from_snapshot(card) for card in data]
+
+
+def player_from_snapshot(data: dict) -> Player:
+    """
+    Returns: the Player described by a player snapshot.
+    """
+    _check_fields(data, dict(PLAYER_FIELDS, **{zone: (list, int) for zone in CARD_ZONES}),
+                  required=tuple(PLAYER_FIELDS) + CARD_ZONES)
+    player = Player(data["life_points"], data["name"])
+    for zone in CARD_ZONES:
+        setattr(player, zone, _zone_from_snapshot(data[zone]))
+    link_equipped_monsters(player)
+    return player
+
+
+def game_from_snapshot(data: dict) -> GameController:
+    """
+    Returns: the GameController described by a game snapshot.
+    """
+    _check_fields(data, dict(GAME_FIELDS, players=list), required=tuple(GAME_FIELDS) + ("players",))
+    if len(data["players"]) > MAX_PLAYERS or not 0 <= data["current_player"] < MAX_PLAYERS or \
+            not 0 <= data["other_player"] < MAX_PLAYERS:
+        raise ValueError("Invalid game snapshot")
+    game = GameController(data["session_id"])
+    game.version = data["version"]
+    game.game_status = GameStatus(data["game_status"])
+    game.current_player, game.other_player = data["current_player"], data["other_player"]
+    game.is_first_turn = data["is_first_turn"]
+    game.players = [player_from_snapshot(player) for player in data["players"]]
+    return game
+
+
+def diff_snapshots(old, new, path=None, patch=None) -> list:
+    """Computes the patch that turns one snapshot into another.
+
+    Dicts are compared key by key and lists of equal length item by item. Lists whose length changed are patched with
+    a single splice of the items between their common prefix and suffix, which covers drawing from the deck, playing
+    from the hand and sending cards to the graveyard. Cards are never split into smaller patches.
+
+    Args:
+        old: The snapshot the client has.
+        new: The current snapshot.
+
+    Returns: list of patch operations.
+    """
+    path = path or []
+    patch = [] if patch is None else patch
+    if old == new:
+        return patch
+    if isinstance(old, dict) and isinstance(new, dict) and not _is_card(new) and old.keys() == new.keys():
+        for key in new:
+            diff_snapshots(old[key], new[key], path + [key], patch)
+    elif isinstance(old, list) and isinstance(new, list):
+        if len(old) == len(new):
+            for idx, (old_item, new_item) in enumerate(zip(old, new)):
+                diff_snapshots(old_item, new_item, path + [idx], patch)
+        else:
+            start = 0
+            while start < len(old) and start < len(new) and old[start] == new[start]:
+                start += 1
+            end = 0
+            while end < len(old) - start and end < len(new) - start and old[-1 - end] == new[-1 - end]:
+                end += 1
+            patch.append([SPLICE, path, start, len(old) - start - end, new[start:len(new) - end]])
+    else:
+        patch.append([SET, path, new])
+    return patch
+
+
+def _is_card(value) -> bool:
+    return isinstance(value, dict) and "name" in value and "life_points" not in value
+
+
+def _is_index(key) -> bool:
+    return type(key) is int and key >= 0
+
+
+def _check_operation(operation):
+    """Checks that a patch operation has a valid form and a path to a field that snapshots hold.
+
+    Raises:
+        ValueError: the operation is invalid.
+    """
+    if not isinstance(operation, list) or len(operation) < 2 or not isinstance(operation[1], list):
+        raise ValueError("Invalid patch operation")
+    path = operation[1]
+    if operation[0] == SET and len(operation) == 3:
+        valid = (not path or (len(path) == 1 and path[0] in GAME_FIELDS) or
+                 (len(path) >= 2 and path[0] == "players" and _is_index(path[1]) and
+                  (len(path) == 2 or (len(path) == 3 and (path[2] in PLAYER_FIELDS or path[2] in CARD_ZONES)) or
+                   (len(path) == 4 and path[2] in CARD_ZONES and _is_index(path[3])))))
+    elif operation[0] == SPLICE and len(operation) == 5:
+        valid = ((path == ["players"] or (len(path) == 3 and path[0] == "players" and _is_index(path[1]) and
+                                          path[2] in CARD_ZONES)) and
+                 _is_index(operation[2]) and _is_index(operation[3]) and isinstance(operation[4], list))
+    else:
+        valid = False
+    if not valid:
+        raise ValueError("Invalid patch operation %r" % (operation[:2],))
+
+
+def _decode(path: list, value):
+    """Turns a patched snapshot value into the object stored at path, which has been checked by _check_operation.
+    """
+    if not path:
+        return game_from_snapshot(value)
+    if len(path) == 1:
+        _check_fields({path[0]: value}, GAME_FIELDS)
+        return GameStatus(value) if path[0] == "game_status" else value
+    if len(path) == 2:
+        return player_from_snapshot(value)
+    if len(path) == 4:
+        return card_from_snapshot(value)
+    if path[2] in CARD_ZONES:
+        return _zone_from_snapshot(value)
+    _check_fields({path[2]: value}, PLAYER_FIELDS)
+    return value
+
+
+def apply_patch(game: GameController, patch: list) -> GameController:
+    """Applies a patch to a game in place.
+
+    Args:
+        game: The game at the version the patch was computed from.
+        patch: list of patch operations, as returned by diff_snapshots.
+
+    Returns: the patched game. This is the same object unless the patch replaces the whole game.
+
+    Raises:
+        ValueError: the patch is invalid or does not apply to the game. The game may have been partially patched.
+    """
+    if not isinstance(patch, list):
+        raise ValueError("Invalid patch")
+    for operation in patch:
+        _check_operation(operation)
+    touched_players = {operation[1][1] for operation in patch
+                       if len(operation[1]) > 1 and operation[1][0] == "players"}
+    for player_idx in touched_players:
+        if player_idx < len(game.players):
+            unlink_equipped_monsters(game.players[player_idx])
+    try:
+        for operation in patch:
+            path = operation[1]
+            if not path:
+                game = _decode(path, operation[2])
+                continue
+            parent = game
+            for key in path[:-1]:
+                parent = parent[key] if isinstance(key, int) else getattr(parent, key)
+            if operation[0] == SET:
+                value = _decode(path, operation[2])
+                if isinstance(path[-1], int):
+                    parent[path[-1]] = value
+                else:
+                    setattr(parent, path[-1], value)
+            else:
+                target = parent[path[-1]] if isinstance(path[-1], int) else getattr(parent, path[-1])
+                start, delete_count, items = operation[2:]
+                target[start:start + delete_count] = [_decode(path + [start + idx], item)
+                                                      for idx, item in enumerate(items)]
+        for player_idx in touched_players:
+            if player_idx < len(game.players):
+                link_equipped_monsters(game.players[player_idx])
+    except IndexError as error:
+        raise ValueError("Patch does not apply to the game") from error
+    return game
+
+
+class StateHistory:
+    """Bounded record of the snapshots of a game at its most recent versions, and of the views of each seat at those
+    versions.
+    """
+    def __init__(self, max_versions: int = 32):
+        """
+        Args:
+            max_versions: number of versions to keep snapshots of. Clients further behind get a full snapshot.
+        """
+        self.max_versions = max_versions
+        self.snapshots = {}
+        self.views: dict[int, dict] = {}  # views of each held version, by seat, dropped with the version's snapshot
+
+    def __contains__(self, version: int) -> bool:
+        """
+        Returns: whether the snapshot of a version is still held, so that a patch from it can be made.
+        """
+        return version in self.snapshots
+
+    def record(self, game: GameController) -> dict:
+        """
+        Returns: the snapshot of the game at its current version, taking it if it has not been taken yet.
+        """
+        snapshot = self.snapshots.get(game.version)
+        if snapshot is None:
+            snapshot = self.snapshots[game.version] = snapshot_game(game)
+            while len(self.snapshots) > self.max_versions:
+                oldest = next(iter(self.snapshots))
+                del self.snapshots[oldest]
+                self.views.pop(oldest, None)
+        return snapshot
+
+    def view(self, game: GameController, seat=None) -> dict:
+        """
+        Args:
+            game: The game at its current version.
+            seat: The index of the player viewing the game, SPECTATOR for the public view of spectators, or None for a
+                view with nothing hidden.
+
+        Returns: view_game of the current snapshot for seat. Each view is computed once per version.
+        """
+        snapshot = self.record(game)
+        if seat is None:
+            return snapshot
+        return self._view_of(game.version, seat)
+
+    def _view_of(self, version: int, seat) -> dict:
+        views = self.views.setdefault(version, {})
+        view = views.get(seat)
+        if view is None:
+            view = views[seat] = view_game(self.snapshots[version], seat)
+        return view
+
+    def patch_since(self, game: GameController, base_version: int, seat=None):
+        """
+        Args:
+            game: The game at its current version.
+            base_version: The version the client has.
+            seat: The index of the player viewing the game, or None for a view with nothing hidden.
+
+        Returns: the patch from the view of base_version to the current view, or None if the base version is
+            unknown.
+        """
+        current = self.view(game, seat)
+        if base_version not in self.snapshots:
+            return None
+        base = self.snapshots[base_version] if seat is None else self._view_of(base_version, seat)
+        return diff_snapshots(base, current)
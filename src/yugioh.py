@@ -1,17 +1,33 @@
+import copy
 import json
 import pickle
+from dataclasses import dataclass
 from typing import Union, Any
 
-from src.card import create_deck_from_array
+from src.card import create_deck_from_array, Card, Spell
 from src.game import GameController, GameStatus
+from src.moves import MOVES, UPDATE, UPDATE_BATCH, BatchFailed, Command, decode_command
 from src.player import Player
+from src.protocol import encode_snapshot
+from src.state_codec import encode_state
+from src.state_encoder import card_to_dict, encode_game, game_to_dict, player_to_dict
+from src.state_sync import SET, StateHistory, game_from_snapshot
+
+MAX_CACHED_FRAMES = 64
 
 
 def to_dict(obj):
-    """ Converts a yugioh yugioh_game session to a dictionary recursively
+    """ Converts a yugioh yugioh_game session, or any part of it, to a dictionary recursively
     """
-    json_dict = json.loads(json.dumps(obj, default=lambda o: o.__dict__))
-    return json_dict
+    if isinstance(obj, GameController):
+        return game_to_dict(obj)
+    if isinstance(obj, Player):
+        return player_to_dict(obj)
+    if isinstance(obj, (Card, Spell)):
+        return card_to_dict(obj)
+    if isinstance(obj, (list, tuple)):
+        return [to_dict(item) for item in obj]
+    return obj
 
 
 def replace_game_property_values(game_dict):
@@ -24,6 +40,14 @@ def replace_game_property_values(game_dict):
     return game_dict
 
 
+@dataclass(frozen=True)
+class BatchReply:
+    """The reply to an update_batch request.
+    """
+    results: list  # for each move, its name and log message (None for moves that are not logged)
+    reply: Union[dict, bytes, Any]  # the state of the game after the batch, in the format asked for by the request
+
+
 class Yugioh:
     """ Yugioh is the yugioh_game interface in which the yugioh yugioh_game can be played by CRUD.
     """
@@ -32,6 +56,9 @@ class Yugioh:
         self.game = GameController()
         self.current_turn = 1
         self.game_logger = GameLogger(self.game)
+        self.version = 0
+        self.history = StateHistory()
+        self.frames = {}
 
     def create_game(self, request: dict) -> Union[dict, bytes]:
         """
@@ -43,7 +70,16 @@ class Yugioh:
                 player_name: name of the player
                 deck: a list of strings of card names to create the deck with
                 player_place: whether the player is 1st place (0) or 2nd place (1). If not specified, will append
-                get_pickle: optional false. If true, instead returns a pickled version of the game
+                get_pickle: optional false. If true, instead returns a pickled version of the game. Only for use
+                    in the same process: YugiohServer sends state frames to clients asking for pickles
+                get_state: optional false. If true, instead returns snapshot_frame(seat)
+                get_json: optional false. If true, instead returns the JSON encoded bytes of the dict version of Game
+                delta: optional false. If true, instead returns state_frame(ack, seat), where ack is the version of the
+                    game last received by the client
+                get_binary: optional false. If true, instead returns binary_frame(seat). Takes priority over the
+                    other formats
+                seat: optional. Index of the player the binary or delta frame is for, whose view hides the decks,
+                    the opponent's hand and the opponent's face-down monsters. If not specified, nothing is hidden
         Returns: dict version of Game
         """
         player = Player(8000, name=request["player_name"])
@@ -56,9 +92,8 @@ class Yugioh:
         self.game.session_id = request["session_id"]
         if len(self.game.players) == 2:
             self.game.game_status = GameStatus.ONGOING
-        if request.get('get_pickle', False):
-            return pickle.dumps(self.game)
-        return to_dict(self.game)
+        self._changed()
+        return self._reply(request)
 
     def read_game(self, request: dict) -> Union[Union[list[str], bytes], Any]:
         """
@@ -72,9 +107,7 @@ class Yugioh:
         """
         if "get_game_actions" in request:
             return self.game_logger.get_logs()
-        if request.get('get_pickle', False):
-            return pickle.dumps(self.game)
-        return to_dict(self.game)
+        return self._reply(request)
 
     def update_game(self, request: dict) -> Union[bytes, Any]:
         """
@@ -84,48 +117,94 @@ class Yugioh:
                 player: player to make the move as. 1 for player 1 or 2 for player 2
                 move: Move to take in the yugioh game. Values can be , "summon_monster", "change_turn", "attack",
                 "tribute_summon".
-                args: a list of arguments needed to make the move
+                args: a list of arguments needed to make the move, see src.moves.MOVES
+
+        Returns:
+            dictionary describing the yugioh_game's new state.
+
+        Raises:
+            InvalidCommand: the move is unknown or its arguments are invalid.
+        """
+        return self.play_move(decode_command(request, UPDATE))
+
+    def play_move(self, command: Command) -> Union[bytes, Any]:
+        """
+        Args:
+            command: a decoded update request (see src.moves)
 
         Returns:
             dictionary describing the yugioh_game's new state.
         """
-        if request["move"] == "attack_player":
-            self.game_logger.log_action(request, self.current_turn)
-            self.game.attack_player(*request["args"])
-        if request["move"] == "change_turn":
-            self.current_turn += 1
-            self.game.change_turn()
-        elif request["move"] == "draw_card":
-            if "args" in request:
-                self.game.players[request["player"]].draw_card(*request["args"])
-            else:
-                self.game.players[request["player"]].draw_card()
-        elif request["move"] == "normal_summon":
-            self.game_logger.log_action(request, self.current_turn)
-            self.game.normal_summon(*request["args"])
-        elif request["move"] == "normal_set":
-            self.game_logger.log_action(request, self.current_turn)
-            self.game.normal_set(*request["args"])
-        elif request["move"] == "flip_summon":
-            self.game_logger.log_action(request, self.current_turn)
-            self.game.flip_summon(*request["args"])
-        elif request["move"] == "tribute_summon":
-            self.game_logger.log_action(request, self.current_turn)
-            self.game.tribute_summon_monster(*request["args"])
-        elif request["move"] == "attack_monster":
-            self.game_logger.log_action(request, self.current_turn)
-            self.game.attack_monster(*request["args"])
-        elif request["move"] == "normal_spell":
-            self.game_logger.log_action(request, self.current_turn)
-            self.game.activate_spell(*request["args"])
-        elif request["move"] == "equip_spell":
-            self.game_logger.log_action(request, self.current_turn)
-            self.game.equip_spell(*request["args"])
+        try:
+            if command.move.log is not None:
+                self.game_logger.log_action(command.request, self.current_turn)
+            command.move.play(self, command)
+        finally:
+            self._changed()
 
-        if request.get('get_pickle', False):
-            return pickle.dumps(self.game)
+        return self._reply(command.request)
 
-        return to_dict(self.game)
+    def update_batch(self, request: dict) -> BatchReply:
+        """
+        Args:
+            request: dictionary holding a list of moves, each described as the request of update_game:
+                session_id: value associated with a yugioh game session
+                moves: list of {"move": ..., "player": ..., "args": [...]}, applied in order
+                The format of the state in the reply is asked for as in create_game.
+
+        Returns:
+            the result of each move, and the game's state after all of them.
+
+        Raises:
+            InvalidCommand: a move is unknown or its arguments are invalid. No move is applied.
+            BatchFailed: a move failed. No move is applied.
+        """
+        return self.play_batch(decode_command(request, UPDATE_BATCH))
+
+    def play_batch(self, command: Command) -> BatchReply:
+        """Plays the moves of a batch as one change of the game: if a move fails, the game and its log are restored
+        to their state before the batch. Unexpected errors are raised again once the game is restored.
+
+        Args:
+            command: a decoded update_batch request (see src.moves)
+
+        Returns:
+            the result of each move, and the game's state after all of them.
+        """
+        saved_game = copy.deepcopy(self.game)
+        saved_turn = self.current_turn
+        saved_logs = len(self.game_logger.game_actions)
+        results = []
+        for index, move in enumerate(command.commands):
+            try:
+                if move.move.log is not None:
+                    self.game_logger.log_action(move.request, self.current_turn)
+                move.move.play(self, move)
+            except Exception as error:
+                self.game = self.game_logger.game_controller = saved_game
+                self.current_turn = saved_turn
+                del self.game_logger.game_actions[saved_logs:]
+                if isinstance(error, (IndexError, AttributeError, TypeError, ValueError)):
+                    raise BatchFailed(index, move.move.name, error) from error
+                raise
+            log = self.game_logger.game_actions[-1].get("message") if move.move.log is not None else None
+            results.append({"move": move.move.name, "log": log})
+        self._changed()
+        return BatchReply(results, self._reply(command.request))
+
+    def execute(self, command: Command) -> Union[dict, bytes, BatchReply, Any]:
+        """Runs a decoded request.
+
+        Args:
+            command: the request, decoded by src.moves.decode_command
+
+        Returns: the reply of the CRUD method of the request's operation.
+        """
+        if command.commands:
+            return self.play_batch(command)
+        if command.move is not None:
+            return self.play_move(command)
+        return getattr(self, command.operation.method)(command.request)
 
     def delete_game(self, request: dict) -> Union[dict, bytes]:
         """
@@ -139,10 +218,118 @@ class Yugioh:
         """
 
         self.game.game_status = GameStatus.ENDED
+        self._changed()
+        return self._reply(request)
+
+    def restore(self, snapshot: dict, current_turn: int, logs: list):
+        """Replaces the game with a checkpoint of it (see src.checkpoint).
+
+        Args:
+            snapshot: the snapshot of the game, as taken by StateHistory.record
+            current_turn: the turn counter of the game
+            logs: the game log
+        """
+        self.game = self.game_logger.game_controller = game_from_snapshot(snapshot)
+        self.version = self.game.version
+        self.current_turn = current_turn
+        self.game_logger.game_actions = list(logs)
+        self.history = StateHistory()
+        self.frames.clear()
+
+    def _changed(self):
+        """Moves the game to a new state version, dropping the frames encoded for the previous one. Must be called
+        after every change to the game.
+        """
+        self.version += 1
+        self.game.version = self.version
+        self.frames.clear()
+
+    def _cached_frame(self, frame_format: tuple, encode) -> bytes:
+        """
+        Args:
+            frame_format: the format of the frame and its parameters, such as the seat it is for.
+            encode: function encoding the current state of the game in that format.
+
+        Returns: the frame of the current version in frame_format, encoding it if it has not been encoded yet.
+        """
+        key = (self.version,) + frame_format
+        frame = self.frames.get(key)
+        if frame is None:
+            if len(self.frames) >= MAX_CACHED_FRAMES:
+                self.frames.clear()
+            frame = self.frames[key] = encode()
+        return frame
+
+    def _reply(self, request: dict) -> Union[dict, bytes]:
+        """
+        Args:
+            request: the request being answered.
+
+        Returns: the game state in the format asked for by the request.
+        """
+        if request.get('get_binary', False):
+            return self.binary_frame(request.get('seat'))
+        if request.get('delta', False):
+            return self.state_frame(request.get('ack', -1), request.get('seat'))
+        if request.get('get_state', False):
+            return self.snapshot_frame(request.get('seat'))
         if request.get('get_pickle', False):
-            return pickle.dumps(self.game)
+            return self.pickle_frame()
+        if request.get('get_json', False):
+            return self.json_frame()
         return to_dict(self.game)
 
+    def snapshot_frame(self, seat: int = None) -> bytes:
+        """
+        Args:
+            seat: the index of the player the frame is for, or None to send the state with nothing hidden.
+
+        Returns: the view of the current state of the game for seat as a state frame (see src.state_codec).
+        """
+        return self._cached_frame(("state", seat), lambda: encode_state(self.history.view(self.game, seat)))
+
+    def pickle_frame(self) -> bytes:
+        """
+        Returns: the current state of the game as a pickled GameController.
+        """
+        return self._cached_frame(("pickle",), lambda: pickle.dumps(self.game))
+
+    def json_frame(self) -> bytes:
+        """
+        Returns: the current state of the game as JSON (see src.state_encoder.encode_game).
+        """
+        return self._cached_frame(("json",), lambda: encode_game(self.game))
+
+    def binary_frame(self, seat: int = None) -> bytes:
+        """
+        Args:
+            seat: the index of the player the frame is for, or None to send the state with nothing hidden.
+
+        Returns: the view of the current state of the game for seat as a binary snapshot frame (see src.protocol).
+        """
+        return self._cached_frame(("binary", seat), lambda: encode_snapshot(self.history.view(self.game, seat)))
+
+    def state_frame(self, base_version: int, seat: int = None) -> bytes:
+        """Encodes the state of the game for a client that has the specified version of it.
+
+        Args:
+            base_version: the version of the game the client has, or -1 if it has none.
+            seat: the index of the player the frame is for, or None to send the state with nothing hidden.
+
+        Returns: a JSON delta frame {"type": "delta", "base": ..., "version": ..., "ops": [...]} holding the patch
+            between the views of seat at base_version and at the current version (see src.state_sync). If
+            base_version is too old or unknown, base is -1 and the patch replaces the whole game with the current view.
+        """
+        return self._cached_frame(("delta", base_version, seat), lambda: self._encode_delta(base_version, seat))
+
+    def _encode_delta(self, base_version: int, seat) -> bytes:
+        patch = self.history.patch_since(self.game, base_version, seat)
+        if patch is None:
+            base_version = -1
+            patch = [[SET, [], self.history.view(self.game, seat)]]
+        return json.dumps({"type": "delta", "base": base_version, "version": self.version, "ops": patch},
+                          separators=(',', ':')).encode('utf-8')
+
 
 class GameLogger:
     """
@@ -162,22 +349,9 @@ class GameLogger:
             turn: turn where the action was taken
         """
         log = {"turn": turn, "player": self.game_controller.get_current_player().name}
-        if request["move"] == "attack_monster":
-            log["message"] = self.log_attack_monster_message(request)
-        elif request["move"] == "normal_summon":
-            log["message"] = self.log_normal_summon_message(request)
-        elif request["move"] == "attack_player":
-            log["message"] = self.log_attack_player_message(request)
-        elif request["move"] == "tribute_summon":
-            log["message"] = self.log_tribute_summon_message(request)
-        elif request["move"] == "normal_spell":
-            log["message"] = self.log_activate_spell_message(request)
-        elif request["move"] == "equip_spell":
-            log["message"] = self.log_activate_equip_spell_message(request)
-        elif request["move"] == "normal_set":
-            log["message"] = self.log_normal_set_message(request)
-        elif request["move"] == "flip_summon":
-            log["message"] = self.log_flip_summon_message(request)
+        move = MOVES.get(request["move"])
+        if move is not None and move.log is not None:
+            log["message"] = getattr(self, move.log)(request)
         self.game_actions.append(log)
 
     def log_normal_summon_message(self, request: dict) -> str:
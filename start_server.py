@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import os
 
 from src.server import YugiohServer
 
@@ -7,7 +8,14 @@ from src.server import YugiohServer
 # Using the special variable
 # __name__
 if __name__ == "__main__":
-    server = YugiohServer("0.0.0.0", 5555)
-    logging.getLogger().setLevel(logging.INFO)
-    print("Starting Yugioh Server")
-    asyncio.run(server.main())
+    # YUGIOH_SHARDS > 1 starts that many shard processes behind a front process (see src/shards.py)
+    shards = int(os.environ.get("YUGIOH_SHARDS", "1"))
+    if shards > 1:
+        from src.shards import initialize_sharded_server
+        print("Starting Yugioh Server with %d shards" % shards)
+        initialize_sharded_server(shards)
+    else:
+        server = YugiohServer("0.0.0.0", 5555)
+        logging.getLogger().setLevel(logging.INFO)
+        print("Starting Yugioh Server")
+        asyncio.run(server.main())
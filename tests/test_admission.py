@@ -0,0 +1,62 @@
+import asyncio
+import json
+import unittest
+
+from src.admission import AdmissionController, AdmissionLimits, TokenBucket
+from src.metrics import LOOP_LAG_BUCKETS, Histogram
+from src.server import OVERLOADED_CLOSE_CODE, YugiohServer
+from tests.test_backpressure import FakeWebsocket
+
+
+class TestAdmission(unittest.TestCase):
+    def test_token_bucket_allows_bursts_then_limits_rate(self):
+        bucket = TokenBucket(rate=10, burst=3)
+        now = bucket.updated
+        self.assertEqual([0, 0, 0], [bucket.delay(now) for _ in range(3)])
+        self.assertAlmostEqual(0.1, bucket.delay(now))
+        self.assertAlmostEqual(0.2, bucket.delay(now))
+        self.assertEqual(0, bucket.delay(now + 1))
+
+    def test_overloaded_past_thresholds(self):
+        controller = AdmissionController(AdmissionLimits(max_loop_lag=0.1, max_inbox_depth=4), lambda: 0)
+        self.assertTrue(controller.admit())
+        controller.update(0.5, 0)
+        self.assertFalse(controller.admit())
+        controller.update(0.01, 5)
+        self.assertFalse(controller.admit())
+        controller.update(0.01, 4)
+        self.assertTrue(controller.admit())
+        self.assertEqual(2, controller.refused)
+
+    def test_overdue_sample_means_overloaded(self):
+        controller = AdmissionController(AdmissionLimits(max_loop_lag=0.1), lambda: 0)
+        controller.due = 10.0
+        self.assertTrue(controller.admit(10.05))
+        self.assertFalse(controller.admit(10.2))
+        self.assertAlmostEqual(0.2, controller.loop_lag)
+
+    def test_samples_feed_the_loop_lag_histogram(self):
+        histogram = Histogram(LOOP_LAG_BUCKETS)
+        controller = AdmissionController(AdmissionLimits(), lambda: 0, 0.01, histogram.observe)
+
+        async def sample():
+            task = asyncio.ensure_future(controller.run())
+            await asyncio.sleep(0.1)
+            task.cancel()
+        asyncio.run(sample())
+        self.assertGreater(histogram.count, 1)
+
+    def test_rate_limit_can_be_disabled(self):
+        self.assertIsNone(AdmissionController(AdmissionLimits(rate=0), lambda: 0).bucket())
+
+
+class TestRefusal(unittest.IsolatedAsyncioTestCase):
+    async def test_refused_client_is_told_when_to_retry(self):
+        server = YugiohServer("localhost", 0, admission_limits=AdmissionLimits(retry_after=7))
+        websocket = FakeWebsocket()
+        await server.refuse(websocket)
+        refusal = json.loads(websocket.sent[0])
+        self.assertEqual("Server busy.", refusal["message"])
+        self.assertTrue(7 <= refusal["retry_after"] <= 14)
+        self.assertEqual(OVERLOADED_CLOSE_CODE, websocket.close_code)
+        self.assertEqual({"refused": 1}, server.metrics.events)
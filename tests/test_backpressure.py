@@ -0,0 +1,62 @@
+import asyncio
+import types
+import unittest
+
+from websockets.protocol import State
+
+from src.connection import ClientConnection, SendLimits
+from src.server import SLOW_CLIENT_CLOSE_CODE, YugiohServer
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.buffered = 0
+        self.transport = types.SimpleNamespace(get_write_buffer_size=lambda: self.buffered)
+        self.subprotocol = None
+        self.state = State.OPEN
+        self.sent = []
+        self.close_code = None
+        self.drained = asyncio.Event()
+
+    async def drain(self):
+        await self.drained.wait()
+
+    async def send(self, frame):
+        self.sent.append(frame)
+
+    async def close(self, code, reason):
+        self.state = State.CLOSED
+        self.close_code = code
+
+
+class TestBackpressure(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = YugiohServer("localhost", 0, send_limits=SendLimits(high_water=100, limit=1000))
+        self.websocket = FakeWebsocket()
+        self.connection = self.server.connections[self.websocket] = ClientConnection(self.websocket)
+        self.version = 0
+
+    def latest_frame(self):
+        return b"state %d" % self.version
+
+    async def test_lagging_client_skips_frames_then_gets_latest_state(self):
+        self.assertFalse(self.server.lagging(self.websocket, self.latest_frame))
+        self.websocket.buffered = 500
+        for self.version in range(1, 4):
+            self.assertTrue(self.server.lagging(self.websocket, self.latest_frame))
+        self.websocket.buffered = 0
+        self.assertTrue(self.server.lagging(self.websocket, self.latest_frame))
+        self.websocket.drained.set()
+        await asyncio.sleep(0)
+        self.assertEqual([b"state 3"], self.websocket.sent)
+        self.assertFalse(self.server.lagging(self.websocket, self.latest_frame))
+        self.assertEqual({"seat": None, "buffered": 0, "max_buffered": 500, "lagging": False, "skipped_frames": 4},
+                         self.connection.metrics())
+
+    async def test_client_past_send_limit_is_disconnected(self):
+        self.websocket.buffered = 2000
+        self.assertTrue(self.server.lagging(self.websocket, self.latest_frame))
+        await asyncio.sleep(0)
+        self.assertEqual(SLOW_CLIENT_CLOSE_CODE, self.websocket.close_code)
+        self.assertEqual({"slow_disconnects": 1}, self.server.metrics.events)
+        self.assertEqual([], self.websocket.sent)
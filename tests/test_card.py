@@ -1,6 +1,10 @@
+import copy
+import pickle
 import unittest
-from src.card import create_card, create_deck_from_preset, create_deck_from_array,\
-    Monster
+from dataclasses import FrozenInstanceError
+
+from src.card import create_card, create_deck_from_preset, create_deck_from_array, CardCatalog,\
+    Monster, Spell, resolve_effect, validate_template
 
 
 class TestGameMethods(unittest.TestCase):
@@ -70,3 +74,87 @@ class TestMonster(unittest.TestCase):
         self.assertEqual(card1_repr, result1)
         self.assertEqual(card2_repr, result2)
         self.assertEqual(card3_repr, result3)
+
+
+class TestCardCatalog(unittest.TestCase):
+    def test_lookup_ignores_case_and_spaces(self):
+        catalog = CardCatalog()
+        self.assertEqual("Dark Magician", catalog.create_card("darkmagician").name)
+        self.assertEqual("Dark Magician", catalog.create_card("DARK MAGICIAN").name)
+        self.assertIn("Dark Hole", catalog)
+        self.assertNotIn("vcwefw", catalog)
+
+    def test_catalog_creates_new_card_per_lookup(self):
+        catalog = CardCatalog()
+        card1 = catalog.create_card("Tomozaurus")
+        card2 = catalog.create_card("Tomozaurus")
+        card1.attack_points = 0
+        self.assertIsNot(card1, card2)
+        self.assertNotEqual(0, card2.attack_points)
+
+    def test_reload_reads_catalog_again(self):
+        catalog = CardCatalog()
+        size = len(catalog)
+        catalog.reload()
+        self.assertEqual(size, len(catalog))
+
+
+class TestCardTemplate(unittest.TestCase):
+    def test_cards_share_template(self):
+        card1 = create_card("Dark Magician")
+        card2 = create_card("Dark Magician")
+        self.assertIs(card1.template, card2.template)
+        card1.attack_points += 500
+        self.assertEqual(2500, card2.attack_points)
+        self.assertEqual(2500, card1.base_atk)
+
+    def test_template_is_immutable(self):
+        card = create_card("Dark Hole")
+        with self.assertRaises(FrozenInstanceError):
+            card.template.name = "Light Hole"
+
+    def test_cards_have_no_instance_dict(self):
+        self.assertFalse(hasattr(create_card("Tomozaurus"), "__dict__"))
+        self.assertFalse(hasattr(create_card("Ookazi"), "__dict__"))
+
+    def test_pickled_card_keeps_state(self):
+        card = create_card("Book of Secret Arts")
+        card.position = Spell.Position.FACE_DOWN
+        unpickled = pickle.loads(pickle.dumps(card))
+        self.assertEqual(card, unpickled)
+        self.assertEqual(repr(card), repr(unpickled))
+        self.assertEqual("Spellcaster", unpickled.required_monster_type)
+
+
+class TestCardPrototype(unittest.TestCase):
+    def test_created_cards_are_clones_of_prototype(self):
+        catalog = CardCatalog()
+        prototype = catalog.get_prototype("Book of Secret Arts")
+        card = catalog.create_card("Book of Secret Arts")
+        self.assertIsNot(prototype, card)
+        self.assertIs(prototype.template, card.template)
+        card.equipped_monster = create_card("Dark Magician")
+        self.assertIsNone(prototype.equipped_monster)
+
+    def test_name_variants_share_prototype(self):
+        catalog = CardCatalog()
+        prototype = catalog.get_prototype("Dark Magician")
+        for name in ("darkmagician", "DARK MAGICIAN", "Dark  Magician"):
+            self.assertIs(prototype, catalog.get_prototype(name))
+            catalog.create_card(name)
+        self.assertEqual(1, len(catalog._ids))
+        self.assertEqual(1, len(catalog._prototypes))
+
+    def test_clone_copies_state(self):
+        monster = create_card("Dark Magician")
+        monster.battle_pos = Monster.DEF
+        monster.attack_points = 100
+        clone = copy.copy(monster)
+        self.assertEqual(repr(monster), repr(clone))
+
+    def test_invalid_effect_is_rejected(self):
+        with self.assertRaises(ValueError):
+            resolve_effect("Player")
+        template = Spell.create_template("Bad Hole", "normal", "", resolve_effect("destroy_all_monsters"), [1000])
+        with self.assertRaises(ValueError):
+            validate_template(template)
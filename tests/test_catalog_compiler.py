@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+from src.catalog_compiler import CompiledCatalog, StaleCatalogError, compile_catalog, compile_catalog_file, \
+    load_compiled_catalog
+
+CATALOG = b'''Hitotsu-Me Giant,Monster,Earth,Beast-Warrior,4,1200,1000,"A one-eyed behemoth",
+Dark Hole,Spell,Normal,"""Destroy all monsters on the field.""",destroy_all_monsters
+Hitotsu-Me Giant,Monster,Earth,Beast-Warrior,4,1,1,,
+Invigoration,Spell,Equip,"""An EARTH monster gains 400 ATK.""",alter_monster_stats,400,-200,Earth
+'''
+
+
+class TestCompiledCatalog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.directory.name, "cards.csv")
+        with open(self.csv_path, 'wb') as csvfile:
+            csvfile.write(CATALOG)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_find_and_read_records(self):
+        catalog = CompiledCatalog(compile_catalog(CATALOG))
+        self.assertEqual(3, len(catalog))
+        giant = catalog.record(catalog.find("hitotsu-me giant"))
+        self.assertEqual("Hitotsu-Me Giant", giant["name"])
+        self.assertEqual(1200, giant["attack_points"])
+        self.assertEqual("A one-eyed behemoth", giant["description"])
+        invigoration = catalog.record(catalog.find("Invigoration"))
+        self.assertEqual("alter_monster_stats", invigoration["effect"])
+        self.assertEqual(["400", "-200", "Earth"], invigoration["effect_args"])
+        self.assertEqual([], catalog.record(catalog.find("Dark Hole"))["effect_args"])
+        self.assertEqual(-1, catalog.find("vcwefw"))
+
+    def test_corrupt_catalog_is_rejected(self):
+        compiled = bytearray(compile_catalog(CATALOG))
+        compiled[-1] ^= 0xFF
+        with self.assertRaises(StaleCatalogError):
+            CompiledCatalog(bytes(compiled))
+
+    def test_stale_catalog_is_recompiled(self):
+        compiled_path = compile_catalog_file(self.csv_path)
+        with open(self.csv_path, 'ab') as csvfile:
+            csvfile.write(b"Ookazi,Spell,Normal,Inflict 800 damage,decrease_opponent_life_points,800\n")
+        with self.assertRaises(StaleCatalogError):
+            with open(self.csv_path, 'rb') as csvfile:
+                CompiledCatalog.open(compiled_path, csvfile.read())
+        catalog = load_compiled_catalog(self.csv_path)
+        self.assertEqual(4, len(catalog))
+        self.assertNotEqual(-1, catalog.find("Ookazi"))
+        catalog.close()
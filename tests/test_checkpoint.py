@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from src.card import create_deck_from_preset
+from src.checkpoint import CheckpointStore
+from src.moves import decode_command
+from src.session import SessionRegistry
+from src.state_sync import snapshot_game
+
+
+class TestCheckpointStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = CheckpointStore(self.directory.name, compact_after=4, fsync=False)
+        self.registry = SessionRegistry()
+        self.session = self.registry.create(1, ["a", "b"])
+        self.store.track(self.session)
+        deck = [card.name for card in create_deck_from_preset("sources/preset1")]
+        for name in ("Yugi", "Kaiba"):
+            self.play({"operation": "create", "player_name": name, "deck": deck, "session_id": 1})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def play(self, request: dict):
+        self.store.record(self.session, request)
+        try:
+            self.session.game.execute(decode_command(request))
+        except (IndexError, AttributeError, TypeError, ValueError):
+            pass  # failed moves are recorded too
+
+    def lines(self) -> int:
+        with open(self.store.path(1)) as infile:
+            return len(infile.readlines())
+
+    def assert_restored(self):
+        [(session_id, game, tokens)] = self.store.load()
+        self.assertEqual(1, session_id)
+        self.assertEqual(self.session.tokens, tokens)
+        self.assertEqual(snapshot_game(self.session.game.game), snapshot_game(game.game))
+        self.assertEqual(self.session.game.current_turn, game.current_turn)
+        self.assertEqual(self.session.game.game_logger.get_logs(), game.game_logger.get_logs())
+
+    def test_restores_checkpoint_and_replayed_requests(self):
+        self.store.write(self.store.collect())
+        self.assertEqual(1, self.lines())
+        self.play({"operation": "update", "player": 0, "move": "draw_card", "args": [5], "session_id": 1})
+        self.play({"operation": "update", "move": "normal_summon", "args": [0], "session_id": 1})
+        self.play({"operation": "update", "move": "attack_player", "args": [4], "session_id": 1})  # fails
+        self.store.write(self.store.collect())
+        self.assertEqual(4, self.lines())
+        self.assert_restored()
+
+    def test_file_is_compacted(self):
+        self.store.write(self.store.collect())
+        for _ in range(4):
+            self.play({"operation": "update", "move": "change_turn", "session_id": 1})
+        self.store.write(self.store.collect())
+        self.assertEqual(1, self.lines())
+        self.assert_restored()
+
+    def test_record_cut_short_is_ignored(self):
+        self.store.write(self.store.collect())
+        with open(self.store.path(1), 'a') as outfile:
+            outfile.write('{"request": {"operation": "upd')
+        self.assert_restored()
+
+    def test_forgotten_session_is_deleted(self):
+        self.store.write(self.store.collect())
+        self.store.forget(self.session)
+        self.store.write(self.store.collect())
+        self.assertFalse(os.path.exists(self.store.path(1)))
+        self.assertEqual([], self.store.load())
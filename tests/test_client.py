@@ -0,0 +1,51 @@
+import json
+import unittest
+
+from src.card import create_deck_from_preset
+from src.client import NetworkCli
+from src.yugioh import Yugioh
+
+
+class ServerWebsocket:
+    """Plays the server side of a client connection from a list of frames."""
+    subprotocol = None
+
+    def __init__(self, frames: list):
+        self.frames = frames
+        self.sent = []
+
+    async def send(self, data):
+        self.sent.append(json.loads(data))
+
+    async def recv(self):
+        return self.frames.pop(0)
+
+
+class TestClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.game = Yugioh()
+        deck = [card.name for card in create_deck_from_preset("sources/preset1")]
+        for name in ("Yugi", "Kaiba"):
+            self.game.create_game({"player_name": name, "deck": deck, "session_id": 1})
+        self.client = NetworkCli("ws://localhost")
+        self.client.session_id = 1
+        self.client.apply_state_frame(self.game.state_frame(-1, 0))
+
+    async def test_rejected_move_keeps_the_game_and_asks_for_the_state(self):
+        game = self.client.yugioh_game
+        error = json.dumps({"type": "error", "message": "Invalid move."})
+        self.assertFalse(self.client.apply_state_frame(error))
+        self.assertIs(game, self.client.yugioh_game)
+        self.client.client_socket = ServerWebsocket([error, self.game.state_frame(-1, 0)])
+        await self.client.send_data_and_update_game({"operation": "update", "session_id": 1, "move": "attack"})
+        self.assertEqual(["update", "read"], [request["operation"] for request in self.client.client_socket.sent])
+        self.assertEqual(self.game.version, self.client.game_version())
+
+    async def test_batch_results_come_before_the_state(self):
+        seen = self.game.version
+        self.game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [5]})
+        batch = json.dumps({"type": "batch", "version": self.game.version, "results": [None]})
+        self.client.client_socket = ServerWebsocket([batch, self.game.state_frame(seen, 0)])
+        await self.client.receive_game_update()
+        self.assertEqual([], self.client.client_socket.sent)
+        self.assertEqual(self.game.version, self.client.game_version())
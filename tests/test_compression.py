@@ -0,0 +1,59 @@
+import types
+import unittest
+import zlib
+
+from src.compression import DICTIONARY_PATH, FrameCompressor, codec_of, load_compressor, record_sample_frames, \
+    train_dictionary
+from src.connection import ClientConnection
+from src.protocol import BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL, select_subprotocol, subprotocols
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.samples = record_sample_frames()
+        self.compressor = FrameCompressor(train_dictionary(self.samples))
+
+    def test_shipped_dictionary_matches_training(self):
+        self.assertEqual(self.compressor.dictionary, load_compressor(DICTIONARY_PATH).dictionary)
+
+    def test_round_trip_and_ratio(self):
+        plain = FrameCompressor(b'')
+        for frame in record_sample_frames(seed=3):
+            compressed = self.compressor.compress(frame)
+            self.assertEqual(frame, self.compressor.decompress(compressed))
+            plain.compress(frame)
+        report = self.compressor.report()
+        self.assertGreater(report["ratio"], 2 * plain.report()["ratio"])
+        self.assertIsNotNone(report["cpu_us_per_frame"])
+
+    def test_seed_changes_the_games(self):
+        others = set(record_sample_frames(seed=1))
+        self.assertLess(len(others.intersection(self.samples)), len(others) // 4)
+        self.assertEqual(self.samples, record_sample_frames())
+
+    def test_frames_are_compressed_once(self):
+        frame = self.samples[0]
+        self.assertIs(self.compressor.compress(frame), self.compressor.compress(frame))
+        self.assertEqual(1, self.compressor.frames_compressed)
+        self.assertEqual(2, self.compressor.frames_sent)
+
+    def test_other_dictionary_cannot_decompress(self):
+        compressed = self.compressor.compress(self.samples[-1])
+        with self.assertRaises(zlib.error):
+            FrameCompressor(b'another dictionary').decompress(compressed)
+
+    def test_negotiation(self):
+        codec = self.compressor.codec
+        supported = subprotocols([codec])
+        self.assertEqual(BINARY_SUBPROTOCOL + "+" + codec, supported[0])
+        self.assertIsNone(select_subprotocol([], supported))
+        self.assertEqual(JSON_SUBPROTOCOL, select_subprotocol(["%s+zlib.00000000" % JSON_SUBPROTOCOL,
+                                                               JSON_SUBPROTOCOL], supported))
+
+        connection = ClientConnection(types.SimpleNamespace(subprotocol=supported[1]), self.compressor)
+        self.assertFalse(connection.binary)
+        self.assertEqual(codec, codec_of(supported[1]))
+        self.assertEqual(self.samples[0], self.compressor.decompress(connection.encode_frame(self.samples[0])))
+        connection = ClientConnection(types.SimpleNamespace(subprotocol=BINARY_SUBPROTOCOL), self.compressor)
+        self.assertTrue(connection.binary)
+        self.assertIs(self.samples[0], connection.encode_frame(self.samples[0]))
@@ -0,0 +1,39 @@
+import json
+import unittest
+
+from src.server import RESTART_CLOSE_CODE, YugiohServer
+from tests.test_backpressure import FakeWebsocket
+
+
+class TestDrain(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = YugiohServer("localhost", 0, drain_timeout=1)
+        self.players = [FakeWebsocket(), FakeWebsocket()]
+        self.session = self.server.sessions.create(1, self.players)
+
+    async def test_draining_server_refuses_new_clients(self):
+        self.server.drain()
+        websocket = FakeWebsocket()
+        await self.server.refuse(websocket)
+        refusal = json.loads(websocket.sent[0])
+        self.assertEqual("Server restarting.", refusal["message"])
+        self.assertIn("retry_after", refusal)
+        self.assertEqual(RESTART_CLOSE_CODE, websocket.close_code)
+        self.assertTrue(self.server.matchmaker.closed)
+        self.assertEqual(1, self.server.gauges()["draining"])
+
+    async def test_drained_once_games_end(self):
+        self.server.connections = {player: None for player in self.players}
+        self.server.drain()
+        for player in self.players:
+            self.server.sessions.disconnect(self.session, player)
+        await self.server.drained()
+        self.assertEqual([RESTART_CLOSE_CODE] * 2, [player.close_code for player in self.players])
+
+    async def test_drain_timeout_closes_games_in_progress(self):
+        self.server.drain_timeout = 0
+        self.server.connections = {player: None for player in self.players}
+        self.server.drain()
+        await self.server.drained()
+        self.assertTrue(self.session.live)
+        self.assertEqual([RESTART_CLOSE_CODE] * 2, [player.close_code for player in self.players])
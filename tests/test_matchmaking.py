@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+
+from src.matchmaking import Match, MatchCancelled, Matchmaker, MatchmakerClosed, MatchTimeout, SessionIdAllocator
+
+
+class TestMatchmaker(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.started = []
+        self.matchmaker = Matchmaker(on_match=lambda session_id, players: self.started.append((session_id, players)))
+
+    async def test_pairs_in_arrival_order(self):
+        first = asyncio.create_task(self.matchmaker.find_match("a"))
+        await asyncio.sleep(0)
+        self.assertEqual(1, self.matchmaker.waiting)
+        self.assertEqual(Match(1, 1), await self.matchmaker.find_match("b"))
+        self.assertEqual(Match(1, 0), await first)
+        self.assertEqual([(1, ["a", "b"])], self.started)
+        self.assertEqual(0, self.matchmaker.waiting)
+
+    async def test_session_ids_are_monotonic(self):
+        matchmaker = Matchmaker(session_ids=SessionIdAllocator(start=7))
+        for session_id in (7, 8, 9):
+            waiting = asyncio.create_task(matchmaker.find_match("a"))
+            await asyncio.sleep(0)
+            self.assertEqual(Match(session_id, 1), await matchmaker.find_match("b"))
+            self.assertEqual(session_id, (await waiting).session_id)
+        self.assertEqual(3, matchmaker.matches)
+
+    async def test_timeout(self):
+        with self.assertRaises(MatchTimeout):
+            await self.matchmaker.find_match("a", timeout=0.01)
+        self.assertEqual(0, self.matchmaker.waiting)
+
+    async def test_cancelled_when_connection_closes(self):
+        closed = asyncio.get_running_loop().create_future()
+        waiting = asyncio.create_task(self.matchmaker.find_match("a", closed))
+        await asyncio.sleep(0)
+        closed.set_result(None)
+        with self.assertRaises(MatchCancelled):
+            await waiting
+        self.assertEqual(0, self.matchmaker.waiting)
+
+    async def test_closed_matchmaker_sends_players_away(self):
+        waiting = asyncio.create_task(self.matchmaker.find_match("a"))
+        await asyncio.sleep(0)
+        self.matchmaker.close()
+        with self.assertRaises(MatchmakerClosed):
+            await waiting
+        with self.assertRaises(MatchmakerClosed):
+            await self.matchmaker.find_match("b")
+        self.assertEqual(0, self.matchmaker.waiting)
+        self.assertEqual([], self.started)
+
+    async def test_cancelled_tickets_are_skipped(self):
+        with self.assertRaises(MatchTimeout):
+            await self.matchmaker.find_match("gone", timeout=0.01)
+        waiting = asyncio.create_task(self.matchmaker.find_match("a"))
+        await asyncio.sleep(0)
+        await self.matchmaker.find_match("b")
+        self.assertEqual(Match(1, 0), await waiting)
+        self.assertEqual([(1, ["a", "b"])], self.started)
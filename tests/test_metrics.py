@@ -0,0 +1,67 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from src.metrics import Histogram, Metrics, MetricsExporter
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.observe_command("update", "normal_summon", 0.0002)
+        self.metrics.observe_command("update", "normal_summon", 0.003, failed=True)
+        self.metrics.observe_command("read", "", 2.0)
+        self.metrics.count_received("update", 120)
+        self.metrics.count_sent("broadcast", 500, messages=3)
+        self.metrics.count_event("slow_disconnects")
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram((1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(value)
+        self.assertEqual([("1", 2), ("2", 3), ("+Inf", 4)], histogram.cumulative())
+        self.assertEqual(6, histogram.sum)
+
+    def test_prometheus_text(self):
+        text = self.metrics.to_prometheus({"connections": 4, "sessions": {"live": 2, "retained": 1}})
+        self.assertIn('yugioh_command_seconds_bucket{operation="update",move="normal_summon",le="0.00025"} 1', text)
+        self.assertIn('yugioh_command_seconds_bucket{operation="read",move="",le="+Inf"} 1', text)
+        self.assertIn('yugioh_command_seconds_count{operation="update",move="normal_summon"} 2', text)
+        self.assertIn('yugioh_command_errors_total{operation="update",move="normal_summon"} 1', text)
+        self.assertIn('yugioh_bytes_sent_total{type="broadcast"} 1500', text)
+        self.assertIn('yugioh_messages_received_total{type="update"} 1', text)
+        self.assertIn("yugioh_loop_lag_seconds_count 0", text)
+        self.assertIn("yugioh_slow_disconnects_total 1", text)
+        self.assertIn("yugioh_connections 4", text)
+        self.assertIn('yugioh_sessions{state="retained"} 1', text)
+
+    def test_json_dump(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            MetricsExporter(self.metrics, lambda: {"connections": 4}, None, path).dump()
+            with open(path) as infile:
+                dump = json.load(infile)
+        self.assertEqual(1, dump["commands"]["update:normal_summon"]["errors"])
+        self.assertEqual(1, dump["commands"]["read"]["count"])
+        self.assertEqual({"messages": 3, "bytes": 1500}, dump["sent"]["broadcast"])
+        self.assertEqual(4, dump["gauges"]["connections"])
+
+
+class TestMetricsExporter(unittest.IsolatedAsyncioTestCase):
+    async def get(self, path: str) -> bytes:
+        exporter = MetricsExporter(Metrics(), lambda: {"connections": 1})
+        server = await asyncio.start_server(exporter.handle, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname())
+        writer.write(b"GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % path.encode())
+        response = await reader.read()
+        writer.close()
+        server.close()
+        return response
+
+    async def test_endpoints(self):
+        self.assertIn(b"yugioh_connections 1", await self.get("/metrics"))
+        self.assertEqual({"connections": 1}, json.loads((await self.get("/metrics.json")).split(b"\r\n\r\n")[1])
+                         ["gauges"])
+        self.assertTrue((await self.get("/")).startswith(b"HTTP/1.0 404"))
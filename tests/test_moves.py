@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import patch
+
+from src import protocol
+from src.card import create_deck_from_preset
+from src.game import GameController
+from src.moves import ALL, MOVES, OPERATIONS, REQUESTER, BatchFailed, InvalidCommand, decode_command, register_move
+from src.state_sync import snapshot_game
+from src.yugioh import Yugioh
+
+
+class TestMoves(unittest.TestCase):
+    def setUp(self):
+        self.yugioh_game = Yugioh()
+        deck = [card.name for card in create_deck_from_preset("sources/preset1")]
+        self.yugioh_game.create_game({"player_name": "Yugi", "deck": deck, "session_id": 1})
+        self.yugioh_game.create_game({"player_name": "Kaiba", "deck": deck, "session_id": 1})
+
+    def test_binary_protocol_knows_every_move(self):
+        self.assertEqual(len(MOVES), len({move.code for move in MOVES.values()}))
+        for name in MOVES:
+            request = {"operation": "update", "session_id": 1, "move": name}
+            self.assertEqual(name, protocol.decode_request(protocol.encode_request(request))["move"])
+
+    def test_binary_protocol_knows_every_operation(self):
+        self.assertEqual(len(OPERATIONS), len({operation.code for operation in OPERATIONS.values()}))
+        for name in OPERATIONS:
+            request = {"operation": name, "session_id": 1, "moves": [{"move": "change_turn"}],
+                       "player_name": "Yugi", "deck": []}
+            self.assertEqual(name, protocol.decode_request(protocol.encode_request(request))["operation"])
+
+    def test_move_codes_are_not_reused(self):
+        with self.assertRaises(ValueError):
+            register_move("draw_cards", MOVES["draw_card"].code)
+
+    def test_decode(self):
+        command = decode_command({"operation": "update", "session_id": 1, "player": 1, "move": "draw_card",
+                                  "args": [2]})
+        self.assertIs(MOVES["draw_card"], command.move)
+        self.assertEqual((1, (2,)), (command.player, command.args))
+        self.assertEqual(REQUESTER, command.audience)
+        self.assertEqual(REQUESTER, decode_command({"operation": "read", "session_id": 1}).audience)
+        self.assertEqual(ALL, decode_command({"operation": "update", "move": "change_turn", "args": []}).audience)
+        self.assertEqual((), decode_command({"operation": "update", "player": 0, "move": "draw_card"}).args)
+
+    def test_invalid_requests_are_rejected(self):
+        for request in [[], {"operation": "drop"}, {"operation": "update", "move": "pot_of_greed", "args": []},
+                        {"operation": "update", "move": "draw_card", "args": [1]},
+                        {"operation": "update", "player": 2, "move": "draw_card", "args": [1]},
+                        {"operation": "update", "move": "normal_summon", "args": []},
+                        {"operation": "update", "move": "normal_summon", "args": [0, 1]},
+                        {"operation": "update", "move": "normal_summon", "args": [-1]},
+                        {"operation": "update", "move": "normal_summon", "args": ["0"]},
+                        {"operation": "update", "move": "normal_summon", "args": [True]},
+                        {"operation": "update", "move": "attack_player", "args": 0}]:
+            with self.assertRaises(InvalidCommand, msg=request):
+                decode_command(request)
+
+    def test_invalid_move_does_not_change_game(self):
+        version = self.yugioh_game.version
+        with self.assertRaises(InvalidCommand):
+            self.yugioh_game.update_game({"session_id": 1, "move": "normal_summon", "args": [-1]})
+        self.assertEqual(version, self.yugioh_game.version)
+
+    def test_execute_logs_move(self):
+        self.yugioh_game.execute(decode_command({"operation": "update", "session_id": 1, "player": 0,
+                                                 "move": "draw_card", "args": [1]}))
+        self.yugioh_game.execute(decode_command({"operation": "update", "session_id": 1, "move": "normal_summon",
+                                                 "args": [0]}))
+        self.assertEqual(1, len(self.yugioh_game.game_logger.get_logs()))
+        self.assertIn("normal summoned", self.yugioh_game.game_logger.get_logs()[0]["message"])
+
+    def test_batch_is_applied_as_one_change(self):
+        version = self.yugioh_game.version
+        batch = self.yugioh_game.update_batch({"session_id": 1, "moves": [
+            {"player": 0, "move": "draw_card", "args": [2]}, {"move": "normal_summon", "args": [0]},
+            {"move": "change_turn"}]})
+        self.assertEqual(version + 1, self.yugioh_game.version)
+        self.assertEqual(["draw_card", "normal_summon", "change_turn"], [result["move"] for result in batch.results])
+        self.assertIn("normal summoned", batch.results[1]["log"])
+        self.assertEqual(self.yugioh_game.version, batch.reply["version"])
+        self.assertEqual(ALL, decode_command({"operation": "update_batch", "moves": [
+            {"player": 0, "move": "draw_card"}, {"move": "change_turn"}]}).audience)
+
+    def test_failed_batch_changes_nothing(self):
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [1]})
+        version = self.yugioh_game.version
+        before = snapshot_game(self.yugioh_game.game)
+        with self.assertRaises(BatchFailed) as failed:
+            self.yugioh_game.update_batch({"session_id": 1, "moves": [
+                {"move": "normal_summon", "args": [0]}, {"move": "change_turn"},
+                {"move": "attack_monster", "args": [0, 0]}]})
+        self.assertEqual(2, failed.exception.index)
+        self.assertEqual(version, self.yugioh_game.version)
+        self.assertEqual(before, snapshot_game(self.yugioh_game.game))
+        self.assertEqual([], self.yugioh_game.game_logger.get_logs())
+        self.yugioh_game.update_game({"session_id": 1, "move": "normal_summon", "args": [0]})
+        self.assertEqual(1, len(self.yugioh_game.game_logger.get_logs()))
+        with patch.object(GameController, "change_turn", side_effect=KeyError("Dark Magician")):
+            with self.assertRaises(KeyError):
+                self.yugioh_game.update_batch({"session_id": 1, "moves": [
+                    {"player": 0, "move": "draw_card", "args": [1]}, {"move": "normal_summon", "args": [0]},
+                    {"move": "change_turn"}]})
+        self.assertEqual(1, len(self.yugioh_game.game_logger.get_logs()))
+        self.assertEqual(version + 1, self.yugioh_game.version)
+        self.assertEqual([], self.yugioh_game.game.get_current_player().hand)
+        for moves in ([], [{"move": "change_turn"}] * 65, [{"move": "change_turn"}, {"move": "summon"}]):
+            with self.assertRaises(InvalidCommand):
+                decode_command({"operation": "update_batch", "moves": moves})
@@ -0,0 +1,87 @@
+import json
+import pickle
+import struct
+import unittest
+
+from src.protocol import ProtocolError, decode_request, decode_snapshot, encode_request, encode_snapshot, \
+    is_snapshot_frame
+from src.state_sync import game_from_snapshot, snapshot_game, view_game
+from src.yugioh import Yugioh
+
+
+class TestProtocol(unittest.TestCase):
+    def setUp(self):
+        self.yugioh_game = Yugioh()
+        self.deck = ["Hitotsu-Me Giant", "Dark Magician", "Book of Secret Arts", "Curtain of the Dark One",
+                     "Mammoth Graveyard", "Dark Hole", "Silver Fang", "Tomozaurus"]
+        self.yugioh_game.create_game({"player_name": "Yugi", "deck": self.deck, "session_id": 1})
+        self.yugioh_game.create_game({"player_name": "Kaiba", "deck": self.deck, "session_id": 1})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [4]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 1, "move": "draw_card", "args": [4]})
+
+    def assert_snapshot_round_trips(self):
+        snapshot = snapshot_game(self.yugioh_game.game)
+        frame = encode_snapshot(snapshot)
+        self.assertTrue(is_snapshot_frame(frame))
+        self.assertEqual(snapshot, decode_snapshot(frame))
+        self.assertEqual(snapshot, snapshot_game(game_from_snapshot(decode_snapshot(frame))))
+        return frame
+
+    def test_snapshot_round_trip(self):
+        self.assert_snapshot_round_trips()
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_summon", "args": [1]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "equip_spell", "args": [0, 1]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "change_turn", "args": []})
+        self.yugioh_game.update_game({"session_id": 1, "player": 1, "move": "normal_set", "args": [0]})
+        frame = self.assert_snapshot_round_trips()
+        game = game_from_snapshot(decode_snapshot(frame))
+        self.assertIs(game.players[0].monster_field[0], game.players[0].spell_trap_field[0].equipped_monster)
+
+    def test_view_round_trip(self):
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_set", "args": [0]})
+        for seat in range(2):
+            frame = self.yugioh_game.read_game({"session_id": 1, "get_binary": True, "seat": seat})
+            self.assertEqual(view_game(snapshot_game(self.yugioh_game.game), seat), decode_snapshot(frame))
+
+    def test_snapshot_is_smaller_than_json_and_pickle(self):
+        frame = self.yugioh_game.read_game({"session_id": 1, "get_binary": True})
+        self.assertTrue(is_snapshot_frame(frame))
+        self.assertLess(len(frame), len(pickle.dumps(self.yugioh_game.game)) // 4)
+        self.assertLess(len(frame), len(self.yugioh_game.read_game({"session_id": 1, "get_json": True})) // 10)
+
+    def test_snapshot_rejects_other_catalog(self):
+        frame = bytearray(encode_snapshot(snapshot_game(self.yugioh_game.game)))
+        struct.pack_into('<I', frame, 4, struct.unpack_from('<I', frame, 4)[0] ^ 1)
+        with self.assertRaises(ProtocolError):
+            decode_snapshot(bytes(frame))
+
+    def test_snapshot_rejects_truncated_frame(self):
+        frame = encode_snapshot(snapshot_game(self.yugioh_game.game))
+        with self.assertRaises(ProtocolError):
+            decode_snapshot(frame[:len(frame) // 2])
+
+    def test_request_round_trip(self):
+        requests = [{"operation": "create", "session_id": 3, "player_name": "Yugi", "deck": self.deck,
+                     "player_place": 1},
+                    {"operation": "create", "session_id": 3, "player_name": "Kaiba", "deck": self.deck},
+                    {"operation": "update", "session_id": 3, "player": 1, "move": "tribute_summon", "args": [2, 0, 1]},
+                    {"operation": "update", "session_id": 3, "move": "change_turn", "args": []},
+                    {"operation": "read", "session_id": 3, "get_game_actions": True},
+                    {"operation": "delete", "session_id": 3},
+                    {"operation": "update_batch", "session_id": 3,
+                     "moves": [{"player": 0, "move": "draw_card", "args": [1]}, {"move": "normal_summon", "args": [0]},
+                               {"move": "change_turn"}]}]
+        for request in requests:
+            self.assertEqual(request, decode_request(encode_request(request)))
+
+    def test_request_drops_format_preferences(self):
+        request = {"operation": "read", "session_id": 3, "get_pickle": True, "delta": True, "ack": 5}
+        self.assertEqual({"operation": "read", "session_id": 3}, decode_request(encode_request(request)))
+
+    def test_request_rejects_unknown_card(self):
+        with self.assertRaises(ProtocolError):
+            encode_request({"operation": "create", "session_id": 3, "player_name": "Yugi", "deck": ["No Such Card"]})
+
+    def test_request_rejects_bad_frame(self):
+        with self.assertRaises(ProtocolError):
+            decode_request(json.dumps({"operation": "read"}).encode('utf-8'))
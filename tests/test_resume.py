@@ -0,0 +1,53 @@
+import json
+import unittest
+
+from src.card import create_deck_from_preset
+from src.connection import ClientConnection
+from src.protocol import BINARY_SUBPROTOCOL, is_snapshot_frame
+from src.server import YugiohServer, session_of_path
+from src.yugioh import Yugioh
+from tests.test_backpressure import FakeWebsocket
+
+
+class TestResume(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = YugiohServer("localhost", 0)
+        self.game = Yugioh()
+        deck = [card.name for card in create_deck_from_preset("sources/preset1")]
+        for name in ("Yugi", "Kaiba"):
+            self.game.create_game({"player_name": name, "deck": deck, "session_id": 1})
+        self.game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [5]})
+
+    def connect(self, subprotocol: str = None) -> ClientConnection:
+        websocket = FakeWebsocket()
+        websocket.subprotocol = subprotocol
+        connection = self.server.connections[websocket] = ClientConnection(websocket)
+        connection.seat = 0
+        return connection
+
+    def test_resume_paths(self):
+        self.assertEqual(3, session_of_path("/resume/3?token=a-b_c&ack=12"))
+        self.assertEqual(3, session_of_path("/resume/3?token=abc"))
+        self.assertEqual(4, session_of_path("/watch/4"))
+        self.assertIsNone(session_of_path("/"))
+
+    async def test_missed_changes_are_replayed_as_one_patch(self):
+        seen = self.game.version
+        self.game.state_frame(-1, 0)  # the last frame the client received
+        self.game.update_game({"session_id": 1, "move": "normal_summon", "args": [0]})
+        self.game.update_game({"session_id": 1, "move": "change_turn"})
+        connection = self.connect()
+        frame = json.loads(self.server.resume_frame(connection, self.game, seen))
+        self.assertEqual((seen, self.game.version), (frame["base"], frame["version"]))
+        self.assertTrue(connection.delta)
+        self.assertEqual(self.game.version, connection.version)
+        self.assertEqual({"resume_replays": 1}, self.server.metrics.events)
+
+    async def test_client_too_far_behind_gets_snapshot(self):
+        connection = self.connect()
+        frame = json.loads(self.server.resume_frame(connection, self.game, 1))
+        self.assertEqual(-1, frame["base"])
+        self.assertEqual({"resume_snapshots": 1}, self.server.metrics.events)
+        self.assertTrue(is_snapshot_frame(self.server.resume_frame(self.connect(BINARY_SUBPROTOCOL), self.game, 1)))
+        self.assertEqual("state", json.loads(self.server.resume_frame(self.connect(), self.game))["type"])
+        self.assertEqual({"resume_snapshots": 3}, self.server.metrics.events)
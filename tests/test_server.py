@@ -29,10 +29,13 @@ class TestYugiohServer(IsolatedAsyncioTestCase):
         self.sockets = []
         sleep(1)
 
-    def tearDown(self):
+    async def asyncTearDown(self):
         for sock in self.sockets:
-            sock.close()
+            await sock.close()
+
+    def tearDown(self):
         self.process.terminate()
+        self.process.join()  # the server drains before exiting
 
     async def create_game(self):
         self.sockets.append(await websockets.connect(SERVER_IP))
@@ -57,8 +60,9 @@ class TestYugiohServer(IsolatedAsyncioTestCase):
         create_game_state1 = json.loads(await self.sockets[0].recv())
         create_game_state2 = json.loads(await self.sockets[1].recv())
         create_game_state2 = json.loads(await self.sockets[1].recv())
-        self.assertTrue(create_game_state2["players"][create_game_state2["current_player"]]["name"] == "Yugi")
-        self.assertTrue(create_game_state2["players"][create_game_state2["other_player"]]["name"] == "Kaiba")
+        state = create_game_state2["state"]
+        self.assertTrue(state["players"][state["current_player"]]["name"] == "Yugi")
+        self.assertTrue(state["players"][state["other_player"]]["name"] == "Kaiba")
 
     async def test_yugioh_server_read_game(self):
         await self.create_game()
@@ -72,9 +76,11 @@ class TestYugiohServer(IsolatedAsyncioTestCase):
                                      (json.dumps({"operation": "read", "session_id": self.session_id}).encode('utf-8')))
         read_game_state1 = json.loads(await self.network.recv_data(self.sockets[0]))
         read_game_state2 = json.loads(await self.network.recv_data(self.sockets[1]))
-        self.assertEqual(read_game_state1, read_game_state2)
-        self.assertEqual(create_game_state2, read_game_state1)
         self.assertEqual(create_game_state2, read_game_state2)
+        # Each player only sees the size of the other player's hand
+        self.assertEqual(list, type(read_game_state1["state"]["players"][0]["hand"]))
+        self.assertEqual(int, type(read_game_state1["state"]["players"][1]["hand"]))
+        self.assertEqual(int, type(read_game_state2["state"]["players"][0]["hand"]))
 
     async def test_yugioh_server_delete_game(self):
         await self.create_game()
@@ -85,5 +91,5 @@ class TestYugiohServer(IsolatedAsyncioTestCase):
                                      json.dumps({"operation": "delete", "session_id": self.session_id}).encode("utf-8"))
         delete_game_data1 = json.loads(await self.network.recv_data(self.sockets[0]))
         delete_game_data2 = json.loads(await self.network.recv_data(self.sockets[1]))
-        self.assertTrue(delete_game_data1["session_id"], create_game_state1["session_id"])
-        self.assertTrue(delete_game_data2["session_id"], create_game_state2["session_id"])
+        self.assertTrue(delete_game_data1["state"]["session_id"], create_game_state1["state"]["session_id"])
+        self.assertTrue(delete_game_data2["state"]["session_id"], create_game_state2["state"]["session_id"])
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from src.card import create_deck_from_preset
+from src.session import LogArchive, SessionActor, SessionRegistry, SessionState
+
+
+class TestSessionRegistry(unittest.TestCase):
+    def setUp(self):
+        self.archived = []
+        self.registry = SessionRegistry(grace_period=10, archive=self.archived.append)
+        self.session = self.registry.create(1, ["a", "b"])
+        self.deck = [card.name for card in create_deck_from_preset("sources/preset1")]
+
+    def start(self, session):
+        for name in ("Yugi", "Kaiba"):
+            session.game.create_game({"player_name": name, "deck": self.deck, "session_id": session.session_id})
+            self.registry.update(session)
+
+    def test_states(self):
+        self.assertEqual(SessionState.WAITING, self.session.state)
+        self.start(self.session)
+        self.assertEqual(SessionState.ONGOING, self.session.state)
+        self.session.game.delete_game({"session_id": 1})
+        self.registry.update(self.session)
+        self.assertEqual(SessionState.ENDED, self.session.state)
+        self.assertEqual({"live": 0, "retained": 1, "evicted": 0}, self.registry.gauge())
+
+    def test_abandoned_when_last_player_leaves(self):
+        self.registry.disconnect(self.session, "a")
+        self.assertTrue(self.session.live)
+        self.registry.disconnect(self.session, "b")
+        self.assertEqual(SessionState.ABANDONED, self.session.state)
+
+    def test_reaped_after_grace_period(self):
+        live = self.registry.create(2, ["c", "d"])
+        self.start(self.session)
+        self.session.game.delete_game({"session_id": 1})
+        self.registry.update(self.session)
+        retained_since = self.session.retained_since
+        self.assertEqual([], self.registry.reap(retained_since + 9))
+        self.assertEqual([1], self.registry.reap(retained_since + 10))
+        self.assertNotIn(1, self.registry)
+        self.assertIs(live, self.registry.get(2))
+        self.assertEqual([self.session], self.archived)
+        self.assertEqual({"live": 1, "retained": 0, "evicted": 1}, self.registry.gauge())
+
+    def test_log_archive(self):
+        self.start(self.session)
+        self.session.game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [1]})
+        self.session.game.update_game({"session_id": 1, "move": "normal_summon", "args": [0]})
+        with tempfile.TemporaryDirectory() as directory:
+            LogArchive(directory)(self.session)
+            with open(os.path.join(directory, "session-1.json")) as infile:
+                archived = json.load(infile)
+        self.assertEqual(["Yugi", "Kaiba"], archived["players"])
+        self.assertEqual(self.session.game.game_logger.get_logs(), archived["logs"])
+
+
+class TestSessionActor(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.batches = []
+        self.session = SessionRegistry().create(1, ["a", "b"])
+        self.actor = SessionActor(self.session, lambda session, batch: self.batches.append(batch), inbox_size=3)
+
+    async def asyncTearDown(self):
+        self.actor.stop()
+
+    async def test_commands_are_applied_in_order_in_batches(self):
+        for command in range(3):
+            await self.actor.submit("a", command)
+        self.actor.start()
+        await asyncio.sleep(0)
+        await self.actor.submit("b", 3)
+        await asyncio.sleep(0)
+        self.assertEqual([[("a", 0), ("a", 1), ("a", 2)], [("b", 3)]], self.batches)
+        stats = self.actor.stats()
+        self.assertEqual((0, 3, 4, 2), (stats["depth"], stats["max_depth"], stats["commands"], stats["batches"]))
+        self.assertIsNotNone(stats["service_us_per_batch"])
+
+    async def test_full_inbox_makes_players_wait(self):
+        for command in range(3):
+            await self.actor.submit("a", command)
+        waiting = asyncio.ensure_future(self.actor.submit("a", 3))
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+        self.actor.start()
+        await waiting
+        await asyncio.sleep(0)
+        self.assertEqual(4, sum(len(batch) for batch in self.batches))
+
+    async def test_failed_batch_does_not_stop_actor(self):
+        def handle_batch(session, batch):
+            if batch[0][1] == "bad":
+                raise RuntimeError("bad batch")
+            self.batches.append(batch)
+        self.actor.handle_batch = handle_batch
+        self.actor.start()
+        with self.assertLogs(level="ERROR"):
+            await self.actor.submit("a", "bad")
+            await asyncio.sleep(0)
+        await self.actor.submit("a", "good")
+        await asyncio.sleep(0)
+        self.assertEqual([[("a", "good")]], self.batches)
@@ -0,0 +1,135 @@
+import asyncio
+import socket
+import unittest
+
+from websockets.asyncio.server import serve
+
+from src.connection import ClientConnection
+from src.game import GameStatus
+from src.matchmaking import SessionIdAllocator
+from src.shards import ENDED, HANDOFF, LEFT, PLAYER_HANDOFF, STARTED, ShardRouter, ShardServer
+from tests.test_backpressure import FakeWebsocket
+
+
+class TestShardRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = ShardRouter(3)
+
+    def test_players_of_a_session_share_a_shard(self):
+        for _ in range(3):
+            shard = self.router.route()
+            self.assertEqual(shard, self.router.route())
+            self.router.report(shard, STARTED)
+        self.assertEqual([1, 1, 1], self.router.sessions)
+
+    def test_new_games_go_to_least_loaded_shard(self):
+        self.router.sessions = [2, 0, 1]
+        self.assertEqual(1, self.router.route())
+        self.router.report(1, LEFT)
+        self.router.report(0, ENDED)
+        self.router.report(0, ENDED)
+        self.assertEqual(0, self.router.route())
+
+    def test_player_leaving_before_partner_arrives(self):
+        shard = self.router.route()
+        # The partner was routed before the front heard that the waiting player left, so the partner waits.
+        self.assertEqual(shard, self.router.route())
+        self.router.report(shard, LEFT)
+        self.assertEqual(shard, self.router.route())
+        self.assertFalse(any(self.router.waiting))
+
+    def test_unavailable_shards_are_not_routed(self):
+        shard = self.router.route()
+        self.router.remove(shard)
+        self.assertFalse(any(self.router.waiting))
+        self.assertNotEqual(shard, self.router.route())
+        self.assertIsNone(self.router.route_session(shard + 1))
+        for other in range(3):
+            self.router.remove(other)
+        self.assertIsNone(self.router.route())
+
+    def test_shard_session_ids_do_not_collide(self):
+        shards = [SessionIdAllocator(shard + 1, 3) for shard in range(3)]
+        ids = [allocator.allocate() for _ in range(4) for allocator in shards]
+        self.assertEqual(list(range(1, 13)), sorted(ids))
+
+    def test_restored_session_ids_are_not_allocated_again(self):
+        allocator = SessionIdAllocator(2, 3)
+        self.assertEqual([False, True, False, True], [allocator.owns(session_id) for session_id in (1, 2, 4, 5)])
+        allocator.reserve(8)
+        self.assertEqual(11, allocator.allocate())
+
+    def test_watchers_go_to_the_shard_of_the_session(self):
+        shards = [SessionIdAllocator(shard + 1, 3) for shard in range(3)]
+        for shard, allocator in enumerate(shards):
+            for _ in range(3):
+                self.assertEqual(shard, self.router.route_session(allocator.allocate()))
+        self.assertFalse(any(self.router.waiting))
+
+
+class PlayerWebsocket(FakeWebsocket):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration  # the player leaves at once
+
+
+class TestShardServer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.front, channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.front.setblocking(False)
+        self.server = ShardServer("localhost", channel, 0, 1)
+        self.server.send = lambda websocket, frame, message_type="reply": None
+
+    def tearDown(self):
+        self.front.close()
+        self.server.channel.close()
+
+    def connect(self) -> PlayerWebsocket:
+        websocket = PlayerWebsocket()
+        self.server.connections[websocket] = ClientConnection(websocket)
+        return websocket
+
+    def events(self) -> list:
+        events = []
+        while True:
+            try:
+                events.append(self.front.recv(1))
+            except BlockingIOError:
+                return events
+
+    async def test_game_ends_once_when_a_player_resumes_after_the_end(self):
+        players = [self.connect(), self.connect()]
+        self.server.start_game(1, players)
+        session = self.server.sessions.get(1)
+        session.game.game.game_status = GameStatus.ENDED
+        self.server.sessions.update(session)
+        for player in players:
+            self.server.leave_game(session, player)
+        self.assertEqual([STARTED, ENDED], self.events())
+        await self.server.resume(self.connect(), 1, session.tokens[0])
+        self.assertEqual([], self.events())
+        session.actor.stop()
+
+    async def test_refused_player_left_the_queue(self):
+        await self.server.refuse(self.connect())
+        await self.server.refuse(self.connect(), player=False)
+        self.assertEqual([LEFT], self.events())
+
+    async def test_player_closing_before_the_handshake_left_the_queue(self):
+        async with serve(self.server.handler, "127.0.0.1", 0) as server:
+            for message in (HANDOFF, PLAYER_HANDOFF):
+                client, connection = socket.socketpair()
+                client.close()
+                socket.send_fds(self.front, [message], [connection.fileno()])
+                connection.close()
+            self.server.channel.setblocking(False)
+            self.server.receive_sockets(server)
+            events = []
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                events += self.events()
+                if events and not self.server.unserved:
+                    break
+            self.assertEqual([LEFT], events)
@@ -0,0 +1,75 @@
+import json
+import unittest
+
+import src.card_effects as effects
+from src.card import create_card
+from src.state_codec import decode_state, encode_state
+from src.state_sync import apply_patch, game_from_snapshot, snapshot_game
+from src.yugioh import Yugioh
+
+
+class TestStateCodec(unittest.TestCase):
+    def setUp(self):
+        self.yugioh_game = Yugioh()
+        deck = ["Hitotsu-Me Giant", "Dark Magician", "Book of Secret Arts", "Curtain of the Dark One",
+                "Mammoth Graveyard", "Dark Hole", "Silver Fang", "Tomozaurus"]
+        self.yugioh_game.create_game({"player_name": "Yugi", "deck": deck, "session_id": 1})
+        self.yugioh_game.create_game({"player_name": "Kaiba", "deck": deck, "session_id": 1})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [4]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_summon", "args": [1]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "equip_spell", "args": [0, 1]})
+        self.snapshot = snapshot_game(self.yugioh_game.game)
+
+    def test_state_round_trip(self):
+        game = decode_state(encode_state(self.snapshot))
+        self.assertEqual(self.snapshot, snapshot_game(game))
+        spell = game.players[0].spell_trap_field[0]
+        self.assertIs(effects.EFFECTS["alter_monster_stats"], spell.effect)
+
+    def test_state_frame_through_server_request(self):
+        frame = self.yugioh_game.read_game({"session_id": 1, "get_state": True, "seat": 0})
+        game = decode_state(frame)
+        self.assertEqual([None] * len(self.yugioh_game.game.players[1].hand), game.players[1].hand)
+
+    def test_rejects_non_state_frames(self):
+        for frame in [b'[]', b'{"type":"delta"}', json.dumps({"type": "state", "state": []})]:
+            with self.assertRaises(ValueError):
+                decode_state(frame)
+
+    def test_rejects_unknown_cards_and_fields(self):
+        bad_snapshots = []
+        snapshot = json.loads(json.dumps(self.snapshot))
+        snapshot["players"][0]["deck"][0] = "No Such Card"
+        bad_snapshots.append(snapshot)
+        snapshot = json.loads(json.dumps(self.snapshot))
+        snapshot["players"][0]["hand"][0] = {"name": snapshot["players"][0]["hand"][0], "effect": "exec"}
+        bad_snapshots.append(snapshot)
+        snapshot = json.loads(json.dumps(self.snapshot))
+        snapshot["players"][0]["__class__"] = "Player"
+        bad_snapshots.append(snapshot)
+        snapshot = json.loads(json.dumps(self.snapshot))
+        snapshot["players"][1]["life_points"] = "8000"
+        bad_snapshots.append(snapshot)
+        snapshot = json.loads(json.dumps(self.snapshot))
+        snapshot["players"][0]["spell_trap_field"][0]["equipped_monster"] = ["monster_field", 4]
+        bad_snapshots.append(snapshot)
+        snapshot = json.loads(json.dumps(self.snapshot))
+        snapshot["players"][0]["deck"] = 10 ** 9
+        bad_snapshots.append(snapshot)
+        for snapshot in bad_snapshots:
+            with self.assertRaises(ValueError):
+                game_from_snapshot(snapshot)
+
+    def test_patch_rejects_paths_outside_the_snapshot(self):
+        game = game_from_snapshot(self.snapshot)
+        for patch in [[["=", ["__class__"], "x"]], [["=", ["players", 0, "draw_card"], None]],
+                      [["=", ["players", 0, "hand", 0, "effect"], "print"]], [["~", ["players", 0], 0, 0, []]],
+                      [["=", ["version"], "1"]], [["=", ["players", 5], None]]]:
+            with self.assertRaises(ValueError):
+                apply_patch(game, patch)
+
+    def test_effect_registry(self):
+        self.assertEqual({"increase_life_points", "decrease_opponent_life_points", "destroy_all_monsters",
+                          "destroy_opponent_monster_with_lowest_atk", "alter_monster_stats"}, set(effects.EFFECTS))
+        self.assertNotIn("Player", effects.EFFECTS)
+        self.assertIs(effects.destroy_all_monsters, create_card("Dark Hole").effect)
@@ -0,0 +1,34 @@
+import json
+import unittest
+
+from src.card import create_card
+from src.state_encoder import encode_game, game_to_dict
+from src.yugioh import Yugioh
+
+
+class TestStateEncoder(unittest.TestCase):
+    def setUp(self):
+        self.yugioh_game = Yugioh()
+        deck = ["Dark Magician", "Book of Secret Arts", "Hitotsu-Me Giant", "Dian Keto the Cure Master",
+                "Sword of Dark Destruction", "Tomozaurus"]
+        self.yugioh_game.create_game({"player_name": "Yugi \"King of Games\"", "deck": deck, "session_id": 1})
+        self.yugioh_game.create_game({"player_name": "Kaiba", "deck": deck, "session_id": 1})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [3]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_summon", "args": [0]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "equip_spell", "args": [0, 0]})
+
+    def test_encoded_game_matches_dict(self):
+        self.assertEqual(game_to_dict(self.yugioh_game.game), json.loads(encode_game(self.yugioh_game.game)))
+
+    def test_effect_is_not_encoded(self):
+        spell = self.yugioh_game.game.players[0].spell_trap_field[0]
+        self.assertEqual(create_card("Book of Secret Arts"), spell)
+        encoded = json.loads(encode_game(self.yugioh_game.game))
+        spell_dict = encoded["players"][0]["spell_trap_field"][0]
+        self.assertNotIn("effect", spell_dict)
+        self.assertEqual([300, 300], spell_dict["effect_args"])
+        self.assertEqual("Dark Magician", spell_dict["equipped_monster"]["name"])
+
+    def test_reply_as_json_bytes(self):
+        reply = self.yugioh_game.read_game({"session_id": 1, "get_json": True})
+        self.assertEqual(self.yugioh_game.read_game({"session_id": 1}), json.loads(reply))
@@ -0,0 +1,139 @@
+import json
+import pickle
+import types
+import unittest
+
+from src.card import Monster
+from src.connection import ClientConnection
+from src.game import GameController
+from src.state_sync import HIDDEN_MONSTER, SPECTATOR, StateHistory, apply_patch, diff_snapshots, game_from_snapshot, \
+    snapshot_game, view_game
+from src.yugioh import Yugioh
+
+
+class TestStateSync(unittest.TestCase):
+    def setUp(self):
+        self.yugioh_game = Yugioh()
+        deck = ["Hitotsu-Me Giant", "Dark Magician", "Book of Secret Arts", "Curtain of the Dark One",
+                "Mammoth Graveyard", "Dark Hole", "Silver Fang", "Tomozaurus"]
+        self.yugioh_game.create_game({"player_name": "Yugi", "deck": deck, "session_id": 1})
+        self.yugioh_game.create_game({"player_name": "Kaiba", "deck": deck, "session_id": 1})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [4]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 1, "move": "draw_card", "args": [4]})
+
+    def assert_patch_applies(self, client_game):
+        patch = diff_snapshots(snapshot_game(client_game), snapshot_game(self.yugioh_game.game))
+        patched = apply_patch(client_game, json.loads(json.dumps(patch)))
+        self.assertEqual(snapshot_game(self.yugioh_game.game), snapshot_game(patched))
+        return patched
+
+    def test_patch_summon_equip_and_attack(self):
+        client_game = pickle.loads(pickle.dumps(self.yugioh_game.game))
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_summon", "args": [1]})
+        client_game = self.assert_patch_applies(client_game)
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "equip_spell", "args": [0, 1]})
+        client_game = self.assert_patch_applies(client_game)
+        spell = client_game.players[0].spell_trap_field[0]
+        self.assertIs(client_game.players[0].monster_field[0], spell.equipped_monster)
+        self.assertEqual(2800, client_game.players[0].monster_field[0].attack_points)
+
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "change_turn", "args": []})
+        self.yugioh_game.update_game({"session_id": 1, "player": 1, "move": "normal_summon", "args": [0]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 1, "move": "change_turn", "args": []})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "attack_monster", "args": [0, 0]})
+        client_game = self.assert_patch_applies(client_game)
+        self.assertEqual(6400, client_game.players[1].life_points)
+
+    def test_patch_is_smaller_than_snapshot(self):
+        old = snapshot_game(self.yugioh_game.game)
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [1]})
+        patch = diff_snapshots(old, snapshot_game(self.yugioh_game.game))
+        self.assertLess(len(json.dumps(patch)), len(pickle.dumps(self.yugioh_game.game)) // 4)
+
+    def test_game_from_snapshot(self):
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_set", "args": [0]})
+        snapshot = snapshot_game(self.yugioh_game.game)
+        self.assertEqual(snapshot, snapshot_game(game_from_snapshot(json.loads(json.dumps(snapshot)))))
+
+    def test_state_frame_falls_back_to_snapshot(self):
+        frame = json.loads(self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card",
+                                                         "delta": True, "ack": -1}))
+        self.assertEqual(-1, frame["base"])
+        game = apply_patch(GameController(), frame["ops"])
+        self.assertEqual(self.yugioh_game.version, game.version)
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_summon", "args": [0]})
+        frame = json.loads(self.yugioh_game.read_game({"session_id": 1, "delta": True, "ack": game.version}))
+        self.assertEqual(game.version, frame["base"])
+        self.assertEqual(self.yugioh_game.version, apply_patch(game, frame["ops"]).version)
+
+    def test_view_hides_decks_opponent_hand_and_face_down_monsters(self):
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_set", "args": [0]})
+        snapshot = snapshot_game(self.yugioh_game.game)
+        view = view_game(snapshot, 1)
+        self.assertEqual(len(snapshot["players"][0]["deck"]), view["players"][0]["deck"])
+        self.assertEqual(3, view["players"][0]["hand"])
+        self.assertEqual(HIDDEN_MONSTER, view["players"][0]["monster_field"][0])
+        self.assertEqual(snapshot["players"][1]["hand"], view["players"][1]["hand"])
+        self.assertIsInstance(view["players"][1]["deck"], int)
+        self.assertEqual(snapshot["players"][0]["monster_field"][0],
+                         view_game(snapshot, 0)["players"][0]["monster_field"][0])
+        self.assertIs(snapshot, view_game(snapshot, None))
+
+        game = game_from_snapshot(json.loads(json.dumps(view)))
+        self.assertEqual([None] * 3, game.players[0].hand)
+        self.assertEqual(len(self.yugioh_game.game.players[0].deck), len(game.players[0].deck))
+        hidden = game.players[0].monster_field[0]
+        self.assertEqual(Monster.FACE_DOWN, hidden.face_pos)
+        self.assertNotEqual(self.yugioh_game.game.players[0].monster_field[0].name, hidden.name)
+        self.assertLess(len(json.dumps(view)), len(json.dumps(snapshot)))
+
+    def test_json_clients_get_the_view_of_their_seat(self):
+        connection = ClientConnection(types.SimpleNamespace(subprotocol=None))
+        connection.seat = 1
+        for request in (None, {"get_json": True}):
+            frame = json.loads(connection.state_frame(self.yugioh_game, request))
+            self.assertEqual(4, frame["state"]["players"][0]["hand"])
+        connection.full_state = True
+        self.assertEqual(self.yugioh_game.json_frame(), connection.state_frame(self.yugioh_game))
+
+    def test_spectator_view_hides_both_hands(self):
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_set", "args": [0]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_summon", "args": [0]})
+        snapshot = snapshot_game(self.yugioh_game.game)
+        view = view_game(snapshot, SPECTATOR)
+        self.assertEqual([2, 4], [player["hand"] for player in view["players"]])
+        self.assertEqual(HIDDEN_MONSTER, view["players"][0]["monster_field"][0])
+        self.assertEqual(snapshot["players"][0]["monster_field"][1], view["players"][0]["monster_field"][1])
+        game_from_snapshot(json.loads(json.dumps(view)))
+
+    def test_view_patch_applies(self):
+        history = StateHistory()
+        base = history.view(self.yugioh_game.game, 1)
+        client_game = game_from_snapshot(json.loads(json.dumps(base)))
+        base_version = self.yugioh_game.version
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "normal_set", "args": [0]})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [1]})
+        patch = history.patch_since(self.yugioh_game.game, base_version, 1)
+        self.assertNotIn(self.yugioh_game.game.players[0].monster_field[0].name, json.dumps(patch))
+        client_game = apply_patch(client_game, json.loads(json.dumps(patch)))
+        self.assertEqual(history.view(self.yugioh_game.game, 1), view_game(snapshot_game(client_game), 1))
+
+    def test_views_are_cached_per_version_and_seat(self):
+        history = StateHistory(max_versions=2)
+        view = history.view(self.yugioh_game.game, 0)
+        self.assertIs(view, history.view(self.yugioh_game.game, 0))
+        self.assertIsNot(view, history.view(self.yugioh_game.game, 1))
+        for _ in range(3):
+            self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [1]})
+            history.view(self.yugioh_game.game, 0)
+        self.assertEqual(2, len(history.views))
+
+    def test_spectator_views_are_dropped_with_their_version(self):
+        history = StateHistory(max_versions=4)
+        for _ in range(10):
+            self.yugioh_game.update_game({"session_id": 1, "move": "change_turn"})
+            for seat in (0, 1, SPECTATOR):
+                history.view(self.yugioh_game.game, seat)
+        self.assertEqual(4, len(history.snapshots))
+        self.assertEqual(4, len(history.views))
+        self.assertEqual(12, sum(len(views) for views in history.views.values()))
@@ -341,3 +341,31 @@ class TestYugiohCreatePickle(unittest.TestCase):
             {"player_name": "Yugi", "deck": self.preset_deck_string, "session_id": 1, "get_pickle": True})
         returned_game = pickle.loads(returned_game)
         returned_game.player_name = "Yugi"
+
+
+class TestYugiohFrameCache(unittest.TestCase):
+    def setUp(self):
+        self.yugioh_game = Yugioh()
+        deck = ["Hitotsu-Me Giant", "Dark Magician", "Silver Fang", "Tomozaurus", "Feral Imp"]
+        self.yugioh_game.create_game({"player_name": "Yugi", "deck": deck, "session_id": 1})
+        self.yugioh_game.create_game({"player_name": "Kaiba", "deck": deck, "session_id": 1})
+
+    def test_reads_reuse_frames_of_current_version(self):
+        for request in [{"session_id": 1, "get_json": True}, {"session_id": 1, "get_pickle": True},
+                        {"session_id": 1, "get_binary": True, "seat": 0},
+                        {"session_id": 1, "delta": True, "ack": self.yugioh_game.version, "seat": 1}]:
+            self.assertIs(self.yugioh_game.read_game(request), self.yugioh_game.read_game(request))
+        self.assertIsNot(self.yugioh_game.read_game({"session_id": 1, "get_binary": True, "seat": 0}),
+                         self.yugioh_game.read_game({"session_id": 1, "get_binary": True, "seat": 1}))
+
+    def test_moves_invalidate_frames(self):
+        frame = self.yugioh_game.read_game({"session_id": 1, "get_pickle": True})
+        self.yugioh_game.update_game({"session_id": 1, "player": 0, "move": "draw_card", "args": [1]})
+        new_frame = self.yugioh_game.read_game({"session_id": 1, "get_pickle": True})
+        self.assertNotEqual(frame, new_frame)
+        self.assertEqual(1, len(pickle.loads(new_frame).players[0].hand))
+
+    def test_cache_is_bounded(self):
+        for ack in range(100):
+            self.yugioh_game.read_game({"session_id": 1, "delta": True, "ack": ack})
+        self.assertLessEqual(len(self.yugioh_game.frames), 64)